@@ -0,0 +1,84 @@
+"""initial schema
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 13:26:13.882062
+
+基线表结构（设备列表复合索引之前）。此前由服务启动时自动建表的数据库执行
+`alembic stamp 0001` 标记为基线版本，再执行 `alembic upgrade head` 补齐后续迁移。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('devices',
+    sa.Column('device_id', mysql.VARCHAR(length=36), nullable=False),
+    sa.Column('device_name', mysql.VARCHAR(length=100), nullable=False),
+    sa.Column('device_type', sa.Enum('CAMERA', 'VIEWER', name='devicetype'), nullable=False),
+    sa.Column('is_online', sa.Boolean(), nullable=True),
+    sa.Column('last_seen', sa.DateTime(), nullable=True),
+    sa.Column('server_url', mysql.VARCHAR(length=255), nullable=True),
+    sa.Column('is_paired', sa.Boolean(), nullable=True),
+    sa.Column('paired_device_id', mysql.VARCHAR(length=36), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('device_id')
+    )
+    op.create_index(op.f('ix_devices_device_id'), 'devices', ['device_id'], unique=False)
+
+    op.create_table('user_devices',
+    sa.Column('id', sa.INTEGER(), autoincrement=True, nullable=False),
+    sa.Column('user_id', mysql.VARCHAR(length=36), nullable=False),
+    sa.Column('device_id', mysql.VARCHAR(length=36), nullable=False),
+    sa.Column('device_name', mysql.VARCHAR(length=100), nullable=False),
+    sa.Column('device_type', mysql.VARCHAR(length=20), nullable=False),
+    sa.Column('is_owner', sa.Boolean(), nullable=True),
+    sa.Column('permissions', mysql.VARCHAR(length=20), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('added_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_user_devices_device_id'), 'user_devices', ['device_id'], unique=False)
+    op.create_index(op.f('ix_user_devices_user_id'), 'user_devices', ['user_id'], unique=False)
+
+    op.create_table('users',
+    sa.Column('user_id', mysql.VARCHAR(length=36), nullable=False),
+    sa.Column('username', mysql.VARCHAR(length=50), nullable=False),
+    sa.Column('email', mysql.VARCHAR(length=100), nullable=False),
+    sa.Column('password_hash', mysql.VARCHAR(length=255), nullable=False),
+    sa.Column('display_name', mysql.VARCHAR(length=100), nullable=True),
+    sa.Column('avatar', mysql.TEXT(), nullable=True),
+    sa.Column('is_logged_in', sa.Boolean(), nullable=True),
+    sa.Column('last_login_time', sa.DateTime(), nullable=True),
+    sa.Column('token', mysql.TEXT(), nullable=True),
+    sa.Column('token_expiry', sa.DateTime(), nullable=True),
+    sa.Column('refresh_token', mysql.TEXT(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_user_id'), 'users', ['user_id'], unique=False)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_index(op.f('ix_users_user_id'), table_name='users')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_user_devices_user_id'), table_name='user_devices')
+    op.drop_index(op.f('ix_user_devices_device_id'), table_name='user_devices')
+    op.drop_table('user_devices')
+    op.drop_index(op.f('ix_devices_device_id'), table_name='devices')
+    op.drop_table('devices')
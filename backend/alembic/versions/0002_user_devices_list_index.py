@@ -0,0 +1,37 @@
+"""user devices list index
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 14:05:00.000000
+
+设备列表查询与键集分页使用的复合索引 (user_id, is_active, device_id)。
+此前由服务启动时自动建表的数据库可能已有该索引，已存在时跳过。
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEX_NAME = 'ix_user_devices_user_active_device'
+
+
+def upgrade() -> None:
+    # 生成SQL脚本（--sql）时没有连接，无法检查
+    if not op.get_context().as_sql:
+        existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('user_devices')}
+        if INDEX_NAME in existing:
+            return
+    op.create_index(INDEX_NAME, 'user_devices',
+                    ['user_id', 'is_active', 'device_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(INDEX_NAME, table_name='user_devices')
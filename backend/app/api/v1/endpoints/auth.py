@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.security import (
-    verify_password, 
-    get_password_hash, 
+    verify_password_async,
+    get_password_hash_async,
     create_access_token, 
     create_refresh_token,
     verify_token,
+    revoke_token,
     get_user_id_from_token
 )
 from app.models.user import User
@@ -20,24 +22,24 @@ router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """用户注册"""
     # 检查用户名是否已存在
-    if db.query(User).filter(User.username == user_data.username).first():
+    if (await db.execute(select(User.user_id).where(User.username == user_data.username))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="用户名已存在"
         )
     
     # 检查邮箱是否已存在
-    if db.query(User).filter(User.email == user_data.email).first():
+    if (await db.execute(select(User.user_id).where(User.email == user_data.email))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="邮箱已存在"
         )
     
     # 创建新用户
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     user = User(
         user_id=str(uuid.uuid4()),
         username=user_data.username,
@@ -47,8 +49,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     return UserResponse(
         user_id=user.user_id,
@@ -59,11 +61,11 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
 
 @router.post("/login", response_model=TokenResponse)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
     """用户登录"""
     # 验证用户
-    user = db.query(User).filter(User.username == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+    user = (await db.execute(select(User).where(User.username == form_data.username))).scalar_one_or_none()
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
@@ -81,7 +83,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     user.token_expiry = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     user.refresh_token = refresh_token
     
-    db.commit()
+    await db.commit()
     
     return TokenResponse(
         access_token=access_token,
@@ -91,13 +93,13 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     )
 
 @router.post("/refresh", response_model=TokenResponse)
-async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
+async def refresh_token(refresh_token: str, db: AsyncSession = Depends(get_async_db)):
     """刷新访问令牌"""
     try:
         payload = verify_token(refresh_token, "refresh")
         user_id = payload.get("sub")
         
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = (await db.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
         if not user or user.refresh_token != refresh_token:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -111,7 +113,7 @@ async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
         user.token = access_token
         user.token_expiry = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         
-        db.commit()
+        await db.commit()
         
         return TokenResponse(
             access_token=access_token,
@@ -129,26 +131,29 @@ async def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
         )
 
 @router.post("/logout")
-async def logout(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def logout(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """用户登出"""
     user_id = get_user_id_from_token(token)
     
-    user = db.query(User).filter(User.user_id == user_id).first()
+    # 清除该用户已验证令牌的缓存
+    await revoke_token(token=token, user_id=user_id)
+    
+    user = (await db.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
     if user:
         user.is_logged_in = False
         user.token = None
         user.token_expiry = None
         user.refresh_token = None
-        db.commit()
+        await db.commit()
     
     return {"message": "登出成功"}
 
 @router.get("/profile", response_model=UserResponse)
-async def get_profile(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_profile(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """获取用户信息"""
     user_id = get_user_id_from_token(token)
     
-    user = db.query(User).filter(User.user_id == user_id).first()
+    user = (await db.execute(select(User).where(User.user_id == user_id))).scalar_one_or_none()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
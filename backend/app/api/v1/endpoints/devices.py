@@ -1,58 +1,164 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import base64
 
 from app.api.v1.endpoints.auth import oauth2_scheme
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_async_db
 from app.core.security import get_user_id_from_token
 from app.models.device import Device, DeviceType
 from app.models.user_device import UserDevice
 from app.schemas.device import DeviceCreate, DeviceResponse, DeviceUpdate
+from app.services.presence import presence_tracker
+from app.services.acl import device_acl
+from app.services.etag import DeviceState, compute_etag, device_versions, etag_matches
+from app.services.snapshot import snapshot_cache
 
 router = APIRouter()
 
+def _device_response(device: Device) -> DeviceResponse:
+    """构造设备响应，在线状态使用内存中的实时状态"""
+    is_online, last_seen = presence_tracker.resolve(device.device_id, device.is_online, device.last_seen)
+    return DeviceResponse(
+        device_id=device.device_id,
+        device_name=device.device_name,
+        device_type=device.device_type,
+        is_online=is_online,
+        last_seen=last_seen,
+        is_paired=device.is_paired,
+        paired_device_id=device.paired_device_id,
+        created_at=device.created_at
+    )
+
+def _not_modified(etag: str, next_cursor: Optional[str] = None) -> Response:
+    """内容未变化，返回304（不序列化响应体）"""
+    response = Response(status_code=status.HTTP_304_NOT_MODIFIED)
+    _set_cache_headers(response, etag, next_cursor)
+    return response
+
+def _set_cache_headers(response: Response, etag: str, next_cursor: Optional[str] = None):
+    """设置ETag和分页游标响应头"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+async def _bump_device_users(db: AsyncSession, *device_ids: str):
+    """设备发生变化，递增所有关联用户的设备集合版本号（在提交之后调用）"""
+    user_ids = (await db.execute(
+        select(UserDevice.user_id).where(UserDevice.device_id.in_(device_ids))
+    )).scalars().all()
+    device_versions.bump(*set(user_ids))
+
+def _encode_cursor(device_id: str) -> str:
+    """生成分页游标（对客户端不透明）"""
+    return base64.urlsafe_b64encode(device_id.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> str:
+    """解析分页游标"""
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的分页游标"
+        )
+
+async def _scan_by_presence(db: AsyncSession, query, count: int, is_online: bool) -> List[Device]:
+    """按实时在线状态过滤（与响应体一致）
+
+    数据库中的 is_online 延迟写入，不能作为过滤条件；按设备ID顺序分批读取，
+    用 presence_tracker 解析后过滤，直到凑满 count 条或没有更多设备。
+    """
+    rows: List[Device] = []
+    last_id = None
+    while len(rows) < count:
+        batch_query = query if last_id is None else query.where(UserDevice.device_id > last_id)
+        batch = (await db.execute(batch_query.order_by(UserDevice.device_id).limit(count))).scalars().all()
+        for device in batch:
+            if presence_tracker.resolve(device.device_id, device.is_online, device.last_seen)[0] == is_online:
+                rows.append(device)
+        if len(batch) < count:
+            break
+        last_id = batch[-1].device_id
+    return rows[:count]
+
 @router.get("/", response_model=List[DeviceResponse])
 async def get_user_devices(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 返回的游标"),
+    device_type: Optional[DeviceType] = None,
+    is_online: Optional[bool] = None,
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取用户的设备列表"""
+    """获取用户的设备列表
+
+    按设备ID做键集分页，存在下一页时通过响应头 X-Next-Cursor 返回游标。
+    支持 If-None-Match 条件请求，内容未变化时返回304。
+    """
     user_id = get_user_id_from_token(token)
     
-    # 获取用户关联的设备
-    user_devices = db.query(UserDevice).filter(
+    # 按在线状态过滤时结果随心跳变化，不使用缓存的结果摘要
+    cache_key = ("list", limit, after, device_type) if is_online is None else None
+    if if_none_match and cache_key is not None:
+        cached = device_versions.get(user_id, cache_key)
+        if cached is not None:
+            etag = compute_etag(cached.devices, cached.extra)
+            if etag_matches(if_none_match, etag):
+                return _not_modified(etag, cached.extra)
+    version = device_versions.version(user_id)
+    
+    # 一次联表查询获取用户关联的设备（命中 user_devices 的 (user_id, is_active, device_id) 索引）
+    query = select(Device).join(
+        UserDevice, UserDevice.device_id == Device.device_id
+    ).where(
         UserDevice.user_id == user_id,
         UserDevice.is_active == True
-    ).all()
-    
-    devices = []
-    for user_device in user_devices:
-        device = db.query(Device).filter(Device.device_id == user_device.device_id).first()
-        if device:
-            devices.append(DeviceResponse(
-                device_id=device.device_id,
-                device_name=device.device_name,
-                device_type=device.device_type,
-                is_online=device.is_online,
-                last_seen=device.last_seen,
-                is_paired=device.is_paired,
-                paired_device_id=device.paired_device_id,
-                created_at=device.created_at
-            ))
-    
-    return devices
+    )
+    if after:
+        query = query.where(UserDevice.device_id > _decode_cursor(after))
+    if device_type is not None:
+        query = query.where(Device.device_type == device_type)
+    
+    # 多取一条用于判断是否还有下一页
+    if is_online is None:
+        rows = (await db.execute(query.order_by(UserDevice.device_id).limit(limit + 1))).scalars().all()
+    else:
+        rows = await _scan_by_presence(db, query, limit + 1, is_online)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].device_id)
+    
+    states = [DeviceState.from_device(device) for device in rows]
+    if cache_key is not None:
+        device_versions.put(user_id, cache_key, version, states, next_cursor)
+    etag = compute_etag(states, next_cursor)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag, next_cursor)
+    _set_cache_headers(response, etag, next_cursor)
+    
+    return [
+        _device_response(device)
+        for device in rows
+    ]
 
 @router.post("/", response_model=DeviceResponse)
 async def create_device(
     device_data: DeviceCreate,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """注册新设备"""
     user_id = get_user_id_from_token(token)
     
     # 检查设备ID是否已存在
-    if db.query(Device).filter(Device.device_id == device_data.device_id).first():
+    if (await db.execute(select(Device.device_id).where(Device.device_id == device_data.device_id))).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="设备ID已存在"
@@ -66,8 +172,8 @@ async def create_device(
     )
     
     db.add(device)
-    db.commit()
-    db.refresh(device)
+    await db.commit()
+    await db.refresh(device)
     
     # 创建用户设备关联
     user_device = UserDevice(
@@ -80,83 +186,120 @@ async def create_device(
     )
     
     db.add(user_device)
-    db.commit()
+    await db.commit()
+    await device_acl.invalidate(user_id, device.device_id)
+    device_versions.bump(user_id)
     
-    return DeviceResponse(
-        device_id=device.device_id,
-        device_name=device.device_name,
-        device_type=device.device_type,
-        is_online=device.is_online,
-        last_seen=device.last_seen,
-        is_paired=device.is_paired,
-        paired_device_id=device.paired_device_id,
-        created_at=device.created_at
-    )
+    return _device_response(device)
 
 @router.get("/{device_id}", response_model=DeviceResponse)
 async def get_device(
     device_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取设备详情"""
+    """获取设备详情（支持 If-None-Match 条件请求）"""
     user_id = get_user_id_from_token(token)
     
     # 检查用户是否有权限访问该设备
-    user_device = db.query(UserDevice).filter(
-        UserDevice.user_id == user_id,
-        UserDevice.device_id == device_id,
-        UserDevice.is_active == True
-    ).first()
+    permission = await device_acl.get(db, user_id, device_id)
     
-    if not user_device:
+    if not permission:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="设备不存在或无权限访问"
         )
     
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    cache_key = ("device", device_id)
+    if if_none_match:
+        cached = device_versions.get(user_id, cache_key)
+        if cached is not None:
+            etag = compute_etag(cached.devices)
+            if etag_matches(if_none_match, etag):
+                return _not_modified(etag)
+    version = device_versions.version(user_id)
+    
+    device = (await db.execute(select(Device).where(Device.device_id == device_id))).scalar_one_or_none()
     if not device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="设备不存在"
         )
     
-    return DeviceResponse(
-        device_id=device.device_id,
-        device_name=device.device_name,
-        device_type=device.device_type,
-        is_online=device.is_online,
-        last_seen=device.last_seen,
-        is_paired=device.is_paired,
-        paired_device_id=device.paired_device_id,
-        created_at=device.created_at
-    )
+    states = [DeviceState.from_device(device)]
+    device_versions.put(user_id, cache_key, version, states)
+    etag = compute_etag(states)
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag)
+    _set_cache_headers(response, etag)
+    
+    return _device_response(device)
+
+@router.get("/{device_id}/snapshot")
+async def get_device_snapshot(
+    device_id: str,
+    if_none_match: Optional[str] = Header(None),
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取摄像头最近关键帧的JPEG缩略图（不需要开启实时视频流）"""
+    user_id = get_user_id_from_token(token)
+    
+    # 检查用户是否有权限访问该设备
+    permission = await device_acl.get(db, user_id, device_id)
+    
+    if not permission:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="设备不存在或无权限访问"
+        )
+    
+    snapshot = snapshot_cache.peek(device_id)
+    if snapshot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="暂无快照"
+        )
+    
+    # 同一关键帧的ETag不变，客户端缓存有效时不需要编码缩略图
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": f"private, max-age={settings.SNAPSHOT_MAX_AGE}",
+        "X-Frame-Timestamp": str(snapshot.timestamp)
+    }
+    if etag_matches(if_none_match, snapshot.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    thumbnail = await snapshot_cache.thumbnail(device_id, snapshot)
+    if thumbnail is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="暂无快照"
+        )
+    return Response(content=thumbnail, media_type="image/jpeg", headers=headers)
 
 @router.put("/{device_id}", response_model=DeviceResponse)
 async def update_device(
     device_id: str,
     device_data: DeviceUpdate,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新设备信息"""
     user_id = get_user_id_from_token(token)
     
     # 检查用户是否有权限修改该设备
-    user_device = db.query(UserDevice).filter(
-        UserDevice.user_id == user_id,
-        UserDevice.device_id == device_id,
-        UserDevice.is_active == True
-    ).first()
+    permission = await device_acl.get(db, user_id, device_id)
     
-    if not user_device or user_device.permissions not in ["ADMIN", "WRITE"]:
+    if not permission or permission.permissions not in ["ADMIN", "WRITE"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无权限修改该设备"
         )
     
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = (await db.execute(select(Device).where(Device.device_id == device_id))).scalar_one_or_none()
     if not device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -169,49 +312,45 @@ async def update_device(
     if device_data.server_url:
         device.server_url = device_data.server_url
     
-    db.commit()
-    db.refresh(device)
+    await db.commit()
+    await db.refresh(device)
+    await _bump_device_users(db, device_id)
     
-    return DeviceResponse(
-        device_id=device.device_id,
-        device_name=device.device_name,
-        device_type=device.device_type,
-        is_online=device.is_online,
-        last_seen=device.last_seen,
-        is_paired=device.is_paired,
-        paired_device_id=device.paired_device_id,
-        created_at=device.created_at
-    )
+    return _device_response(device)
 
 @router.delete("/{device_id}")
 async def delete_device(
     device_id: str,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除设备"""
     user_id = get_user_id_from_token(token)
     
     # 检查用户是否有权限删除该设备
-    user_device = db.query(UserDevice).filter(
-        UserDevice.user_id == user_id,
-        UserDevice.device_id == device_id,
-        UserDevice.is_active == True
-    ).first()
+    permission = await device_acl.get(db, user_id, device_id)
     
-    if not user_device or not user_device.is_owner:
+    if not permission or not permission.is_owner:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无权限删除该设备"
         )
     
+    # 删除前记录关联用户，提交后递增其版本号
+    user_ids = (await db.execute(
+        select(UserDevice.user_id).where(UserDevice.device_id == device_id)
+    )).scalars().all()
+    
     # 删除用户设备关联
-    db.query(UserDevice).filter(UserDevice.device_id == device_id).delete()
+    await db.execute(delete(UserDevice).where(UserDevice.device_id == device_id))
     
     # 删除设备
-    db.query(Device).filter(Device.device_id == device_id).delete()
+    await db.execute(delete(Device).where(Device.device_id == device_id))
     
-    db.commit()
+    await db.commit()
+    await device_acl.invalidate_device(device_id)
+    device_versions.bump(*set(user_ids))
+    snapshot_cache.forget(device_id)
     
     return {"message": "设备删除成功"}
 
@@ -220,26 +359,24 @@ async def bind_device(
     device_id: str,
     paired_device_id: str,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """绑定设备"""
     user_id = get_user_id_from_token(token)
     
     # 检查用户是否有权限操作该设备
-    user_device = db.query(UserDevice).filter(
-        UserDevice.user_id == user_id,
-        UserDevice.device_id == device_id,
-        UserDevice.is_active == True
-    ).first()
+    permission = await device_acl.get(db, user_id, device_id)
     
-    if not user_device or user_device.permissions not in ["ADMIN", "WRITE"]:
+    if not permission or permission.permissions not in ["ADMIN", "WRITE"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无权限操作该设备"
         )
     
     # 检查配对设备是否存在
-    paired_device = db.query(Device).filter(Device.device_id == paired_device_id).first()
+    paired_device = (await db.execute(
+        select(Device).where(Device.device_id == paired_device_id)
+    )).scalar_one_or_none()
     if not paired_device:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -247,14 +384,15 @@ async def bind_device(
         )
     
     # 更新设备绑定状态
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = (await db.execute(select(Device).where(Device.device_id == device_id))).scalar_one_or_none()
     device.is_paired = True
     device.paired_device_id = paired_device_id
     
     paired_device.is_paired = True
     paired_device.paired_device_id = device_id
     
-    db.commit()
+    await db.commit()
+    await _bump_device_users(db, device_id, paired_device_id)
     
     return {"message": "设备绑定成功"}
 
@@ -262,35 +400,35 @@ async def bind_device(
 async def unbind_device(
     device_id: str,
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """解绑设备"""
     user_id = get_user_id_from_token(token)
     
     # 检查用户是否有权限操作该设备
-    user_device = db.query(UserDevice).filter(
-        UserDevice.user_id == user_id,
-        UserDevice.device_id == device_id,
-        UserDevice.is_active == True
-    ).first()
+    permission = await device_acl.get(db, user_id, device_id)
     
-    if not user_device or user_device.permissions not in ["ADMIN", "WRITE"]:
+    if not permission or permission.permissions not in ["ADMIN", "WRITE"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="无权限操作该设备"
         )
     
     # 更新设备绑定状态
-    device = db.query(Device).filter(Device.device_id == device_id).first()
+    device = (await db.execute(select(Device).where(Device.device_id == device_id))).scalar_one_or_none()
     if device.is_paired and device.paired_device_id:
-        paired_device = db.query(Device).filter(Device.device_id == device.paired_device_id).first()
+        paired_device = (await db.execute(
+            select(Device).where(Device.device_id == device.paired_device_id)
+        )).scalar_one_or_none()
         if paired_device:
             paired_device.is_paired = False
             paired_device.paired_device_id = None
     
+    paired_ids = [device.paired_device_id] if device.paired_device_id else []
     device.is_paired = False
     device.paired_device_id = None
     
-    db.commit()
+    await db.commit()
+    await _bump_device_users(db, device_id, *paired_ids)
     
     return {"message": "设备解绑成功"}
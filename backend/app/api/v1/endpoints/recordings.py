@@ -0,0 +1,127 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import os
+
+from app.api.v1.endpoints.auth import oauth2_scheme
+from app.core.config import settings
+from app.core.database import get_async_db
+from app.core.file_response import RangeFileResponse, RangeNotSatisfiable, parse_range
+from app.core.security import get_user_id_from_token
+from app.services.acl import device_acl
+from app.services.recording import index_bounds, recording_manager, seek_keyframe, segment_path, INDEX_SUFFIX, SEGMENT_SUFFIX
+
+router = APIRouter()
+
+# nginx 在 /api/ 代理中设置该请求头，表示可以用 X-Accel-Redirect 交给nginx发送文件
+SENDFILE_TYPE_HEADER = "x-sendfile-type"
+
+async def _check_permission(token: str, db: AsyncSession, device_id: str):
+    """检查用户是否有权限查看该设备的录像"""
+    user_id = get_user_id_from_token(token)
+    if not await device_acl.get(db, user_id, device_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="设备不存在或无权限访问"
+        )
+
+def _segment_summaries(device_id: str) -> List[dict]:
+    """列出分段及其时间范围（在线程池中执行）"""
+    summaries = []
+    for segment in recording_manager.list_segments(device_id):
+        bounds = index_bounds(segment.index_path)
+        if bounds is None:
+            continue
+        first, last = bounds
+        summaries.append({
+            "segment_id": str(segment.start_ms),
+            "start_ms": first.timestamp,
+            "end_ms": last.timestamp,
+            "size": segment.size,
+            "frame_count": segment.frame_count,
+            "complete": segment.complete,
+            "url": f"/api/v1/devices/{device_id}/recordings/{segment.start_ms}"
+        })
+    return summaries
+
+@router.get("/{device_id}/recordings")
+async def list_recordings(
+    device_id: str,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """获取设备的录像分段列表"""
+    await _check_permission(token, db, device_id)
+    return await run_in_threadpool(_segment_summaries, device_id)
+
+@router.get("/{device_id}/recordings/{segment_id}/seek")
+async def seek_recording(
+    device_id: str,
+    segment_id: str,
+    timestamp: int = Query(..., description="毫秒时间戳"),
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """查找时间点之前最近的关键帧在分段文件中的字节偏移（客户端据此发起Range请求）"""
+    await _check_permission(token, db, device_id)
+    path = segment_path(device_id, segment_id)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="录像分段不存在")
+
+    index_path = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+    try:
+        entry = await run_in_threadpool(seek_keyframe, index_path, timestamp)
+    except FileNotFoundError:
+        entry = None
+    if entry is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="录像分段不存在")
+
+    return {
+        "segment_id": segment_id,
+        "timestamp": entry.timestamp,
+        "offset": entry.offset
+    }
+
+@router.api_route("/{device_id}/recordings/{segment_id}", methods=["GET", "HEAD"])
+async def get_recording(
+    device_id: str,
+    segment_id: str,
+    request: Request,
+    range_header: Optional[str] = Header(None, alias="range"),
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """下载录像分段，支持Range请求
+
+    经nginx代理时返回 X-Accel-Redirect，由nginx以sendfile发送文件并处理Range；
+    直接访问时按请求的字节范围分块发送，不把文件读入内存。
+    """
+    await _check_permission(token, db, device_id)
+    path = segment_path(device_id, segment_id)
+    try:
+        size = os.stat(path).st_size if path is not None else None
+    except FileNotFoundError:
+        size = None
+    if size is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="录像分段不存在")
+
+    # 已完成的分段内容不再变化，可以缓存
+    complete = path not in recording_manager.active_paths()
+    headers = {
+        "Cache-Control": "private, max-age=86400" if complete else "no-cache",
+        "ETag": f'"{segment_id}-{size}"' if complete else f'W/"{segment_id}-{size}"'
+    }
+
+    if request.headers.get(SENDFILE_TYPE_HEADER, "").lower() == "x-accel-redirect":
+        headers["X-Accel-Redirect"] = f"{settings.RECORDING_ACCEL_PREFIX.rstrip('/')}/{device_id}/{segment_id}{SEGMENT_SUFFIX}"
+        return Response(headers=headers, media_type="application/octet-stream")
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return RangeFileResponse(path, size, byte_range, headers=headers)
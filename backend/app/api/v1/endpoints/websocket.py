@@ -1,30 +1,59 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+import logging
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
 from app.core.security import get_user_id_from_token
-from app.websocket.manager import WebSocketManager
-from app.models.device import Device
-from app.models.user_device import UserDevice
-import json
+from app.websocket.manager import websocket_manager
+from app.websocket.registry import ROLE_CAMERA, ROLE_VIEWER
+from app.services.presence import presence_tracker
+from app.services.recording import recording_manager
+from app.services.motion import motion_detector
+from app.services.inference import inference_service
+from app.services.rendition import rendition_service, QUALITY_HIGH
+from app.services.snapshot import snapshot_cache
+from app.core.config import settings
+from app.websocket.limits import MEDIA_MESSAGE
+from app.websocket.protocol import is_media_frame, parse_frame, FrameProtocolError, FRAME_TYPE_VIDEO
 
 router = APIRouter()
-
-# 创建WebSocket管理器实例
-websocket_manager = WebSocketManager()
+logger = logging.getLogger(__name__)
 
 @router.websocket("/camera/{device_id}")
 async def camera_websocket(websocket: WebSocket, device_id: str, token: str = None):
-    """摄像头WebSocket连接"""
+    """摄像头WebSocket连接
+
+    二进制消息为音视频帧（格式见 app.websocket.protocol），其余为控制消息，
+    按握手时协商的编解码器（默认JSON，见 app.websocket.codec）解码。
+    """
     # 验证设备是否存在
     # 这里可以添加设备验证逻辑
     
-    await websocket_manager.connect(websocket, device_id)
+    connection = await websocket_manager.connect(websocket, device_id, role=ROLE_CAMERA)
+    if connection is None:
+        return
+    presence_tracker.mark_online(device_id)
     
     try:
         while True:
             # 接收消息
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            raw = await websocket.receive()
+            if raw["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(raw.get("code", 1000))
+            
+            # 二进制帧直接转发，不经过解码
+            data = raw.get("bytes")
+            if data is not None and (not connection.codec.binary or is_media_frame(data)):
+                connection.on_receive(len(data))
+                if websocket_manager.allow_message(connection, MEDIA_MESSAGE, len(data)):
+                    await handle_binary_frame(device_id, data)
+                continue
+            
+            if data is None:
+                data = raw.get("text") or "{}"
+            connection.on_receive(len(data))
+            message = connection.codec.decode(data)
+            
+            # 超出该类型消息速率的直接丢弃
+            if not websocket_manager.allow_message(connection, message.get("type"), len(data)):
+                continue
             
             # 处理不同类型的消息
             if message.get("type") == "video_frame":
@@ -32,16 +61,27 @@ async def camera_websocket(websocket: WebSocket, device_id: str, token: str = No
                 await handle_video_frame(device_id, message)
             elif message.get("type") == "heartbeat":
                 # 处理心跳消息
-                await handle_heartbeat(device_id, message)
+                presence_tracker.touch(device_id)
+                await handle_heartbeat(websocket, device_id, message)
             elif message.get("type") == "status_update":
                 # 处理状态更新
                 await handle_status_update(device_id, message)
             
     except WebSocketDisconnect:
-        websocket_manager.disconnect(websocket, device_id)
+        disconnect_camera(websocket, device_id)
     except Exception as e:
-        print(f"WebSocket错误: {e}")
-        websocket_manager.disconnect(websocket, device_id)
+        logger.exception("设备 %s 的WebSocket错误: %s", device_id, e)
+        disconnect_camera(websocket, device_id)
+
+def disconnect_camera(websocket: WebSocket, device_id: str):
+    """断开摄像头连接，该设备没有其他摄像头连接时标记离线"""
+    websocket_manager.disconnect(websocket, device_id)
+    if device_id not in websocket_manager.registry.cameras:
+        presence_tracker.mark_offline(device_id)
+        recording_manager.close_device(device_id)
+        motion_detector.forget(device_id)
+        inference_service.forget(device_id)
+        rendition_service.forget(device_id)
 
 @router.websocket("/viewer/{device_id}")
 async def viewer_websocket(websocket: WebSocket, device_id: str, token: str = None):
@@ -49,69 +89,123 @@ async def viewer_websocket(websocket: WebSocket, device_id: str, token: str = No
     # 验证设备是否存在
     # 这里可以添加设备验证逻辑
     
-    await websocket_manager.connect(websocket, device_id)
+    # 携带令牌的查看端关联到用户，以接收该用户设备的事件（如 motion_detected）
+    user_id = None
+    if token:
+        try:
+            user_id = get_user_id_from_token(token)
+        except HTTPException:
+            user_id = None
+    
+    connection = await websocket_manager.connect(websocket, device_id, user_id=user_id, role=ROLE_VIEWER)
+    if connection is None:
+        return
     
     try:
         while True:
             # 接收消息
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            raw = await websocket.receive()
+            if raw["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(raw.get("code", 1000))
+            
+            data = raw.get("bytes")
+            if data is None:
+                data = raw.get("text") or "{}"
+            connection.on_receive(len(data))
+            message = connection.codec.decode(data)
+            
+            # 超出该类型消息速率的直接丢弃
+            if not websocket_manager.allow_message(connection, message.get("type"), len(data)):
+                continue
             
             # 处理查看端消息
             if message.get("type") == "request_video":
                 # 请求视频流
-                await handle_video_request(device_id, message)
+                await handle_video_request(websocket, device_id, message)
             elif message.get("type") == "control_command":
                 # 控制命令
                 await handle_control_command(device_id, message)
             elif message.get("type") == "heartbeat":
                 # 心跳消息
-                await handle_heartbeat(device_id, message)
+                await handle_heartbeat(websocket, device_id, message)
             
     except WebSocketDisconnect:
         websocket_manager.disconnect(websocket, device_id)
     except Exception as e:
-        print(f"WebSocket错误: {e}")
+        logger.exception("设备 %s 的WebSocket错误: %s", device_id, e)
         websocket_manager.disconnect(websocket, device_id)
 
+async def handle_binary_frame(device_id: str, data: bytes):
+    """处理二进制音视频帧"""
+    try:
+        frame = parse_frame(data)
+    except FrameProtocolError as e:
+        logger.warning("设备 %s 的二进制帧无效: %s", device_id, e)
+        return
+    
+    # 将原始缓冲区放入查看端发送队列，不做解码和重新编码
+    websocket_manager.relay_frame(device_id, frame.raw, frame.is_keyframe)
+    
+    # 保存最近的关键帧供快照接口使用（缩略图在请求时才编码）
+    if frame.is_keyframe and frame.frame_type == FRAME_TYPE_VIDEO:
+        snapshot_cache.update(device_id, frame)
+    
+    # 录像由后台线程写入磁盘
+    if settings.RECORDING_ENABLED:
+        recording_manager.write(device_id, frame)
+    
+    # 运动检测按自适应间隔采样，在进程池中分析
+    if settings.MOTION_ENABLED and frame.frame_type == FRAME_TYPE_VIDEO:
+        motion_detector.submit(device_id, frame)
+    
+    # AI推理请求跨摄像头凑批后在推理进程池中执行
+    if settings.AI_INFERENCE_ENABLED:
+        inference_service.submit_frame(device_id, frame)
+
 async def handle_video_frame(device_id: str, message: dict):
     """处理视频帧数据"""
     # 这里可以添加视频帧处理逻辑
     # 例如：保存到文件、AI分析等
-    print(f"收到设备 {device_id} 的视频帧数据")
+    logger.debug("收到设备 %s 的视频帧数据", device_id)
 
-async def handle_heartbeat(device_id: str, message: dict):
+async def handle_heartbeat(websocket: WebSocket, device_id: str, message: dict):
     """处理心跳消息"""
-    # 更新设备在线状态
-    await websocket_manager.send_to_device(device_id, {
+    # 只回复发送心跳的连接
+    await websocket_manager.send_personal_message({
         "type": "heartbeat_response",
         "device_id": device_id,
         "timestamp": message.get("timestamp")
-    })
+    }, websocket)
 
 async def handle_status_update(device_id: str, message: dict):
     """处理状态更新"""
     # 广播状态更新到所有查看端
-    await websocket_manager.send_to_device(device_id, {
+    await websocket_manager.send_to_viewers(device_id, {
         "type": "status_update",
         "device_id": device_id,
         "status": message.get("status"),
         "timestamp": message.get("timestamp")
     })
 
-async def handle_video_request(device_id: str, message: dict):
+async def handle_video_request(websocket: WebSocket, device_id: str, message: dict):
     """处理视频请求"""
+    quality = message.get("quality", "medium")
+    if rendition_service.enabled:
+        # 摄像头只按最高清晰度推流，较低清晰度由服务器转码
+        websocket_manager.set_viewer_quality(websocket, quality)
+        quality = QUALITY_HIGH
+    
     # 转发视频请求到摄像头设备
-    await websocket_manager.send_to_device(device_id, {
+    await websocket_manager.send_to_camera(device_id, {
         "type": "start_video_stream",
         "request_id": message.get("request_id"),
-        "quality": message.get("quality", "medium")
+        "quality": quality
     })
 
 async def handle_control_command(device_id: str, message: dict):
     """处理控制命令"""
     # 转发控制命令到摄像头设备
-    await websocket_manager.send_to_device(device_id, {
+    await websocket_manager.send_to_camera(device_id, {
         "type": "control_command",
         "command": message.get("command"),
         "parameters": message.get("parameters", {})
@@ -126,7 +220,9 @@ async def get_device_status(device_id: str):
     return {
         "device_id": device_id,
         "is_online": is_online,
-        "connection_count": connection_count
+        "connection_count": connection_count,
+        "connections": websocket_manager.get_connection_stats(device_id),
+        "viewers": websocket_manager.get_viewer_stats(device_id)
     }
 
 @router.get("/stats")
@@ -134,6 +230,16 @@ async def get_websocket_stats():
     """获取WebSocket统计信息"""
     return {
         "total_connections": websocket_manager.get_connection_count(),
-        "active_devices": len(websocket_manager.device_connections),
-        "active_users": len(websocket_manager.user_connections)
+        "connections_by_role": websocket_manager.get_role_counts(),
+        "active_devices": len(websocket_manager.registry.cameras),
+        "active_users": len(websocket_manager.registry.users),
+        "admission": websocket_manager.admission.stats(),
+        "heartbeat": websocket_manager.heartbeat.stats(),
+        "cluster": websocket_manager.cluster.stats() if websocket_manager.cluster else None,
+        "presence": presence_tracker.stats(),
+        "recording": recording_manager.stats(),
+        "motion": motion_detector.stats(),
+        "inference": inference_service.stats(),
+        "rendition": rendition_service.stats(),
+        "snapshot": snapshot_cache.stats()
     }
@@ -0,0 +1,104 @@
+"""
+消息编解码
+
+提供可替换的编解码器：标准库JSON、orjson（快速JSON）和MessagePack（二进制）。
+orjson 和 msgpack 为可选依赖，未安装时对应编解码器不可用，JSON回退到标准库实现。
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Union
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+Payload = Union[str, bytes]
+
+
+class Codec(ABC):
+    """编解码器接口
+
+    binary 为 True 时编码结果为bytes（以WebSocket二进制消息发送），否则为str。
+    """
+
+    name = ""
+    binary = False
+
+    @abstractmethod
+    def encode(self, message: Any) -> Payload:
+        """编码消息"""
+
+    @abstractmethod
+    def decode(self, data: Payload) -> Any:
+        """解码消息"""
+
+
+class StdJsonCodec(Codec):
+    """标准库JSON"""
+
+    name = "json"
+
+    def encode(self, message: Any) -> str:
+        return json.dumps(message)
+
+    def decode(self, data: Payload) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    """orjson实现的JSON（输出与标准JSON兼容）"""
+
+    name = "json"
+
+    def encode(self, message: Any) -> str:
+        return orjson.dumps(message).decode()
+
+    def decode(self, data: Payload) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    """MessagePack二进制编码
+
+    消息总是编码为map，首字节为 0x80-0x8f/0xde/0xdf，
+    与二进制音视频帧的类型字节（见 app.websocket.protocol）不会冲突。
+    """
+
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: Any) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def decode(self, data: Payload) -> Any:
+        if isinstance(data, str):
+            data = data.encode()
+        return msgpack.unpackb(data, raw=False)
+
+
+# 默认JSON编解码器（优先使用orjson）
+json_codec: Codec = OrjsonCodec() if orjson is not None else StdJsonCodec()
+
+# 可用的编解码器: 名称 -> 实例
+CODECS: Dict[str, Codec] = {json_codec.name: json_codec}
+if msgpack is not None:
+    CODECS[MsgpackCodec.name] = MsgpackCodec()
+
+
+def get_codec(name: str) -> Codec:
+    """按名称获取编解码器，不可用时返回默认JSON编解码器"""
+    return CODECS.get(name, json_codec)
+
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+else:  # pragma: no cover - 可选依赖
+    FastJSONResponse = JSONResponse
@@ -1,20 +1,67 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.metrics import metrics
 
-# 创建数据库引擎
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_size=settings.DATABASE_POOL_SIZE,
-    max_overflow=settings.DATABASE_MAX_OVERFLOW,
-    pool_pre_ping=True,
-    echo=settings.DEBUG
-)
+# 同步驱动 -> 异步驱动
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(url: str) -> str:
+    """将同步数据库URL转换为对应的异步驱动URL"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+def _engine_options(url: str, pool_size: int, max_overflow: int) -> dict:
+    """连接池参数（SQLite使用SQLAlchemy默认连接池）"""
+    options = {"pool_pre_ping": True, "echo": settings.DEBUG}
+    if not make_url(url).drivername.startswith("sqlite"):
+        options["pool_size"] = pool_size
+        options["max_overflow"] = max_overflow
+    return options
+
+# 创建数据库引擎（同步）
+# API请求全部使用异步引擎，同步引擎只剩基准测试预置数据和 get_db 依赖使用（Alembic迁移自建连接），
+# 连接池只保留一个连接，避免每个worker额外占用 DATABASE_POOL_SIZE 个数据库连接
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL, 1, 1))
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 创建异步数据库引擎（API请求使用，不阻塞事件循环）
+ASYNC_DATABASE_URL = settings.ASYNC_DATABASE_URL or get_async_database_url(settings.DATABASE_URL)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **_engine_options(ASYNC_DATABASE_URL, settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW)
+)
+
+# 创建异步会话工厂
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def _pool_stats() -> dict:
+    """连接池状态（SQLite等不支持计数的连接池不输出）"""
+    values = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        if not hasattr(pool, "checkedout"):
+            continue
+        values[(name, "size")] = pool.size()
+        values[(name, "checked_out")] = pool.checkedout()
+        # 连接数未达到 pool_size 时SQLAlchemy返回负数
+        values[(name, "overflow")] = max(pool.overflow(), 0)
+    return values
+
+metrics.gauge("db_pool_connections", "数据库连接池状态", _pool_stats, ("engine", "state"))
+
 # 创建基础模型类
 Base = declarative_base()
 
@@ -25,3 +72,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# 异步数据库依赖
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,89 @@
+"""
+支持HTTP Range请求的文件响应
+
+文件不会整体读入内存，按固定大小分块读取并发送。这只是直接访问后端时的后备方案，
+经由nginx代理时应使用 X-Accel-Redirect 由nginx用sendfile发送文件。
+"""
+from typing import Mapping, Optional, Tuple
+
+import anyio
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    """请求的范围超出文件大小"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单个字节范围，返回 (起始, 结束) 闭区间；无Range或不支持的格式返回None（按完整文件响应）"""
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    # 不支持多个范围，按完整文件响应
+    if "," in spec:
+        return None
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if not start_text:
+            # 最后N个字节
+            suffix = int(end_text)
+            start, end = max(size - suffix, 0), size - 1
+        else:
+            suffix = None
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if suffix is not None and suffix <= 0 or start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """发送文件的指定字节范围（byte_range 为None时发送完整文件）"""
+
+    def __init__(self, path: str, size: int, byte_range: Optional[Tuple[int, int]] = None,
+                 headers: Mapping[str, str] = None, media_type: str = "application/octet-stream",
+                 background: BackgroundTask = None):
+        self.path = path
+        self.background = background
+        self.media_type = media_type
+        if byte_range is None:
+            self.status_code = 200
+            self.start, self.length = 0, size
+        else:
+            self.status_code = 206
+            self.start, self.length = byte_range[0], byte_range[1] - byte_range[0] + 1
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["content-length"] = str(self.length)
+        if byte_range is not None:
+            self.headers["content-range"] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            async with await anyio.open_file(self.path, "rb") as handle:
+                await handle.seek(self.start)
+                remaining = self.length
+                while remaining > 0:
+                    chunk = await handle.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0 or self.length == 0:
+                    # 空文件，或文件被截断（如分段被保留策略删除），结束响应
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
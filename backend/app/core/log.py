@@ -0,0 +1,217 @@
+"""
+异步结构化日志
+
+业务代码使用标准库 logging（logging.getLogger(__name__)），根logger上只挂一个 QueueHandler：
+调用线程只做消息格式化并放入有界队列，队列满时丢弃并计数，不会阻塞事件循环；
+后台线程批量取出记录，格式化为JSON行后一次写入 LOG_FILE（按大小轮转）。
+
+同一调用点的 WARNING 及以上记录在 LOG_RATE_WINDOW 秒内最多输出 LOG_RATE_LIMIT 条，
+其余只计数，窗口结束后的第一条记录带上被抑制的条数（suppressed 字段），
+避免一个失效的连接在每一帧上报错时日志本身成为瓶颈。
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# LogRecord 的标准属性，其余属性（extra）作为JSON字段输出
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_STOP = object()
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """按调用点限制 WARNING 及以上记录的输出频率（计数不加锁，多线程下可能略有偏差）"""
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # (文件, 行号) -> [窗口开始时间, 窗口内已输出数, 被抑制数]
+        self._sites: Dict[Tuple[str, int], List] = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno < logging.WARNING:
+            return True
+        now = time.monotonic()
+        site = self._sites.get((record.pathname, record.lineno))
+        if site is None:
+            self._sites[(record.pathname, record.lineno)] = [now, 1, 0]
+            return True
+        if now - site[0] >= self.window:
+            if site[2]:
+                record.suppressed = site[2]
+            site[:] = [now, 1, 0]
+            return True
+        if site[1] < self.limit:
+            site[1] += 1
+            return True
+        site[2] += 1
+        self.suppressed += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """放入有界队列，队列满时丢弃"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 在调用线程中合并参数并格式化异常（traceback对象不能跨线程保留），JSON序列化在后台线程中进行
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLinesFile(logging.handlers.RotatingFileHandler):
+    """批量写入的轮转文件"""
+
+    def write_batch(self, text: str):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0:
+            self.stream.seek(0, 2)
+            position = self.stream.tell()
+            if position and position + len(text) >= self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+        self.stream.write(text)
+        self.stream.flush()
+
+
+class LogService:
+    """日志队列和后台写入线程"""
+
+    def __init__(self):
+        self._handler: Optional[DroppingQueueHandler] = None
+        self._rate_limit: Optional[RateLimitFilter] = None
+        self._output: Optional[JsonLinesFile] = None
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+
+    def start(self):
+        """在根logger上安装队列处理器并启动写入线程"""
+        if self._thread is not None:
+            return
+        log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+        if settings.LOG_FILE:
+            path = settings.LOG_FILE.replace("{pid}", str(os.getpid()))
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._output = JsonLinesFile(path, maxBytes=settings.LOG_MAX_BYTES,
+                                         backupCount=settings.LOG_BACKUP_COUNT, encoding="utf-8", delay=True)
+        self._rate_limit = RateLimitFilter(settings.LOG_RATE_LIMIT, settings.LOG_RATE_WINDOW)
+        self._handler = DroppingQueueHandler(log_queue)
+        self._handler.addFilter(self._rate_limit)
+        self._thread = threading.Thread(target=self._run, args=(log_queue,), name="log-writer", daemon=True)
+        self._thread.start()
+
+        root = logging.getLogger()
+        root.addHandler(self._handler)
+        root.setLevel(settings.LOG_LEVEL.upper())
+
+    def stop(self):
+        """移除处理器，写完队列中剩余的记录"""
+        if self._thread is None:
+            return
+        logging.getLogger().removeHandler(self._handler)
+        try:
+            self._handler.queue.put(_STOP, timeout=5)
+        except queue.Full:
+            pass
+        self._thread.join(10)
+        self._thread = None
+        if self._output is not None:
+            self._output.close()
+            self._output = None
+
+    def _run(self, log_queue: queue.Queue):
+        formatter = JsonFormatter()
+        while True:
+            batch = [log_queue.get()]
+            while len(batch) < settings.LOG_BATCH_SIZE:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not _STOP]
+            if records:
+                lines = []
+                for record in records:
+                    try:
+                        lines.append(formatter.format(record) + "\n")
+                    except Exception:
+                        continue
+                try:
+                    self._write("".join(lines))
+                    self.written += len(lines)
+                except Exception as e:
+                    sys.stderr.write(f"写入日志失败: {e}\n")
+            if len(records) < len(batch):
+                return
+
+    def _write(self, text: str):
+        if self._output is not None:
+            self._output.write_batch(text)
+        else:
+            sys.stderr.write(text)
+            sys.stderr.flush()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._handler.queue.qsize() if self._handler is not None else 0,
+            "written": self.written,
+            "dropped": self._handler.dropped if self._handler is not None else 0,
+            "suppressed": self._rate_limit.suppressed if self._rate_limit is not None else 0
+        }
+
+
+# 全局日志服务（每个worker一个）
+log_service = LogService()
+
+metrics.gauge("log_records", "日志记录数", lambda: {
+    (state,): value for state, value in log_service.stats().items()
+}, ("state",))
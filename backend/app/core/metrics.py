@@ -0,0 +1,237 @@
+"""
+进程内指标（Prometheus文本格式）
+
+每个worker各自计数，/metrics 返回本worker的指标，由Prometheus按worker分别抓取后汇总。
+指标只在事件循环线程中更新，不加锁；直方图使用固定的桶边界，记录一次只是一次二分查找和两次加法。
+连接数、队列深度、连接池状态等瞬时值在抓取时通过回调读取，不在热路径上维护。
+"""
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+import logging
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# 默认的延迟桶边界（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """单调递增的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """固定桶边界的直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签 -> [各桶计数（不累计，最后一个为+Inf）, 总和]
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """计时上下文：with histogram.time(...): ..."""
+        return _Timer(self, labels)
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            plain = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{plain} {_format_value(total)}"
+            yield f"{self.name}_count{plain} {cumulative}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Gauge:
+    """抓取时通过回调读取的瞬时值，回调返回数值或 {标签值元组: 数值}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self) -> Iterable[str]:
+        value = self.callback()
+        if value is None:
+            return
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, number in value.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(number)}"
+
+
+class MetricsMiddleware:
+    """按路由模板记录HTTP请求处理时间（纯ASGI中间件，不包装请求和响应对象）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # 端点函数 -> 路由模板，未匹配到路由的请求统一记为 unmatched，避免标签数量无限增长
+        self._routes: Dict[Any, str] = {}
+
+    def _route(self, scope: Scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        route = self._routes.get(endpoint)
+        if route is None:
+            for candidate in getattr(scope.get("app"), "routes", ()):
+                if getattr(candidate, "endpoint", None) is endpoint:
+                    route = candidate.path
+                    break
+            route = self._routes[endpoint] = route or "unmatched"
+        return route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.observe(
+                time.perf_counter() - started, scope["method"], self._route(scope), str(status_code)
+            )
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, callback: Callable, labelnames: Sequence[str] = ()) -> Gauge:
+        """注册回调型指标（同名时替换回调）"""
+        gauge = Gauge(name, documentation, callback, labelnames)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        """生成Prometheus文本格式"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                logger.error("读取指标 %s 失败: %s", metric.name, e)
+        lines.append("")
+        return "\n".join(lines)
+
+
+# 全局指标注册表（每个worker一个）
+metrics = MetricsRegistry()
+
+# 各模块共用的指标
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "HTTP请求处理时间", ("method", "route", "status")
+)
+ws_messages_in = metrics.counter("ws_messages_received_total", "WebSocket收到的消息数", ("type",))
+ws_bytes_in = metrics.counter("ws_received_bytes_total", "WebSocket收到的字节数", ("type",))
+ws_messages_out = metrics.counter("ws_messages_sent_total", "WebSocket发送的消息数", ("type",))
+ws_bytes_out = metrics.counter("ws_sent_bytes_total", "WebSocket发送的字节数", ("type",))
+password_hash_duration = metrics.histogram(
+    "password_hash_duration_seconds", "bcrypt运算时间", ("stage",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.5, 5.0)
+)
+jwt_duration = metrics.histogram(
+    "jwt_duration_seconds", "JWT签发和解码时间", ("operation",),
+    buckets=(0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01)
+)
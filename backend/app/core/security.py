@@ -1,13 +1,207 @@
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Dict, Optional, Set, Tuple, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import time
+import json
+import logging
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status
 from app.core.config import settings
+from app.core.metrics import jwt_duration, password_hash_duration
+
+logger = logging.getLogger(__name__)
+
+REVOKED_KEY = "auth:revoked:{digest}"
+REVOKED_CHANNEL = "auth:revoked"
 
 # 密码加密上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+class TokenCache:
+    """已验证令牌的LRU缓存
+
+    以令牌的SHA-256摘要为键，条目在令牌的exp（且不超过最大TTL）时过期，
+    重复验证同一令牌只需一次字典查找。仅在事件循环线程中使用。
+
+    登出的令牌记入撤销列表直到其exp，期间即使签名有效也拒绝。
+    配置了Redis时撤销记录同时写入Redis（每个令牌一个key，在exp时过期）并通过发布订阅通知其他worker，
+    各worker在内存中维护完整的撤销列表，验证令牌不需要访问Redis；启动时从Redis加载已有的撤销记录。
+    """
+    
+    def __init__(self, max_size: int, max_ttl: int):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        # 摘要 -> (载荷, 过期时间戳)
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        # 用户ID -> 摘要集合，用于按用户撤销
+        self._by_user: Dict[str, Set[bytes]] = {}
+        # 已撤销令牌的摘要 -> 令牌过期时间戳
+        self._revoked: Dict[bytes, float] = {}
+        self.redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+    
+    def get(self, token: str) -> Optional[dict]:
+        """查找已验证的令牌载荷"""
+        key = self._digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.time():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return payload
+    
+    def put(self, token: str, payload: dict):
+        """缓存已验证的令牌载荷"""
+        if self.max_size <= 0:
+            return
+        exp = payload.get("exp")
+        expires_at = time.time() + self.max_ttl
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        
+        key = self._digest(token)
+        self._entries[key] = (payload, expires_at)
+        self._entries.move_to_end(key)
+        user_id = payload.get("sub")
+        if user_id:
+            self._by_user.setdefault(user_id, set()).add(key)
+        
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+    
+    def is_revoked(self, token: str) -> bool:
+        """令牌是否已撤销（撤销列表为空时不计算摘要）"""
+        if not self._revoked:
+            return False
+        expires_at = self._revoked.get(self._digest(token))
+        return expires_at is not None and expires_at > time.time()
+    
+    def deny(self, token: str, expires_at: float):
+        """将令牌加入撤销列表直到 expires_at，并清理已过期的撤销记录"""
+        self._deny_digest(self._digest(token), expires_at)
+    
+    def _deny_digest(self, key: bytes, expires_at: float):
+        self._remove(key)
+        now = time.time()
+        for expired in [k for k, exp in self._revoked.items() if exp <= now]:
+            del self._revoked[expired]
+        if expires_at > now:
+            self._revoked[key] = expires_at
+    
+    async def start(self, redis_client=None):
+        """启用Redis共享撤销列表：先订阅撤销通知，再加载已有的撤销记录"""
+        if redis_client is None:
+            return
+        self.redis = redis_client
+        try:
+            pubsub = self.redis.pubsub()
+            await pubsub.subscribe(REVOKED_CHANNEL)
+            self._listener = asyncio.create_task(self._listen(pubsub))
+            now = time.time()
+            async for name in self.redis.scan_iter(match=REVOKED_KEY.format(digest="*"), count=500):
+                ttl = await self.redis.ttl(name)
+                if ttl > 0:
+                    name = name.decode() if isinstance(name, bytes) else name
+                    self._deny_digest(bytes.fromhex(name.rsplit(":", 1)[1]), now + ttl)
+        except Exception as e:
+            logger.warning("加载令牌撤销列表失败: %s", e)
+    
+    async def stop(self):
+        """停止Redis共享撤销列表"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+    
+    async def share_denial(self, token: str, expires_at: float):
+        """将撤销记录写入Redis并通知其他worker"""
+        if self.redis is None:
+            return
+        ttl = int(expires_at - time.time()) + 1
+        if ttl <= 0:
+            return
+        digest = self._digest(token).hex()
+        try:
+            await self.redis.set(REVOKED_KEY.format(digest=digest), 1, ex=ttl)
+            await self.redis.publish(REVOKED_CHANNEL, json.dumps({"digest": digest, "exp": expires_at}))
+        except Exception as e:
+            logger.warning("写入令牌撤销列表失败: %s", e)
+    
+    async def _listen(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                try:
+                    event = json.loads(message["data"])
+                    self._deny_digest(bytes.fromhex(event["digest"]), event["exp"])
+                except Exception as e:
+                    logger.error("处理令牌撤销消息失败: %s", e)
+        finally:
+            await pubsub.close()
+    
+    def revoke(self, token: str = None, user_id: str = None):
+        """撤销令牌：清除指定令牌和/或该用户的所有缓存条目"""
+        if token:
+            self._remove(self._digest(token))
+        if user_id:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+    
+    def _remove(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[0].get("sub")
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+    
+    def clear(self):
+        """清空缓存和撤销列表"""
+        self._entries.clear()
+        self._by_user.clear()
+        self._revoked.clear()
+    
+    def stats(self) -> dict:
+        """获取缓存统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "revoked": len(self._revoked),
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+# 已验证令牌缓存
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_MAX_TTL)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -16,6 +210,94 @@ def get_password_hash(password: str) -> str:
     """生成密码哈希"""
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """bcrypt运算专用线程池
+
+    bcrypt每次运算需要100~300ms CPU，放在事件循环中会阻塞所有WebSocket。
+    这里限制并发数和排队数，排队已满时直接返回503，避免登录高峰拖垮整个worker。
+    """
+    
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        # 统计信息
+        self.completed = 0
+        self.rejected = 0
+        self.total_hash_ms = 0.0
+        self.max_hash_ms = 0.0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+    
+    async def run(self, func, *args):
+        """在线程池中执行bcrypt运算"""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="服务繁忙，请稍后重试",
+                headers={"Retry-After": "1"},
+            )
+        
+        def job():
+            started = time.perf_counter()
+            result = func(*args)
+            return result, started, time.perf_counter()
+        
+        self._pending += 1
+        queued_at = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(self._get_executor(), job)
+        finally:
+            self._pending -= 1
+        
+        wait_ms = (started - queued_at) * 1000
+        hash_ms = (finished - started) * 1000
+        self.completed += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        self.total_hash_ms += hash_ms
+        self.max_hash_ms = max(self.max_hash_ms, hash_ms)
+        password_hash_duration.observe(wait_ms / 1000, "wait")
+        password_hash_duration.observe(hash_ms / 1000, "hash")
+        return result
+    
+    def shutdown(self):
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+    
+    def stats(self) -> dict:
+        """获取运算统计"""
+        return {
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_hash_ms": round(self.total_hash_ms / self.completed, 2) if self.completed else 0.0,
+            "max_hash_ms": round(self.max_hash_ms, 2),
+            "avg_wait_ms": round(self.total_wait_ms / self.completed, 2) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2)
+        }
+
+# bcrypt运算线程池
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在线程池中验证密码，不阻塞事件循环"""
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """在线程池中生成密码哈希，不阻塞事件循环"""
+    return await password_hasher.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建访问令牌"""
     to_encode = data.copy()
@@ -25,7 +307,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     
     to_encode.update({"exp": expire, "type": "access"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    with jwt_duration.time("encode"):
+        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 def create_refresh_token(data: dict) -> str:
@@ -33,13 +316,24 @@ def create_refresh_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
     to_encode.update({"exp": expire, "type": "refresh"})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    with jwt_duration.time("encode"):
+        encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 def verify_token(token: str, token_type: str = "access") -> dict:
     """验证令牌"""
+    if token_cache.is_revoked(token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = token_cache.get(token)
+        if payload is None:
+            with jwt_duration.time("decode"):
+                payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            token_cache.put(token, payload)
         if payload.get("type") != token_type:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,6 +347,20 @@ def verify_token(token: str, token_type: str = "access") -> dict:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+async def revoke_token(token: str = None, user_id: str = None):
+    """撤销令牌（登出时调用）：令牌在exp之前不再通过验证（配置了Redis时对所有worker生效），
+    并清除该用户已验证令牌的缓存条目"""
+    if token:
+        try:
+            exp = jwt.get_unverified_claims(token).get("exp")
+        except JWTError:
+            exp = None
+        if not isinstance(exp, (int, float)):
+            exp = time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        token_cache.deny(token, exp)
+        await token_cache.share_denial(token, exp)
+    token_cache.revoke(token=token, user_id=user_id)
+
 def get_user_id_from_token(token: str) -> str:
     """从令牌中获取用户ID"""
     payload = verify_token(token)
@@ -1,22 +1,66 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
-import redis
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.codec import FastJSONResponse
+from app.core.log import log_service
+from app.core.metrics import CONTENT_TYPE, MetricsMiddleware, metrics
+from app.core.security import token_cache, password_hasher
 from app.api.v1.api import api_router
-from app.websocket.manager import WebSocketManager
+from app.websocket.manager import websocket_manager
+from app.websocket.cluster import RedisBroker
+from app.services.presence import presence_tracker
+from app.services.acl import device_acl
+from app.services.health import health_checker
+from app.services.recording import recording_manager
+from app.services.motion import motion_detector
+from app.services.inference import inference_service
+from app.services.rendition import rendition_service
+from app.services.warmup import warmup_runner
 
-# 创建数据库表
+# 表结构由Alembic迁移管理（alembic upgrade head），启动时不再建表
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时执行
-    Base.metadata.create_all(bind=engine)
+    log_service.start()
+    if settings.WS_CLUSTER_ENABLED:
+        await websocket_manager.enable_cluster(
+            RedisBroker.from_url(settings.REDIS_URL, password=settings.REDIS_PASSWORD)
+        )
+    await presence_tracker.start()
+    await websocket_manager.heartbeat.start()
+    if settings.RECORDING_ENABLED:
+        await recording_manager.start()
+    if settings.RENDITION_ENABLED:
+        rendition_service.start()
+    if settings.REDIS_URL or settings.ACL_CACHE_REDIS_ENABLED:
+        import redis.asyncio as aioredis
+    if settings.REDIS_URL:
+        await token_cache.start(aioredis.from_url(settings.REDIS_URL, password=settings.REDIS_PASSWORD or None))
+    if settings.ACL_CACHE_REDIS_ENABLED:
+        await device_acl.start(aioredis.from_url(settings.REDIS_URL, password=settings.REDIS_PASSWORD or None))
+    # 运动检测、AI推理等重型子系统在开始接受请求后预热
+    warmup_runner.start()
     yield
     # 关闭时执行
-    pass
+    await warmup_runner.stop()
+    await inference_service.stop()
+    rendition_service.stop()
+    await motion_detector.stop()
+    await device_acl.stop()
+    await token_cache.stop()
+    await websocket_manager.heartbeat.stop()
+    await presence_tracker.stop()
+    await recording_manager.stop()
+    await asyncio.get_running_loop().run_in_executor(None, recording_manager.close_all)
+    await websocket_manager.disable_cluster()
+    await health_checker.close()
+    password_hasher.shutdown()
+    log_service.stop()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -25,6 +69,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 
@@ -43,8 +88,9 @@ app.add_middleware(
     allowed_hosts=settings.ALLOWED_HOSTS
 )
 
-# 初始化WebSocket管理器
-websocket_manager = WebSocketManager()
+# 记录各路由的请求处理时间（最外层，包含其他中间件的耗时）
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 # 包含API路由
 app.include_router(api_router, prefix="/api/v1")
@@ -61,11 +107,29 @@ async def root():
 # 健康检查
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "database": "connected",
-        "redis": "connected"
-    }
+    """探测数据库和Redis（结果缓存 HEALTH_CACHE_TTL 秒），数据库不可用时返回503"""
+    probes = await health_checker.check()
+    if probes["database"]["status"] != "connected":
+        status = "unhealthy"
+    elif probes["redis"]["status"] not in ("connected", "disabled"):
+        status = "degraded"
+    else:
+        status = "healthy"
+    return JSONResponse(status_code=503 if status == "unhealthy" else 200, content={
+        "status": status,
+        "database": probes["database"],
+        "redis": probes["redis"],
+        "token_cache": token_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "warmup": warmup_runner.stats()
+    })
+
+# Prometheus指标（本worker）
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type=CONTENT_TYPE)
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, String, Boolean, DateTime, Text, Enum
-from sqlalchemy.dialects.mysql import VARCHAR, TEXT, ENUM
+from sqlalchemy.dialects.mysql import VARCHAR, TEXT
 from sqlalchemy.sql import func
 from app.core.database import Base
 import enum
@@ -13,7 +13,7 @@ class Device(Base):
     
     device_id = Column(VARCHAR(36), primary_key=True, index=True)
     device_name = Column(VARCHAR(100), nullable=False)
-    device_type = Column(ENUM(DeviceType), nullable=False)
+    device_type = Column(Enum(DeviceType), nullable=False)
     is_online = Column(Boolean, default=False)
     last_seen = Column(DateTime, nullable=True)
     server_url = Column(VARCHAR(255), nullable=True)
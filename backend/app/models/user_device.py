@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey, INT
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey, INT, Index
 from sqlalchemy.dialects.mysql import VARCHAR
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -7,6 +7,10 @@ from app.models.device import DeviceType
 
 class UserDevice(Base):
     __tablename__ = "user_devices"
+    __table_args__ = (
+        # 设备列表查询与键集分页使用的复合索引
+        Index("ix_user_devices_user_active_device", "user_id", "is_active", "device_id"),
+    )
     
     id = Column(INT, primary_key=True, autoincrement=True)
     user_id = Column(VARCHAR(36), nullable=False, index=True)
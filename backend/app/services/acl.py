@@ -0,0 +1,270 @@
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from collections import OrderedDict
+import asyncio
+import json
+import logging
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.user_device import UserDevice
+
+logger = logging.getLogger(__name__)
+
+# 每个 (设备, 用户) 一个key，值为 "{写入时的设备版本}|{权限}"，各自按 ACL_CACHE_TTL 过期
+ACL_KEY = "acl:device:{device_id}:user:{user_id}"
+# 设备权限版本，每次失效时递增；版本与当前不一致的缓存值视为未命中
+ACL_VERSION_KEY = "acl:device:{device_id}:version"
+ACL_INVALIDATE_CHANNEL = "acl:invalidate"
+
+# 缓存中表示“无权限”的值
+NO_ACCESS = "-"
+
+
+class DevicePermission(NamedTuple):
+    """用户对设备的权限"""
+    is_owner: bool
+    permissions: str
+
+
+class DevicePermissionCache:
+    """设备权限缓存: (用户ID, 设备ID) -> 权限
+
+    进程内LRU为第一级，可选Redis（每个 (设备, 用户) 一个key）为第二级。
+    无权限的结果同样缓存。创建/删除设备或修改权限时调用 invalidate* 精确失效，
+    启用Redis时递增设备版本使该设备的Redis缓存全部失效，并通过发布订阅通知其他worker清除本地缓存。
+
+    查询期间发生的失效不会被旧结果覆盖：本worker的失效递增本地代数，查询期间设备被失效过时不写入本地缓存；
+    写回Redis时用 WATCH 比较查询前读到的设备版本，其他worker在此期间失效过则放弃写入。
+    """
+
+    def __init__(self, max_size: int = None, ttl: int = None):
+        self.max_size = max_size if max_size is not None else settings.ACL_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.ACL_CACHE_TTL
+        # (用户ID, 设备ID) -> (权限或None, 过期时间)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Optional[DevicePermission], float]]" = OrderedDict()
+        # 设备ID -> 用户ID集合，用于按设备失效
+        self._by_device: Dict[str, Set[str]] = {}
+        # 设备ID -> (拥有者用户ID列表, 过期时间)，用于向拥有者推送设备事件
+        self._owners: Dict[str, Tuple[List[str], float]] = {}
+        # 失效代数: 设备ID -> 最近一次失效时的代数，不在表中的设备视为在 _generation_floor 时失效过
+        self._generation = 0
+        self._invalidated: Dict[str, int] = {}
+        self._generation_floor = 0
+        self.redis = None
+        self._listener: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def start(self, redis_client=None):
+        """启用Redis二级缓存"""
+        if redis_client is None:
+            return
+        self.redis = redis_client
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(ACL_INVALIDATE_CHANNEL)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def stop(self):
+        """停止Redis二级缓存"""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+    async def get(self, db: AsyncSession, user_id: str, device_id: str) -> Optional[DevicePermission]:
+        """获取用户对设备的权限，无权限时返回None"""
+        key = (user_id, device_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        generation = self._generation
+        version = None
+        if self.redis is not None:
+            hit = False
+            try:
+                version, raw = await self.redis.mget(
+                    ACL_VERSION_KEY.format(device_id=device_id), ACL_KEY.format(device_id=device_id, user_id=user_id)
+                )
+                version = _text(version) or "0"
+                if raw is not None:
+                    hit, permission = self._decode(raw, version)
+            except Exception as e:
+                logger.warning("读取Redis权限缓存失败: %s", e)
+                version = None
+            if hit:
+                self.redis_hits += 1
+                if not self._invalidated_since(device_id, generation):
+                    self._store(key, permission)
+                return permission
+
+        self.misses += 1
+        row = (await db.execute(select(UserDevice.is_owner, UserDevice.permissions).where(
+            UserDevice.user_id == user_id,
+            UserDevice.device_id == device_id,
+            UserDevice.is_active == True
+        ))).first()
+        permission = DevicePermission(bool(row.is_owner), row.permissions) if row else None
+        if self._invalidated_since(device_id, generation):
+            return permission
+        self._store(key, permission)
+        if version is not None:
+            await self._store_redis(device_id, user_id, version, permission)
+        return permission
+
+    async def _store_redis(self, device_id: str, user_id: str, version: str, permission: Optional[DevicePermission]):
+        """设备版本仍为查询前读到的版本时写入Redis"""
+        from redis.exceptions import WatchError
+
+        version_key = ACL_VERSION_KEY.format(device_id=device_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                await pipe.watch(version_key)
+                if (_text(await pipe.get(version_key)) or "0") != version:
+                    return
+                pipe.multi()
+                pipe.set(ACL_KEY.format(device_id=device_id, user_id=user_id),
+                         f"{version}|{self._encode(permission)}", ex=self.ttl)
+                await pipe.execute()
+        except WatchError:
+            # 其他worker在写入前失效了该设备
+            pass
+        except Exception as e:
+            logger.warning("写入Redis权限缓存失败: %s", e)
+
+    async def owners(self, device_id: str) -> List[str]:
+        """获取设备拥有者的用户ID（请求上下文之外使用，自行打开数据库会话）"""
+        entry = self._owners.get(device_id)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        generation = self._generation
+        async with AsyncSessionLocal() as db:
+            user_ids = list((await db.execute(select(UserDevice.user_id).where(
+                UserDevice.device_id == device_id,
+                UserDevice.is_owner == True,
+                UserDevice.is_active == True
+            ))).scalars().all())
+        if self._invalidated_since(device_id, generation):
+            return user_ids
+        if len(self._owners) >= self.max_size:
+            self._owners.clear()
+        self._owners[device_id] = (user_ids, time.monotonic() + self.ttl)
+        return user_ids
+
+    def _invalidated_since(self, device_id: str, generation: int) -> bool:
+        """设备在给定代数之后是否被失效过"""
+        return self._invalidated.get(device_id, self._generation_floor) > generation
+
+    def _store(self, key: Tuple[str, str], permission: Optional[DevicePermission]):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (permission, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        self._by_device.setdefault(key[1], set()).add(key[0])
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple[str, str]):
+        if self._entries.pop(key, None) is None:
+            return
+        users = self._by_device.get(key[1])
+        if users is not None:
+            users.discard(key[0])
+            if not users:
+                del self._by_device[key[1]]
+
+    @staticmethod
+    def _encode(permission: Optional[DevicePermission]) -> str:
+        if permission is None:
+            return NO_ACCESS
+        return json.dumps([permission.is_owner, permission.permissions])
+
+    @staticmethod
+    def _decode(raw, version: str) -> Tuple[bool, Optional[DevicePermission]]:
+        """解码Redis中的缓存值，返回 (是否命中, 权限)，写入时的设备版本与当前版本不一致时视为未命中"""
+        written, _, value = _text(raw).partition("|")
+        if written != version:
+            return False, None
+        if value == NO_ACCESS:
+            return True, None
+        is_owner, permissions = json.loads(value)
+        return True, DevicePermission(is_owner, permissions)
+
+    def _invalidate_local(self, device_id: str, user_id: str = None):
+        self._generation += 1
+        if len(self._invalidated) >= max(self.max_size, 1):
+            # 清空代数表时把所有设备视为刚被失效，进行中的查询都不会写入缓存
+            self._invalidated.clear()
+            self._generation_floor = self._generation
+        self._invalidated[device_id] = self._generation
+        self._owners.pop(device_id, None)
+        if user_id is not None:
+            self._remove((user_id, device_id))
+            return
+        for cached_user in list(self._by_device.get(device_id, ())):
+            self._remove((cached_user, device_id))
+
+    async def invalidate(self, user_id: str, device_id: str):
+        """用户对设备的权限发生变化"""
+        await self._invalidate(device_id, user_id)
+
+    async def invalidate_device(self, device_id: str):
+        """设备的所有权限发生变化（如删除设备）"""
+        await self._invalidate(device_id, None)
+
+    async def _invalidate(self, device_id: str, user_id: Optional[str]):
+        self._invalidate_local(device_id, user_id)
+        if self.redis is None:
+            return
+        try:
+            # 递增版本使该设备所有用户的Redis缓存失效（旧值按各自的TTL过期）；
+            # 版本key比缓存值多保留一个TTL，过期时旧版本写入的值都已过期
+            version_key = ACL_VERSION_KEY.format(device_id=device_id)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.incr(version_key)
+                pipe.expire(version_key, self.ttl * 2)
+                await pipe.execute()
+            await self.redis.publish(ACL_INVALIDATE_CHANNEL, json.dumps({"device_id": device_id, "user_id": user_id}))
+        except Exception as e:
+            logger.warning("清除Redis权限缓存失败: %s", e)
+
+    async def _listen(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                try:
+                    event = json.loads(message["data"])
+                    self._invalidate_local(event["device_id"], event.get("user_id"))
+                except Exception as e:
+                    logger.error("处理权限失效消息失败: %s", e)
+        finally:
+            await pubsub.close()
+
+    def stats(self) -> dict:
+        """获取缓存统计"""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses
+        }
+
+
+def _text(value) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+# 全局设备权限缓存
+device_acl = DevicePermissionCache()
@@ -0,0 +1,139 @@
+from typing import Any, Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import time
+
+from app.core.config import settings
+from app.models.device import Device
+from app.services.presence import presence_tracker
+
+
+class DeviceState(NamedTuple):
+    """计算ETag所需的设备字段（数据库中的在线状态，计算时由实时状态覆盖）"""
+    device_id: str
+    content: Tuple
+    is_online: bool
+    last_seen: Optional[datetime]
+
+    @classmethod
+    def from_device(cls, device: Device) -> "DeviceState":
+        # updated_at 精度只到秒，同一秒内的两次修改依靠其余字段区分
+        content = (
+            device.updated_at, device.device_name, device.device_type, device.is_paired,
+            device.paired_device_id, device.created_at
+        )
+        return cls(device.device_id, content, device.is_online, device.last_seen)
+
+
+class CachedResult(NamedTuple):
+    """缓存的查询结果摘要"""
+    version: int
+    expires_at: float
+    devices: Tuple[DeviceState, ...]
+    extra: Any
+
+
+# last_seen 为不带时区的UTC时间
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _last_seen_bucket(last_seen: Optional[datetime]) -> Optional[int]:
+    """最后活跃时间按在线状态写回间隔取整，心跳不会使ETag每次都变化"""
+    if last_seen is None:
+        return None
+    return int((last_seen - _EPOCH).total_seconds() // settings.PRESENCE_FLUSH_INTERVAL)
+
+
+def compute_etag(devices: Iterable[DeviceState], extra: Any = None) -> str:
+    """根据设备字段和实时在线状态计算ETag
+
+    ETag只取决于响应内容本身，与worker无关，多worker时同样可以命中。
+    last_seen 只精确到 PRESENCE_FLUSH_INTERVAL（与数据库中的值相同的延迟），
+    同一区间内的心跳返回304，客户端缓存的 last_seen 最多滞后一个写回间隔，因此是弱ETag。
+    """
+    digest = hashlib.sha1(repr(extra).encode())
+    for state in devices:
+        is_online, last_seen = presence_tracker.resolve(state.device_id, state.is_online, state.last_seen)
+        digest.update(repr((state.device_id, state.content, is_online, _last_seen_bucket(last_seen))).encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 请求头是否匹配（GET请求使用弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class DeviceVersionCache:
+    """用户设备集合版本号 + 查询结果摘要缓存
+
+    devices.py 中的写操作调用 bump 递增相关用户的版本号。读取时如果缓存的
+    结果摘要版本号仍然有效，可以不查询数据库直接算出ETag并返回304。
+    版本号只保存在本worker内存中，多worker时其他worker的修改最多在
+    ETAG_CACHE_TTL 秒后可见。
+    """
+
+    def __init__(self, max_size: int = None, ttl: int = None):
+        self.max_size = max_size if max_size is not None else settings.ETAG_CACHE_SIZE
+        self.ttl = ttl if ttl is not None else settings.ETAG_CACHE_TTL
+        # 用户ID -> 版本号
+        self._versions: Dict[str, int] = {}
+        # (用户ID, 查询键) -> 结果摘要
+        self._results: "OrderedDict[Tuple[str, Hashable], CachedResult]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id: str) -> int:
+        """获取用户设备集合的当前版本号"""
+        return self._versions.get(user_id, 0)
+
+    def bump(self, *user_ids: str):
+        """用户的设备集合或其中某个设备发生变化"""
+        for user_id in user_ids:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def get(self, user_id: str, key: Hashable) -> Optional[CachedResult]:
+        """获取仍然有效的结果摘要"""
+        cache_key = (user_id, key)
+        entry = self._results.get(cache_key)
+        if entry is None or entry.version != self.version(user_id) or entry.expires_at <= time.monotonic():
+            if entry is not None:
+                del self._results[cache_key]
+            self.misses += 1
+            return None
+        self._results.move_to_end(cache_key)
+        self.hits += 1
+        return entry
+
+    def put(self, user_id: str, key: Hashable, version: int, devices: Iterable[DeviceState], extra: Any = None):
+        """保存查询结果摘要，version 为查询数据库前读取的版本号"""
+        if self.max_size <= 0 or self.ttl <= 0 or version != self.version(user_id):
+            return
+        cache_key = (user_id, key)
+        self._results[cache_key] = CachedResult(version, time.monotonic() + self.ttl, tuple(devices), extra)
+        self._results.move_to_end(cache_key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+
+    def stats(self) -> dict:
+        """获取缓存统计"""
+        return {
+            "size": len(self._results),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# 全局设备版本缓存（每个worker一个）
+device_versions = DeviceVersionCache()
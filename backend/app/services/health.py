@@ -0,0 +1,74 @@
+"""
+健康检查
+
+实际探测数据库（SELECT 1）和Redis（PING，未配置 REDIS_URL 时不探测，报告为 disabled），结果缓存 HEALTH_CACHE_TTL 秒，
+负载均衡器频繁探测时不会给数据库带来额外压力；同一时刻只有一次探测在进行，并发请求共享结果。
+"""
+from typing import Optional
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import async_engine
+
+
+class HealthChecker:
+    """数据库和Redis连通性探测"""
+
+    def __init__(self):
+        self._result: Optional[dict] = None
+        self._expires_at = 0.0
+        self._probe: Optional[asyncio.Future] = None
+        self._redis = None
+
+    async def check(self) -> dict:
+        """获取探测结果（缓存有效期内直接返回）"""
+        if self._result is not None and time.monotonic() < self._expires_at:
+            return self._result
+        if self._probe is None or self._probe.done():
+            self._probe = asyncio.ensure_future(self._run())
+        return await asyncio.shield(self._probe)
+
+    async def _run(self) -> dict:
+        if settings.REDIS_URL:
+            database, redis_status = await asyncio.gather(
+                self._timed(self._probe_database()), self._timed(self._probe_redis())
+            )
+        else:
+            database, redis_status = await self._timed(self._probe_database()), {"status": "disabled"}
+        self._result = {"database": database, "redis": redis_status}
+        self._expires_at = time.monotonic() + settings.HEALTH_CACHE_TTL
+        return self._result
+
+    async def _timed(self, probe) -> dict:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe, settings.HEALTH_PROBE_TIMEOUT)
+        except Exception as e:
+            return {"status": "error", "error": repr(e)}
+        return {"status": "connected", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    async def _probe_database(self):
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def _probe_redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(settings.REDIS_URL, password=settings.REDIS_PASSWORD or None)
+        await self._redis.ping()
+
+    async def close(self):
+        """关闭Redis连接"""
+        if self._redis is not None:
+            redis_client, self._redis = self._redis, None
+            try:
+                await redis_client.close()
+            except Exception:
+                pass
+
+
+# 全局健康检查（每个worker一个）
+health_checker = HealthChecker()
@@ -0,0 +1,311 @@
+"""
+AI推理服务（宠物检测 / 哭声检测）
+
+所有摄像头的推理请求在事件循环中凑成小批（最多 AI_MAX_BATCH_SIZE 个，最多等待 AI_MAX_BATCH_WAIT 秒），
+交给独立的推理进程池在CPU上批量执行，与处理HTTP/WebSocket的worker分开。
+得分超过 AI_DETECTION_THRESHOLD 时通过 WebSocketManager.send_to_user 向设备拥有者推送 detection 事件。
+
+- 视频：每个摄像头每 AI_VIDEO_SAMPLE_INTERVAL 秒取一帧（图像格式如JPEG），启用运动检测时只在有运动时推理
+- 音频：音频帧负载为16位单声道PCM，按 AI_AUDIO_WINDOW_SECONDS 拼成窗口后推理
+
+模型为 AI_MODEL_DIR 下可由 tf.keras.models.load_model 加载的模型，输出取最后一列作为正类概率；
+模型名为 dummy 时使用不依赖TensorFlow的测试模型。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+from app.core.config import settings
+from app.services.acl import device_acl
+from app.services.motion import motion_detector, warm_up
+from app.websocket.manager import websocket_manager
+from app.websocket.protocol import BinaryFrame, FRAME_TYPE_AUDIO, FRAME_TYPE_VIDEO
+
+logger = logging.getLogger(__name__)
+
+# 推理类型及对应的检测标签
+KIND_VIDEO = "video"
+KIND_AUDIO = "audio"
+LABELS = {KIND_VIDEO: "pet", KIND_AUDIO: "cry"}
+
+# 视频模型输入尺寸（宽, 高）
+VIDEO_INPUT_SIZE = (224, 224)
+
+DUMMY_MODEL = "dummy"
+
+# 推理进程中加载的模型: 类型 -> 模型
+_models: Dict[str, Any] = {}
+
+
+class DummyModel:
+    """测试用模型：视频得分为平均亮度，音频得分为均方根音量"""
+
+    def predict(self, batch, verbose=0):
+        import numpy as np
+        flat = batch.reshape(len(batch), -1)
+        if batch.ndim == 2:
+            return np.sqrt((flat ** 2).mean(axis=1, keepdims=True))
+        return flat.mean(axis=1, keepdims=True)
+
+
+def _init_worker(model_names: Dict[str, str], model_dir: str, device: str, threads: int):
+    """推理进程初始化：每个进程只加载一次模型"""
+    if any(name != DUMMY_MODEL for name in model_names.values()):
+        if device == "cpu":
+            os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+    for kind, name in model_names.items():
+        if name == DUMMY_MODEL:
+            _models[kind] = DummyModel()
+        else:
+            import tensorflow as tf
+            _models[kind] = tf.keras.models.load_model(os.path.join(model_dir, name))
+
+
+def _prepare(kind: str, payload: bytes, audio_samples: int):
+    """将请求数据转换为模型输入，无法解码时返回None"""
+    import numpy as np
+    if kind == KIND_AUDIO:
+        window = np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32768.0
+        if len(window) < audio_samples:
+            window = np.pad(window, (0, audio_samples - len(window)))
+        return window[:audio_samples]
+
+    import cv2
+    image = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    image = cv2.resize(image, VIDEO_INPUT_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32) / 255.0
+
+
+def run_batch(kind: str, payloads: List[bytes], audio_samples: int) -> List[Optional[float]]:
+    """在推理进程中执行一批推理，返回每个请求的得分（无法解码时为None）"""
+    import numpy as np
+
+    inputs = [_prepare(kind, payload, audio_samples) for payload in payloads]
+    valid = [index for index, value in enumerate(inputs) if value is not None]
+    scores: List[Optional[float]] = [None] * len(payloads)
+    if not valid:
+        return scores
+
+    batch = np.stack([inputs[index] for index in valid])
+    outputs = np.asarray(_models[kind].predict(batch, verbose=0)).reshape(len(valid), -1)[:, -1]
+    for index, score in zip(valid, outputs):
+        scores[index] = float(score)
+    return scores
+
+
+class InferenceRequest:
+    """等待推理的请求"""
+
+    __slots__ = ("device_id", "kind", "payload", "timestamp")
+
+    def __init__(self, device_id: str, kind: str, payload: bytes, timestamp: int):
+        self.device_id = device_id
+        self.kind = kind
+        self.payload = payload
+        self.timestamp = timestamp
+
+
+class InferenceService:
+    """动态凑批的推理调度（事件循环侧）"""
+
+    def __init__(self):
+        # 每种类型一个等待队列，每个摄像头只保留最新的请求: 类型 -> {设备ID: 请求}
+        self._pending: Dict[str, Dict[str, InferenceRequest]] = {KIND_VIDEO: {}, KIND_AUDIO: {}}
+        # 设备ID -> 下次视频采样时间
+        self._next_sample: Dict[str, float] = {}
+        # 设备ID -> 未凑满窗口的音频数据
+        self._audio: Dict[str, bytearray] = {}
+        # (设备ID, 类型) -> 上次推送事件的时间
+        self._last_event: Dict[Tuple[str, str], float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        # 统计信息
+        self.requests = 0
+        self.inferred = 0
+        self.batches = 0
+        self.batch_items = 0
+        self.failed = 0
+        self.events = 0
+
+    @property
+    def audio_window_bytes(self) -> int:
+        return int(settings.AI_AUDIO_SAMPLE_RATE * settings.AI_AUDIO_WINDOW_SECONDS) * 2
+
+    async def start(self):
+        """启动推理进程池和凑批任务"""
+        if self._task is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            settings.AI_INFERENCE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                {KIND_VIDEO: settings.AI_VIDEO_MODEL, KIND_AUDIO: settings.AI_AUDIO_MODEL},
+                settings.AI_MODEL_DIR, settings.TENSORFLOW_DEVICE, settings.AI_THREADS_PER_WORKER
+            )
+        )
+        # 启动时就创建推理进程并加载模型
+        for _ in range(settings.AI_INFERENCE_WORKERS):
+            self._pool.submit(warm_up)
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(settings.AI_INFERENCE_WORKERS)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止推理服务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        for pending in self._pending.values():
+            pending.clear()
+        self._audio.clear()
+
+    def submit_frame(self, device_id: str, frame: BinaryFrame):
+        """帧转发路径调用：按类型采样或拼接后加入等待队列（不阻塞）"""
+        if self._task is None:
+            return
+        if frame.frame_type == FRAME_TYPE_VIDEO:
+            now = time.monotonic()
+            if now < self._next_sample.get(device_id, 0.0):
+                return
+            # 启用运动检测时只对有运动的画面推理
+            if settings.MOTION_ENABLED and not motion_detector.is_active(device_id):
+                return
+            self._next_sample[device_id] = now + settings.AI_VIDEO_SAMPLE_INTERVAL
+            self.submit(device_id, KIND_VIDEO, bytes(frame.payload), frame.timestamp)
+        elif frame.frame_type == FRAME_TYPE_AUDIO:
+            buffer = self._audio.setdefault(device_id, bytearray())
+            buffer += frame.payload
+            window = self.audio_window_bytes
+            if len(buffer) >= window:
+                self.submit(device_id, KIND_AUDIO, bytes(buffer[:window]), frame.timestamp)
+                del buffer[:window]
+                # 推理跟不上时只保留最近一个窗口的数据
+                if len(buffer) > window:
+                    del buffer[:len(buffer) - window]
+
+    def submit(self, device_id: str, kind: str, payload: bytes, timestamp: int):
+        """加入推理请求"""
+        if self._task is None:
+            return
+        self._pending[kind][device_id] = InferenceRequest(device_id, kind, payload, timestamp)
+        self.requests += 1
+        self._wakeup.set()
+
+    def forget(self, device_id: str):
+        """摄像头断开，丢弃其状态"""
+        for pending in self._pending.values():
+            pending.pop(device_id, None)
+        self._next_sample.pop(device_id, None)
+        self._audio.pop(device_id, None)
+
+    def _pending_count(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            # 批未满时最多等待 AI_MAX_BATCH_WAIT 秒
+            deadline = time.monotonic() + settings.AI_MAX_BATCH_WAIT
+            while max(len(pending) for pending in self._pending.values()) < settings.AI_MAX_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            while self._pending_count():
+                for kind, pending in self._pending.items():
+                    if not pending:
+                        continue
+                    await self._slots.acquire()
+                    batch = []
+                    for device_id in list(pending)[:settings.AI_MAX_BATCH_SIZE]:
+                        batch.append(pending.pop(device_id))
+                    asyncio.ensure_future(self._infer(kind, batch))
+
+    async def _infer(self, kind: str, batch: List[InferenceRequest]):
+        try:
+            scores = await asyncio.get_running_loop().run_in_executor(
+                self._pool, run_batch, kind, [request.payload for request in batch],
+                self.audio_window_bytes // 2
+            )
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error("AI推理失败: %s", e)
+            return
+        finally:
+            self._slots.release()
+
+        self.batches += 1
+        self.batch_items += len(batch)
+        now = time.monotonic()
+        for request, score in zip(batch, scores):
+            if score is None:
+                self.failed += 1
+                continue
+            self.inferred += 1
+            if score < settings.AI_DETECTION_THRESHOLD:
+                continue
+            key = (request.device_id, kind)
+            if now - self._last_event.get(key, -settings.AI_EVENT_COOLDOWN) < settings.AI_EVENT_COOLDOWN:
+                continue
+            self._last_event[key] = now
+            await self._notify(request, score)
+
+    async def _notify(self, request: InferenceRequest, score: float):
+        """向设备拥有者推送检测结果"""
+        self.events += 1
+        message = {
+            "type": "detection",
+            "device_id": request.device_id,
+            "kind": request.kind,
+            "label": LABELS[request.kind],
+            "score": round(score, 4),
+            "frame_timestamp": request.timestamp,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        try:
+            for user_id in await device_acl.owners(request.device_id):
+                await websocket_manager.send_to_user(user_id, message)
+        except Exception as e:
+            logger.warning("推送检测事件失败: %s", e)
+
+    def stats(self) -> dict:
+        """获取推理统计"""
+        return {
+            "pending": {kind: len(pending) for kind, pending in self._pending.items()},
+            "requests": self.requests,
+            "inferred": self.inferred,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batch_items / self.batches, 2) if self.batches else 0,
+            "events": self.events
+        }
+
+
+# 全局推理服务（每个worker一个）
+inference_service = InferenceService()
@@ -0,0 +1,300 @@
+"""
+运动检测（活动门控）
+
+在帧转发路径上以很低的代价判断摄像头画面是否有活动，供录像、AI推理等后续环节决定是否处理。
+事件循环只做采样和凑批，解码和计算在工作进程中完成：
+
+- 自适应采样：无运动时每个摄像头每 MOTION_IDLE_INTERVAL 秒取一帧，检测到运动后提高到
+  每 MOTION_ACTIVE_INTERVAL 秒一帧，运动结束 MOTION_COOLDOWN 秒后恢复
+- 缩小解码：以 IMREAD_REDUCED_GRAYSCALE_4 直接解码为1/4尺寸的灰度图（JPEG在DCT阶段缩放），
+  再缩放到固定的分析尺寸
+- 批量计算：同一批内不同摄像头的帧叠成一个数组，与各自的滑动平均背景做一次向量化差分
+- 背景常驻工作进程：每个工作进程是单进程执行器，摄像头固定分配给其中一个，背景模型只保存在
+  该进程内，进程间只传递JPEG数据和得分
+
+检测到运动（从无到有）时通过 WebSocketManager.send_to_user 向设备拥有者推送 motion_detected 事件。
+只分析图像格式（如JPEG）的视频帧，无法解码的帧计数后忽略。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import logging
+import multiprocessing
+import time
+
+from app.core.config import settings
+from app.services.acl import device_acl
+from app.websocket.manager import websocket_manager
+from app.websocket.protocol import BinaryFrame
+
+logger = logging.getLogger(__name__)
+
+# 分析尺寸（宽, 高）
+ANALYSIS_SIZE = (160, 120)
+
+# 工作进程内的背景模型: 设备ID -> 滑动平均背景（只保存分配给本进程的摄像头）
+_backgrounds: Dict[str, Any] = {}
+
+
+def analyze_batch(items: List[Tuple[str, bytes]], pixel_threshold: int,
+                  alpha: float) -> List[Tuple[str, Optional[float]]]:
+    """在工作进程中分析一批帧
+
+    items 为 (设备ID, 图像数据)，返回 (设备ID, 变化像素占比或None)，背景模型在本进程内更新。
+    """
+    import cv2
+    import numpy as np
+
+    results: List[Optional[Tuple[str, Optional[float]]]] = [None] * len(items)
+    frames, backgrounds, positions = [], [], []
+    for position, (device_id, payload) in enumerate(items):
+        image = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        if image is None:
+            results[position] = (device_id, None)
+            continue
+        image = cv2.resize(image, ANALYSIS_SIZE, interpolation=cv2.INTER_AREA)
+        image = cv2.GaussianBlur(image, (5, 5), 0).astype(np.float32)
+        background = _backgrounds.get(device_id)
+        if background is None:
+            # 第一帧作为初始背景
+            _backgrounds[device_id] = image
+            results[position] = (device_id, 0.0)
+            continue
+        frames.append(image)
+        backgrounds.append(background)
+        positions.append(position)
+
+    if frames:
+        current = np.stack(frames)
+        model = np.stack(backgrounds)
+        scores = (np.abs(current - model) > pixel_threshold).mean(axis=(1, 2))
+        # 滑动平均更新背景
+        model += alpha * (current - model)
+        for index, position in enumerate(positions):
+            device_id = items[position][0]
+            _backgrounds[device_id] = model[index]
+            results[position] = (device_id, float(scores[index]))
+    return results
+
+
+def drop_backgrounds(device_ids: List[str]):
+    """在工作进程中丢弃已断开摄像头的背景模型"""
+    for device_id in device_ids:
+        _backgrounds.pop(device_id, None)
+
+
+def warm_up() -> bool:
+    """在工作进程中预先导入OpenCV和NumPy"""
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    return True
+
+
+class MotionWorker:
+    """运动检测工作进程（单进程执行器），同一时刻只分析一批"""
+
+    __slots__ = ("executor", "cameras", "busy")
+
+    def __init__(self, executor: ProcessPoolExecutor):
+        self.executor = executor
+        self.cameras = 0
+        self.busy = False
+
+
+class CameraMotion:
+    """单个摄像头的检测状态（背景模型保存在分配的工作进程中）"""
+
+    __slots__ = ("next_sample", "active_until", "worker", "in_flight", "last_score")
+
+    def __init__(self, worker: MotionWorker):
+        self.next_sample = 0.0
+        self.active_until = 0.0
+        self.worker = worker
+        self.in_flight = False
+        self.last_score = 0.0
+
+
+class MotionDetector:
+    """运动检测调度（事件循环侧）"""
+
+    def __init__(self):
+        self._cameras: Dict[str, CameraMotion] = {}
+        # 等待分析的帧: 设备ID -> (图像数据, 帧时间戳)，每个摄像头只保留最新一帧
+        self._pending: Dict[str, Tuple[bytes, int]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._workers: List[MotionWorker] = []
+
+        # 统计信息
+        self.sampled = 0
+        self.analyzed = 0
+        self.undecodable = 0
+        self.batches = 0
+        self.events = 0
+
+    async def start(self):
+        """启动工作进程和凑批任务"""
+        if self._task is not None:
+            return
+        # 使用spawn，避免fork复制事件循环和其他线程持有的锁
+        context = multiprocessing.get_context("spawn")
+        for _ in range(settings.MOTION_WORKERS):
+            worker = MotionWorker(ProcessPoolExecutor(1, mp_context=context))
+            # 启动时就创建工作进程，避免第一帧等待进程启动
+            worker.executor.submit(warm_up)
+            self._workers.append(worker)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止检测"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for worker in self._workers:
+            worker.executor.shutdown(wait=False)
+        self._workers.clear()
+        self._cameras.clear()
+        self._pending.clear()
+
+    def is_active(self, device_id: str) -> bool:
+        """摄像头当前是否处于运动状态"""
+        state = self._cameras.get(device_id)
+        return state is not None and time.monotonic() < state.active_until
+
+    def submit(self, device_id: str, frame: BinaryFrame):
+        """帧转发路径调用：按自适应间隔采样（不阻塞）"""
+        if self._task is None:
+            return
+        state = self._cameras.get(device_id)
+        if state is None:
+            # 分配给摄像头最少的工作进程，之后固定不变
+            worker = min(self._workers, key=lambda candidate: candidate.cameras)
+            worker.cameras += 1
+            state = self._cameras[device_id] = CameraMotion(worker)
+
+        now = time.monotonic()
+        if state.in_flight or now < state.next_sample:
+            return
+        interval = settings.MOTION_ACTIVE_INTERVAL if now < state.active_until else settings.MOTION_IDLE_INTERVAL
+        state.next_sample = now + interval
+
+        self._pending[device_id] = (bytes(frame.payload), frame.timestamp)
+        self.sampled += 1
+        self._wakeup.set()
+
+    def forget(self, device_id: str):
+        """摄像头断开，丢弃其状态"""
+        self._pending.pop(device_id, None)
+        state = self._cameras.pop(device_id, None)
+        if state is None:
+            return
+        state.worker.cameras -= 1
+        try:
+            # 单进程执行器按提交顺序执行，重新连接后的帧一定在丢弃之后分析
+            state.worker.executor.submit(drop_backgrounds, [device_id])
+        except RuntimeError:
+            # 已停止
+            pass
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # 等待更多摄像头的帧一起分析
+            if len(self._pending) < settings.MOTION_BATCH_SIZE:
+                await asyncio.sleep(settings.MOTION_BATCH_WAIT)
+            self._dispatch()
+
+    def _dispatch(self):
+        """把等待的帧按分配的工作进程凑批，交给空闲的工作进程"""
+        batches: Dict[MotionWorker, List[Tuple[str, bytes, int, CameraMotion]]] = {}
+        for device_id in list(self._pending):
+            state = self._cameras.get(device_id)
+            if state is None:
+                del self._pending[device_id]
+                continue
+            if state.worker.busy:
+                continue
+            batch = batches.setdefault(state.worker, [])
+            if len(batch) >= settings.MOTION_BATCH_SIZE:
+                continue
+            payload, timestamp = self._pending.pop(device_id)
+            state.in_flight = True
+            batch.append((device_id, payload, timestamp, state))
+        for worker, batch in batches.items():
+            worker.busy = True
+            asyncio.ensure_future(self._analyze(worker, batch))
+
+    async def _analyze(self, worker: MotionWorker, batch: List[Tuple[str, bytes, int, CameraMotion]]):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                worker.executor, analyze_batch,
+                [(device_id, payload) for device_id, payload, _, _ in batch],
+                settings.MOTION_PIXEL_THRESHOLD, settings.MOTION_BACKGROUND_ALPHA
+            )
+        except Exception as e:
+            logger.error("运动检测失败: %s", e)
+            for _, _, _, state in batch:
+                state.in_flight = False
+            return
+        finally:
+            worker.busy = False
+            # 本工作进程空闲后立即处理积压的帧
+            if self._task is not None:
+                self._dispatch()
+        self.batches += 1
+
+        now = time.monotonic()
+        events = []
+        for (device_id, _, timestamp, state), (_, score) in zip(batch, results):
+            state.in_flight = False
+            if score is None:
+                self.undecodable += 1
+                continue
+            self.analyzed += 1
+            state.last_score = score
+            if score >= settings.MOTION_THRESHOLD:
+                if now >= state.active_until:
+                    events.append((device_id, score, timestamp))
+                state.active_until = now + settings.MOTION_COOLDOWN
+
+        for device_id, score, timestamp in events:
+            await self._notify(device_id, score, timestamp)
+
+    async def _notify(self, device_id: str, score: float, timestamp: int):
+        """向设备拥有者推送运动事件"""
+        self.events += 1
+        message = {
+            "type": "motion_detected",
+            "device_id": device_id,
+            "score": round(score, 4),
+            "frame_timestamp": timestamp,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        try:
+            for user_id in await device_acl.owners(device_id):
+                await websocket_manager.send_to_user(user_id, message)
+        except Exception as e:
+            logger.warning("推送运动事件失败: %s", e)
+
+    def stats(self) -> dict:
+        """获取检测统计"""
+        now = time.monotonic()
+        return {
+            "cameras": len(self._cameras),
+            "active_cameras": sum(1 for state in self._cameras.values() if now < state.active_until),
+            "pending": len(self._pending),
+            "workers": [worker.cameras for worker in self._workers],
+            "sampled": self.sampled,
+            "analyzed": self.analyzed,
+            "undecodable": self.undecodable,
+            "batches": self.batches,
+            "events": self.events
+        }
+
+
+# 全局运动检测器（每个worker一个）
+motion_detector = MotionDetector()
@@ -0,0 +1,133 @@
+from typing import Dict, Optional, Tuple
+from datetime import datetime
+import asyncio
+import logging
+
+from sqlalchemy import case, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.device import Device
+
+logger = logging.getLogger(__name__)
+
+# 每条UPDATE语句最多包含的设备数
+FLUSH_CHUNK_SIZE = 500
+
+
+class PresenceTracker:
+    """设备在线状态的内存表（写回式）
+
+    摄像头连接、断开和心跳只更新内存，后台任务按固定间隔把变化合并成
+    批量UPDATE写入 devices 表，避免每次心跳都访问MySQL。
+    API读取设备状态时优先使用内存中的实时状态。
+    """
+
+    def __init__(self, flush_interval: float = None):
+        self.flush_interval = flush_interval or settings.PRESENCE_FLUSH_INTERVAL
+        # 设备ID -> (是否在线, 最后活跃时间)
+        self._state: Dict[str, Tuple[bool, datetime]] = {}
+        # 等待写入数据库的变化
+        self._dirty: Dict[str, Tuple[bool, datetime]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+
+    def _set(self, device_id: str, is_online: bool):
+        entry = (is_online, datetime.utcnow())
+        self._state[device_id] = entry
+        self._dirty[device_id] = entry
+
+    def mark_online(self, device_id: str):
+        """设备上线"""
+        self._set(device_id, True)
+
+    def mark_offline(self, device_id: str):
+        """设备离线"""
+        self._set(device_id, False)
+
+    def touch(self, device_id: str):
+        """设备心跳"""
+        self._set(device_id, True)
+
+    def get(self, device_id: str) -> Optional[Tuple[bool, datetime]]:
+        """获取设备的实时状态，本worker没有记录时返回None"""
+        return self._state.get(device_id)
+
+    def resolve(self, device_id: str, is_online: bool, last_seen: Optional[datetime]) -> Tuple[bool, Optional[datetime]]:
+        """用实时状态覆盖数据库中读到的状态"""
+        entry = self._state.get(device_id)
+        if entry is None:
+            return is_online, last_seen
+        return entry
+
+    async def start(self):
+        """启动后台写入任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止后台写入任务并写入剩余变化"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("写入设备在线状态失败: %s", e)
+
+    async def flush(self):
+        """将累积的变化合并为批量UPDATE写入数据库"""
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+
+        try:
+            async with AsyncSessionLocal() as db:
+                items = list(batch.items())
+                for start in range(0, len(items), FLUSH_CHUNK_SIZE):
+                    chunk = dict(items[start:start + FLUSH_CHUNK_SIZE])
+                    await db.execute(
+                        update(Device)
+                        .where(Device.device_id.in_(chunk.keys()))
+                        .values(
+                            is_online=case({k: v[0] for k, v in chunk.items()}, value=Device.device_id),
+                            last_seen=case({k: v[1] for k, v in chunk.items()}, value=Device.device_id)
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                await db.commit()
+        except Exception:
+            # 写入失败时放回，较新的变化优先
+            for device_id, entry in batch.items():
+                self._dirty.setdefault(device_id, entry)
+            raise
+
+        self.flushes += 1
+        self.rows_written += len(batch)
+
+        # 已写入的离线设备不再需要保留在内存中
+        for device_id, entry in batch.items():
+            if not entry[0] and self._state.get(device_id) == entry and device_id not in self._dirty:
+                del self._state[device_id]
+
+    def stats(self) -> dict:
+        """获取统计信息"""
+        return {
+            "tracked_devices": len(self._state),
+            "pending_updates": len(self._dirty),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written
+        }
+
+
+# 全局在线状态表（每个worker一个）
+presence_tracker = PresenceTracker()
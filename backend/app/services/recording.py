@@ -0,0 +1,443 @@
+"""
+摄像头录像（分段存储）
+
+每个摄像头一个写入线程，事件循环只负责把收到的二进制帧放入队列，不做任何磁盘I/O。
+录像按固定时长切分为分段，每个分段从关键帧开始，可以独立播放：
+
+    UPLOAD_DIR/recordings/{device_id}/{start_ms}.seg   收到的原始二进制帧（格式见 app.websocket.protocol）依次拼接
+    UPLOAD_DIR/recordings/{device_id}/{start_ms}.idx   每帧一条定长索引记录
+
+索引记录格式（网络字节序，18字节）：
+
+    | timestamp_ms (8B) | offset (4B) | size (4B) | frame_type (1B) | flags (1B) |
+
+索引按写入顺序排列，时间戳单调递增，可直接二分查找任意时间点对应的文件偏移。
+每隔 RECORDING_RETENTION_INTERVAL 秒检查一次磁盘预算，所有录像的总大小超过 RECORDING_MAX_BYTES 时，
+从最旧的已完成分段开始删除。多个worker共用录像目录，其他worker正在写入的分段不在本worker的写入器中，
+因此最近一个分段时长内仍有写入的分段一律不删除。
+"""
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+from app.core.config import settings
+from app.websocket.protocol import BinaryFrame, FLAG_KEYFRAME
+
+logger = logging.getLogger(__name__)
+
+# 索引记录格式: 时间戳、偏移、长度、帧类型、标志位
+INDEX_ENTRY = struct.Struct("!QIIBB")
+INDEX_ENTRY_SIZE = INDEX_ENTRY.size
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+# 一次最多合并写入的帧数
+WRITE_BATCH_SIZE = 256
+
+# 设备ID只允许作为单级目录名的字符
+_DEVICE_ID_PATTERN = re.compile(r"[A-Za-z0-9_.\-]+")
+
+
+class SegmentInfo(NamedTuple):
+    """录像分段信息"""
+    device_id: str
+    start_ms: int
+    path: str
+    index_path: str
+    size: int
+    frame_count: int
+    mtime: float
+    complete: bool
+
+
+class IndexEntry(NamedTuple):
+    """索引记录"""
+    timestamp: int
+    offset: int
+    size: int
+    frame_type: int
+    flags: int
+
+    @property
+    def is_keyframe(self) -> bool:
+        return bool(self.flags & FLAG_KEYFRAME)
+
+
+def recordings_root() -> str:
+    """录像根目录"""
+    return os.path.join(settings.UPLOAD_DIR, "recordings")
+
+
+def device_directory(device_id: str) -> str:
+    """设备的录像目录，设备ID不能作为目录名时抛出ValueError"""
+    if not _DEVICE_ID_PATTERN.fullmatch(device_id) or device_id in (".", ".."):
+        raise ValueError(f"设备ID不能用于录像目录: {device_id!r}")
+    return os.path.join(recordings_root(), device_id)
+
+
+def segment_path(device_id: str, segment_id: str) -> Optional[str]:
+    """分段文件路径，分段ID无效时返回None"""
+    if not segment_id.isdigit():
+        return None
+    try:
+        return os.path.join(device_directory(device_id), f"{segment_id}{SEGMENT_SUFFIX}")
+    except ValueError:
+        return None
+
+
+def _map_index(index_path: str) -> Optional[mmap.mmap]:
+    """只读映射索引文件，文件为空时返回None"""
+    with open(index_path, "rb") as handle:
+        if os.fstat(handle.fileno()).st_size < INDEX_ENTRY_SIZE:
+            return None
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def index_bounds(index_path: str) -> Optional[Tuple[IndexEntry, IndexEntry]]:
+    """读取分段的第一条和最后一条索引记录"""
+    mapped = _map_index(index_path)
+    if mapped is None:
+        return None
+    with mapped:
+        count = len(mapped) // INDEX_ENTRY_SIZE
+        first = IndexEntry(*INDEX_ENTRY.unpack_from(mapped, 0))
+        last = IndexEntry(*INDEX_ENTRY.unpack_from(mapped, (count - 1) * INDEX_ENTRY_SIZE))
+    return first, last
+
+
+def seek_keyframe(index_path: str, timestamp: int) -> Optional[IndexEntry]:
+    """查找时间戳之前（含）最近的关键帧，二分查找只访问映射中的少量页面"""
+    mapped = _map_index(index_path)
+    if mapped is None:
+        return None
+    with mapped:
+        count = len(mapped) // INDEX_ENTRY_SIZE
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_ENTRY.unpack_from(mapped, middle * INDEX_ENTRY_SIZE)[0] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        # 分段从关键帧开始，早于分段开始时间时返回第一帧
+        for position in range(max(low - 1, 0), -1, -1):
+            entry = IndexEntry(*INDEX_ENTRY.unpack_from(mapped, position * INDEX_ENTRY_SIZE))
+            if entry.is_keyframe:
+                return entry
+    return None
+
+
+class SegmentWriter:
+    """单个摄像头的录像写入器（独立线程）"""
+
+    def __init__(self, device_id: str, manager: "RecordingManager"):
+        self.device_id = device_id
+        self.directory = device_directory(device_id)
+        self.manager = manager
+        self.segment_ms = settings.RECORDING_SEGMENT_SECONDS * 1000
+        self._queue: "queue.Queue[Optional[Tuple[bytes, int, int, int]]]" = queue.Queue(settings.RECORDING_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{device_id}", daemon=True)
+        self._waiting_keyframe = False
+        self.closed = False
+        # 写入失败的时间（monotonic），用于推迟重建写入器
+        self.failed_at: Optional[float] = None
+
+        # 写入线程内部状态
+        self._data = None
+        self._index = None
+        self._segment_start = 0
+        self._offset = 0
+        self.active_path: Optional[str] = None
+
+        # 统计信息
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.dropped_frames = 0
+        self.segments = 0
+
+    def start(self):
+        """启动写入线程"""
+        self._thread.start()
+
+    def put(self, frame: BinaryFrame):
+        """帧入队（在事件循环中调用，不阻塞）"""
+        if self.closed:
+            return
+        # 之前丢过帧，等待下一个关键帧，保证录像可以解码
+        if self._waiting_keyframe and not frame.is_keyframe:
+            self.dropped_frames += 1
+            return
+        try:
+            self._queue.put_nowait((frame.raw, frame.timestamp, frame.frame_type, FLAG_KEYFRAME if frame.is_keyframe else 0))
+            self._waiting_keyframe = False
+        except queue.Full:
+            self.dropped_frames += 1
+            self._waiting_keyframe = True
+
+    def close(self):
+        """写完已排队的帧后结束当前分段（不阻塞）"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            # 队列已满，写入线程处理完剩余的帧后会检查 closed 并退出
+            pass
+
+    def join(self, timeout: float = None):
+        """等待写入线程结束"""
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < WRITE_BATCH_SIZE and batch[-1] is not None:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                for item in batch:
+                    if item is None:
+                        self._close_segment()
+                        return
+                    self._write(*item)
+
+                # 每批只刷新一次缓冲区
+                if self._data is not None:
+                    self._data.flush()
+                    self._index.flush()
+                if self.closed and self._queue.empty():
+                    self._close_segment()
+                    return
+        except Exception as e:
+            logger.error("设备 %s 录像写入失败: %s", self.device_id, e)
+            self.failed_at = time.monotonic()
+            self.closed = True
+            self._close_segment()
+
+    def _write(self, raw: bytes, timestamp: int, frame_type: int, flags: int):
+        is_keyframe = bool(flags & FLAG_KEYFRAME)
+        if self._data is None:
+            # 分段必须从关键帧开始
+            if not is_keyframe:
+                self.dropped_frames += 1
+                return
+            self._open_segment(timestamp)
+        elif is_keyframe and timestamp - self._segment_start >= self.segment_ms:
+            self._close_segment()
+            self._open_segment(timestamp)
+
+        self._index.write(INDEX_ENTRY.pack(timestamp, self._offset, len(raw), frame_type, flags))
+        self._data.write(raw)
+        self._offset += len(raw)
+        self.frames_written += 1
+        self.bytes_written += len(raw)
+
+    def _open_segment(self, timestamp: int):
+        start = timestamp
+        while os.path.exists(os.path.join(self.directory, f"{start}{SEGMENT_SUFFIX}")):
+            start += 1
+        path = os.path.join(self.directory, f"{start}{SEGMENT_SUFFIX}")
+        self._data = open(path, "wb", buffering=settings.RECORDING_BUFFER_SIZE)
+        self._index = open(os.path.join(self.directory, f"{start}{INDEX_SUFFIX}"), "wb")
+        self._segment_start = timestamp
+        self._offset = 0
+        self.active_path = path
+        self.segments += 1
+
+    def _close_segment(self):
+        self.active_path = None
+        for handle in (self._data, self._index):
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception as e:
+                    logger.error("设备 %s 录像文件关闭失败: %s", self.device_id, e)
+        self._data = None
+        self._index = None
+
+    def retry_pending(self) -> bool:
+        """写入失败后是否仍在等待重试"""
+        return self.failed_at is not None and time.monotonic() - self.failed_at < settings.RECORDING_RETRY_INTERVAL
+
+    def stats(self) -> dict:
+        """获取写入统计"""
+        return {
+            "device_id": self.device_id,
+            "queue_depth": self._queue.qsize(),
+            "frames_written": self.frames_written,
+            "bytes_written": self.bytes_written,
+            "dropped_frames": self.dropped_frames,
+            "segments": self.segments,
+            "waiting_keyframe": self._waiting_keyframe
+        }
+
+
+class RecordingManager:
+    """管理所有摄像头的录像写入器和磁盘预算"""
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else settings.RECORDING_MAX_BYTES
+        self.writers: Dict[str, SegmentWriter] = {}
+        # 设备ID不能作为目录名的设备（只提示一次）
+        self._rejected: set = set()
+        self._retention_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.deleted_segments = 0
+
+    async def start(self):
+        """启动定时清理任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止定时清理任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.RECORDING_RETENTION_INTERVAL)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.enforce_retention)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("清理录像失败: %s", e)
+
+    def write(self, device_id: str, frame: BinaryFrame):
+        """录制一帧（不阻塞）"""
+        writer = self.writers.get(device_id)
+        if writer is None or writer.closed:
+            if device_id in self._rejected:
+                return
+            # 写入失败后保留失败的写入器并丢帧，RECORDING_RETRY_INTERVAL 秒后再重建，避免每帧都创建写入线程
+            if writer is not None and writer.retry_pending():
+                writer.dropped_frames += 1
+                return
+            try:
+                writer = SegmentWriter(device_id, self)
+            except ValueError as e:
+                self._rejected.add(device_id)
+                logger.warning("无法录像: %s", e)
+                return
+            writer.start()
+            self.writers[device_id] = writer
+        writer.put(frame)
+
+    def close_device(self, device_id: str):
+        """摄像头断开，结束其当前分段"""
+        writer = self.writers.pop(device_id, None)
+        if writer is not None:
+            writer.close()
+
+    def close_all(self, timeout: float = 10.0):
+        """结束所有写入器并等待写入完成（阻塞，应在线程池中调用）"""
+        writers = list(self.writers.values())
+        self.writers.clear()
+        for writer in writers:
+            writer.close()
+        for writer in writers:
+            writer.join(timeout)
+
+    def active_paths(self) -> set:
+        """正在写入的分段文件"""
+        return {writer.active_path for writer in list(self.writers.values()) if writer.active_path}
+
+    def list_segments(self, device_id: str) -> List[SegmentInfo]:
+        """按开始时间列出设备的录像分段"""
+        try:
+            directory = device_directory(device_id)
+        except ValueError:
+            return []
+        active = self.active_paths()
+        segments = []
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return []
+        for entry in entries:
+            name = entry.name
+            if not name.endswith(SEGMENT_SUFFIX) or not name[:-len(SEGMENT_SUFFIX)].isdigit():
+                continue
+            index_path = entry.path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+            try:
+                stat = entry.stat()
+                index_stat = os.stat(index_path)
+            except FileNotFoundError:
+                continue
+            segments.append(SegmentInfo(
+                device_id=device_id,
+                start_ms=int(name[:-len(SEGMENT_SUFFIX)]),
+                path=entry.path,
+                index_path=index_path,
+                size=stat.st_size,
+                frame_count=index_stat.st_size // INDEX_ENTRY_SIZE,
+                # 最后写入时间（数据和索引文件中较晚的一个）
+                mtime=max(stat.st_mtime, index_stat.st_mtime),
+                complete=entry.path not in active
+            ))
+        segments.sort(key=lambda segment: segment.start_ms)
+        return segments
+
+    def enforce_retention(self):
+        """总大小超过磁盘预算时删除最旧的已完成分段（阻塞，由定时任务在线程池中调用）
+
+        本worker正在写入的分段，以及最近一个分段时长内仍有写入的分段（可能由其他worker写入）不删除。
+        """
+        if self.max_bytes <= 0:
+            return
+        with self._retention_lock:
+            root = recordings_root()
+            active = self.active_paths()
+            recent = time.time() - settings.RECORDING_SEGMENT_SECONDS
+            total = 0
+            candidates = []
+            try:
+                devices = [entry.name for entry in os.scandir(root) if entry.is_dir()]
+            except FileNotFoundError:
+                return
+            for device_id in devices:
+                for segment in self.list_segments(device_id):
+                    size = segment.size + segment.frame_count * INDEX_ENTRY_SIZE
+                    total += size
+                    if segment.path not in active and segment.mtime < recent:
+                        candidates.append((segment.mtime, size, segment))
+
+            candidates.sort(key=lambda item: item[0])
+            for _, size, segment in candidates:
+                if total <= self.max_bytes:
+                    break
+                for path in (segment.path, segment.index_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                self.deleted_segments += 1
+
+    def stats(self) -> dict:
+        """获取录像统计"""
+        return {
+            "enabled": settings.RECORDING_ENABLED,
+            "writers": [writer.stats() for writer in list(self.writers.values())],
+            "deleted_segments": self.deleted_segments
+        }
+
+
+# 全局录像管理器（每个worker一个）
+recording_manager = RecordingManager()
@@ -0,0 +1,162 @@
+"""
+多清晰度转码（共享渲染缓存）
+
+摄像头只按最高清晰度推流一次，服务器为请求了较低清晰度的查看端生成 low/medium 版本：
+每帧只解码一次，每种清晰度无论有多少订阅者都只缩放、编码一次，没有订阅者的清晰度不做处理。
+缩放和编码在线程池中执行（OpenCV运算期间释放GIL），不阻塞事件循环。
+
+每个摄像头同一时间只有一个转码任务，任务进行中到达的新帧只保留最新一帧。
+只支持图像格式（如JPEG）的视频帧，无法解码的摄像头改为直接转发原始帧。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple
+import asyncio
+import logging
+import time
+
+from app.core.config import settings
+from app.websocket.protocol import FRAME_HEADER_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 清晰度 -> (最大宽度, JPEG质量)；high 为摄像头原始画面，直接转发
+RENDITIONS: Dict[str, Tuple[int, int]] = {
+    "low": (320, 60),
+    "medium": (640, 75),
+}
+QUALITY_HIGH = "high"
+
+
+def normalize_quality(quality: Optional[str]) -> Optional[str]:
+    """需要转码的清晰度，原始画面返回None"""
+    return quality if quality in RENDITIONS else None
+
+
+def render(data: bytes, qualities: Tuple[str, ...]) -> Optional[Dict[str, bytes]]:
+    """解码一次，生成各清晰度的完整二进制帧（沿用原帧头部），无法解码时返回None"""
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8, offset=FRAME_HEADER_SIZE), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+
+    header = data[:FRAME_HEADER_SIZE]
+    height, width = image.shape[:2]
+    frames = {}
+    for quality in qualities:
+        max_width, jpeg_quality = RENDITIONS[quality]
+        resized = image
+        if width > max_width:
+            resized = cv2.resize(image, (max_width, max(1, round(height * max_width / width))),
+                                 interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        if ok:
+            frames[quality] = header + encoded.tobytes()
+    return frames
+
+
+class RenditionService:
+    """多清晰度转码调度（事件循环侧）"""
+
+    def __init__(self):
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # 正在转码的摄像头
+        self._busy: Set[str] = set()
+        # 等待转码的最新帧: 设备ID -> (帧数据, 是否关键帧, 清晰度 -> 查看端连接)
+        self._pending: Dict[str, Tuple[bytes, bool, Dict[str, list]]] = {}
+        # 无法解码、改为直接转发的摄像头
+        self._passthrough: Set[str] = set()
+
+        # 统计信息
+        self.jobs = 0
+        self.encoded = 0
+        self.superseded = 0
+        self.render_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._pool is not None
+
+    def start(self):
+        """创建转码线程池"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(settings.RENDITION_WORKERS, thread_name_prefix="rendition")
+
+    def stop(self):
+        """关闭转码线程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        self._busy.clear()
+        self._pending.clear()
+
+    def forget(self, device_id: str):
+        """摄像头断开，丢弃其状态"""
+        self._pending.pop(device_id, None)
+        self._passthrough.discard(device_id)
+
+    def submit(self, device_id: str, data: bytes, is_keyframe: bool, groups: Dict[str, list]):
+        """为订阅了各清晰度的查看端转码一帧（groups: 清晰度 -> 查看端连接记录）"""
+        if device_id in self._passthrough or self._pool is None:
+            self._deliver(groups, {}, data, is_keyframe)
+            return
+        if device_id in self._busy:
+            if device_id in self._pending:
+                self.superseded += 1
+            self._pending[device_id] = (data, is_keyframe, groups)
+            return
+        self._start(device_id, data, is_keyframe, groups)
+
+    def _start(self, device_id: str, data: bytes, is_keyframe: bool, groups: Dict[str, list]):
+        self._busy.add(device_id)
+        self.jobs += 1
+        started = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(self._pool, render, data, tuple(groups))
+        future.add_done_callback(
+            lambda done: self._on_done(device_id, data, is_keyframe, groups, done, started)
+        )
+
+    def _on_done(self, device_id: str, data: bytes, is_keyframe: bool, groups: Dict[str, list],
+                 future: asyncio.Future, started: float):
+        self._busy.discard(device_id)
+        self.render_ms += (time.perf_counter() - started) * 1000
+        try:
+            frames = future.result()
+        except Exception as e:
+            logger.error("设备 %s 转码失败: %s", device_id, e)
+            frames = None
+
+        if frames is None:
+            # 无法解码（如H.264），之后直接转发原始帧
+            self._passthrough.add(device_id)
+            frames = {}
+        else:
+            self.encoded += len(frames)
+        self._deliver(groups, frames, data, is_keyframe)
+
+        pending = self._pending.pop(device_id, None)
+        if pending is not None:
+            self.submit(device_id, *pending)
+
+    @staticmethod
+    def _deliver(groups: Dict[str, list], frames: Dict[str, bytes], original: bytes, is_keyframe: bool):
+        for quality, records in groups.items():
+            frame = frames.get(quality, original)
+            for record in records:
+                record.queue.put_frame(frame, is_keyframe)
+
+    def stats(self) -> dict:
+        """获取转码统计"""
+        return {
+            "enabled": self.enabled,
+            "jobs": self.jobs,
+            "encoded": self.encoded,
+            "superseded": self.superseded,
+            "passthrough_devices": len(self._passthrough),
+            "avg_render_ms": round(self.render_ms / self.jobs, 2) if self.jobs else 0
+        }
+
+
+# 全局转码服务（每个worker一个）
+rendition_service = RenditionService()
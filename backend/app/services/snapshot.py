@@ -0,0 +1,145 @@
+"""
+摄像头快照缓存
+
+帧转发路径上只保存每个摄像头最近的视频关键帧（直接引用收到的原始缓冲区，不复制），
+缩略图在第一次请求时才在线程池中编码，之后复用到下一个关键帧到达为止；
+同一关键帧的并发请求共享同一次编码。
+
+所有摄像头的关键帧和缩略图总大小不超过 SNAPSHOT_CACHE_BYTES，超出时淘汰最久未更新/访问的摄像头。
+快照只保存在摄像头连接所在的worker中；只支持图像格式（如JPEG）的视频帧。
+"""
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+import logging
+
+from app.core.config import settings
+from app.websocket.protocol import BinaryFrame, FRAME_HEADER_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def encode_thumbnail(data: bytes, width: int, quality: int) -> Optional[bytes]:
+    """从原始帧生成JPEG缩略图，无法解码时返回None"""
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8, offset=FRAME_HEADER_SIZE), cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    height, source_width = image.shape[:2]
+    if source_width > width:
+        image = cv2.resize(image, (width, max(1, round(height * width / source_width))),
+                           interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else None
+
+
+class Snapshot:
+    """单个摄像头最近的关键帧"""
+
+    __slots__ = ("raw", "seq", "timestamp", "thumbnail", "encoding", "failed")
+
+    def __init__(self, frame: BinaryFrame):
+        self.raw = frame.raw
+        self.seq = frame.seq
+        self.timestamp = frame.timestamp
+        self.thumbnail: Optional[bytes] = None
+        self.encoding: Optional[asyncio.Future] = None
+        self.failed = False
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.timestamp}-{self.seq}"'
+
+    @property
+    def size(self) -> int:
+        return len(self.raw) + len(self.thumbnail or b"")
+
+
+class SnapshotCache:
+    """按总字节数限制的快照LRU缓存"""
+
+    def __init__(self):
+        self._snapshots: "OrderedDict[str, Snapshot]" = OrderedDict()
+        self.total_bytes = 0
+
+        # 统计信息
+        self.updates = 0
+        self.encoded = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def update(self, device_id: str, frame: BinaryFrame):
+        """帧转发路径调用：保存视频关键帧（不解码）"""
+        old = self._snapshots.pop(device_id, None)
+        if old is not None:
+            self.total_bytes -= old.size
+        snapshot = Snapshot(frame)
+        self._snapshots[device_id] = snapshot
+        self.total_bytes += snapshot.size
+        self.updates += 1
+        self._evict()
+
+    def peek(self, device_id: str) -> Optional[Snapshot]:
+        """获取最近的关键帧（不编码缩略图）"""
+        snapshot = self._snapshots.get(device_id)
+        if snapshot is not None:
+            self._snapshots.move_to_end(device_id)
+        return snapshot
+
+    async def thumbnail(self, device_id: str, snapshot: Snapshot) -> Optional[bytes]:
+        """获取快照的缩略图，第一次请求时编码"""
+        if snapshot.thumbnail is not None:
+            self.hits += 1
+            return snapshot.thumbnail
+        if snapshot.failed:
+            return None
+
+        if snapshot.encoding is None:
+            snapshot.encoding = asyncio.get_running_loop().run_in_executor(
+                None, encode_thumbnail, snapshot.raw, settings.SNAPSHOT_WIDTH, settings.SNAPSHOT_QUALITY
+            )
+        try:
+            thumbnail = await asyncio.shield(snapshot.encoding)
+        except Exception as e:
+            logger.warning("设备 %s 快照编码失败: %s", device_id, e)
+            thumbnail = None
+
+        if thumbnail is None:
+            snapshot.failed = True
+        elif snapshot.thumbnail is None:
+            snapshot.thumbnail = thumbnail
+            self.encoded += 1
+            # 编码期间快照可能已被替换或淘汰，只为仍在缓存中的快照计入大小
+            if self._snapshots.get(device_id) is snapshot:
+                self.total_bytes += len(thumbnail)
+                self._evict()
+        return thumbnail
+
+    def forget(self, device_id: str):
+        """删除设备的快照"""
+        snapshot = self._snapshots.pop(device_id, None)
+        if snapshot is not None:
+            self.total_bytes -= snapshot.size
+
+    def _evict(self):
+        while self.total_bytes > settings.SNAPSHOT_CACHE_BYTES and len(self._snapshots) > 1:
+            _, snapshot = self._snapshots.popitem(last=False)
+            self.total_bytes -= snapshot.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """获取缓存统计"""
+        return {
+            "cameras": len(self._snapshots),
+            "total_bytes": self.total_bytes,
+            "updates": self.updates,
+            "encoded": self.encoded,
+            "hits": self.hits,
+            "evictions": self.evictions
+        }
+
+
+# 全局快照缓存（每个worker一个）
+snapshot_cache = SnapshotCache()
@@ -0,0 +1,88 @@
+"""
+启动后预热
+
+worker开始接受请求后再加载重型子系统，避免拖慢滚动发布时的重启：
+- 建立首个数据库连接
+- 创建运动检测和AI推理进程池（工作进程中导入OpenCV/TensorFlow并加载模型）
+- 启用转码时在线程中导入OpenCV/NumPy
+
+预热完成前到达的帧不做分析（服务未启动时 submit 直接返回），转码和快照按需导入，不受影响。
+"""
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.services.inference import inference_service
+from app.services.motion import motion_detector
+
+logger = logging.getLogger(__name__)
+
+
+def import_media_libraries():
+    """导入转码和快照使用的OpenCV和NumPy"""
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+
+
+class WarmupRunner:
+    """按顺序执行预热步骤，单个步骤失败不影响其他步骤"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.state = "pending"
+        self.durations: Dict[str, float] = {}
+        self.failed: List[str] = []
+
+    def start(self):
+        """在后台开始预热（延迟 WARMUP_DELAY 秒，先让worker开始接受请求）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _steps(self) -> List[Tuple[str, Callable[[], Awaitable]]]:
+        steps = [("database", self._connect_database)]
+        if settings.MOTION_ENABLED:
+            steps.append(("motion", motion_detector.start))
+        if settings.AI_INFERENCE_ENABLED:
+            steps.append(("inference", inference_service.start))
+        if settings.RENDITION_ENABLED:
+            steps.append(("media", self._import_media))
+        return steps
+
+    async def _run(self):
+        await asyncio.sleep(settings.WARMUP_DELAY)
+        self.state = "running"
+        for name, step in self._steps():
+            started = time.perf_counter()
+            try:
+                await step()
+            except Exception as e:
+                self.failed.append(name)
+                logger.warning("预热 %s 失败: %s", name, e)
+            self.durations[name] = round((time.perf_counter() - started) * 1000, 1)
+        self.state = "done"
+        logger.info("预热完成", extra={"durations_ms": self.durations})
+
+    async def _connect_database(self):
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def _import_media(self):
+        await asyncio.get_running_loop().run_in_executor(None, import_media_libraries)
+
+    def stats(self) -> dict:
+        return {"state": self.state, "durations_ms": self.durations, "failed": self.failed}
+
+
+# 全局预热（每个worker一个）
+warmup_runner = WarmupRunner()
@@ -0,0 +1,391 @@
+"""
+WebSocket集群模式
+
+多个worker/节点通过消息代理（Redis或进程内实现）共享在线状态并路由消息：
+- 在线状态注册表：记录每个 (范围, 键) 在哪些worker上有本地连接，
+  范围为 device（设备所有连接）、viewer（设备的查看端）、user（用户连接）。
+- 消息路由：每个worker订阅自己的路由频道，只向确实持有目标连接的远端worker发布消息；
+  目标连接全部在本worker时完全不经过Redis。
+- 在线状态的变化通过广播频道推送，各worker在内存中维护远端在线表，
+  查询设备是否在线不需要访问Redis。
+"""
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from collections import deque
+import asyncio
+import json
+import logging
+import struct
+import time
+import uuid
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_CHANNEL = "ws:presence"
+BROADCAST_CHANNEL = "ws:broadcast"
+ROUTE_CHANNEL = "ws:route:{worker_id}"
+PRESENCE_KEY = "ws:presence:{scope}:{key}"
+WORKER_KEY = "ws:worker:{worker_id}"
+
+# 路由消息类型
+KIND_TEXT = b"T"
+KIND_FRAME = b"F"
+
+# 二进制帧路由头部: 是否关键帧、设备ID长度
+FRAME_ROUTE_HEADER = struct.Struct("!?H")
+
+
+class ClusterBroker(ABC):
+    """集群消息代理接口"""
+
+    @abstractmethod
+    async def publish(self, channel: str, data: bytes):
+        """发布消息到频道"""
+
+    @abstractmethod
+    async def subscribe(self, channels: List[str]) -> AsyncIterator[Tuple[str, bytes]]:
+        """订阅频道，返回 (频道, 数据) 的异步迭代器；返回时订阅已生效"""
+
+    @abstractmethod
+    async def set_presence(self, scope: str, key: str, worker_id: str, present: bool):
+        """记录或清除某个worker上的在线状态"""
+
+    @abstractmethod
+    async def load_presence(self) -> List[Tuple[str, str, str]]:
+        """加载在线状态快照: [(范围, 键, workerID)]"""
+
+    @abstractmethod
+    async def heartbeat(self, worker_id: str, ttl: int):
+        """续约worker存活标记"""
+
+    @abstractmethod
+    async def is_worker_alive(self, worker_id: str) -> bool:
+        """worker是否仍然存活"""
+
+    async def close(self):
+        pass
+
+
+class RedisBroker(ClusterBroker):
+    """基于Redis的消息代理"""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str, password: Optional[str] = None) -> "RedisBroker":
+        import redis.asyncio as aioredis
+        return cls(aioredis.from_url(url, password=password or None, decode_responses=False))
+
+    async def publish(self, channel: str, data: bytes):
+        await self.client.publish(channel, data)
+
+    async def subscribe(self, channels: List[str]) -> AsyncIterator[Tuple[str, bytes]]:
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(*channels)
+        return self._iterate(pubsub)
+
+    async def _iterate(self, pubsub) -> AsyncIterator[Tuple[str, bytes]]:
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                yield channel, message["data"]
+        finally:
+            await pubsub.close()
+
+    async def set_presence(self, scope: str, key: str, worker_id: str, present: bool):
+        name = PRESENCE_KEY.format(scope=scope, key=key)
+        if present:
+            await self.client.sadd(name, worker_id)
+        else:
+            await self.client.srem(name, worker_id)
+
+    async def load_presence(self) -> List[Tuple[str, str, str]]:
+        entries = []
+        async for name in self.client.scan_iter(match=PRESENCE_KEY.format(scope="*", key="*")):
+            if isinstance(name, bytes):
+                name = name.decode()
+            _, _, scope, key = name.split(":", 3)
+            for worker_id in await self.client.smembers(name):
+                if isinstance(worker_id, bytes):
+                    worker_id = worker_id.decode()
+                entries.append((scope, key, worker_id))
+        return entries
+
+    async def heartbeat(self, worker_id: str, ttl: int):
+        await self.client.set(WORKER_KEY.format(worker_id=worker_id), b"1", ex=ttl)
+
+    async def is_worker_alive(self, worker_id: str) -> bool:
+        return bool(await self.client.exists(WORKER_KEY.format(worker_id=worker_id)))
+
+    async def close(self):
+        await self.client.close()
+
+
+class LocalBroker(ClusterBroker):
+    """进程内消息代理，多个管理器共享同一实例即可模拟多worker（用于测试和单机开发）"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        self._presence: Dict[Tuple[str, str], Set[str]] = {}
+        self._workers: Dict[str, float] = {}
+
+    async def publish(self, channel: str, data: bytes):
+        for queue in self._subscribers.get(channel, []):
+            queue.put_nowait((channel, data))
+
+    async def subscribe(self, channels: List[str]) -> AsyncIterator[Tuple[str, bytes]]:
+        queue: asyncio.Queue = asyncio.Queue()
+        for channel in channels:
+            self._subscribers.setdefault(channel, []).append(queue)
+        return self._iterate(queue, channels)
+
+    async def _iterate(self, queue: asyncio.Queue, channels: List[str]) -> AsyncIterator[Tuple[str, bytes]]:
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            for channel in channels:
+                self._subscribers[channel].remove(queue)
+
+    async def set_presence(self, scope: str, key: str, worker_id: str, present: bool):
+        workers = self._presence.setdefault((scope, key), set())
+        if present:
+            workers.add(worker_id)
+        else:
+            workers.discard(worker_id)
+            if not workers:
+                del self._presence[(scope, key)]
+
+    async def load_presence(self) -> List[Tuple[str, str, str]]:
+        return [(scope, key, worker_id)
+                for (scope, key), workers in self._presence.items()
+                for worker_id in workers]
+
+    async def heartbeat(self, worker_id: str, ttl: int):
+        self._workers[worker_id] = time.monotonic() + ttl
+
+    async def is_worker_alive(self, worker_id: str) -> bool:
+        return self._workers.get(worker_id, 0) > time.monotonic()
+
+    def kill_worker(self, worker_id: str):
+        """模拟worker崩溃（不清理在线状态）"""
+        self._workers.pop(worker_id, None)
+
+
+TextHandler = Callable[[str, str, str], Awaitable[None]]
+FrameHandler = Callable[[str, bytes, bool], None]
+
+
+class ClusterBackplane:
+    """WebSocket集群背板：维护远端在线表并在worker之间路由消息"""
+
+    def __init__(self, broker: ClusterBroker, on_text: TextHandler, on_frame: FrameHandler,
+                 worker_id: str = None):
+        self.broker = broker
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.on_text = on_text
+        self.on_frame = on_frame
+
+        # 远端在线表: (范围, 键) -> worker集合
+        self.remote: Dict[Tuple[str, str], Set[str]] = {}
+        # 本地在线集合，用于关闭时清理
+        self.local: Set[Tuple[str, str]] = set()
+
+        # 出站操作队列，保证同步代码中也能非阻塞地发布：
+        # 控制操作（在线状态、文本消息）不丢弃并严格按入队顺序发布，视频帧队列有界，满时丢弃
+        self._control: Deque[tuple] = deque()
+        self._frames: Deque[tuple] = deque()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.dropped_frames = 0
+
+    async def start(self):
+        """启动背板"""
+        await self.broker.heartbeat(self.worker_id, self._worker_ttl())
+        # 先订阅再加载快照，避免遗漏加载期间的在线状态变化
+        listener = await self.broker.subscribe([
+            ROUTE_CHANNEL.format(worker_id=self.worker_id),
+            PRESENCE_CHANNEL,
+            BROADCAST_CHANNEL
+        ])
+        for scope, key, worker_id in await self.broker.load_presence():
+            if worker_id != self.worker_id and await self.broker.is_worker_alive(worker_id):
+                self.remote.setdefault((scope, key), set()).add(worker_id)
+
+        self._tasks = [
+            asyncio.create_task(self._listen(listener)),
+            asyncio.create_task(self._drain_outbox()),
+            asyncio.create_task(self._keepalive())
+        ]
+
+    async def stop(self):
+        """停止背板并清理本worker的在线状态"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for scope, key in self.local:
+            await self.broker.set_presence(scope, key, self.worker_id, False)
+            await self._publish_presence(scope, key, False)
+        self.local.clear()
+        await self.broker.close()
+
+    def _worker_ttl(self) -> int:
+        return settings.WS_HEARTBEAT_INTERVAL * 3
+
+    # ---- 在线状态 ----
+
+    def set_local_presence(self, scope: str, key: str, present: bool):
+        """本地在线状态变化（0->1 或 1->0），异步同步到集群"""
+        if present:
+            self.local.add((scope, key))
+        else:
+            self.local.discard((scope, key))
+        self._enqueue(("presence", scope, key, present), force=True)
+
+    def remote_workers(self, scope: str, key: str) -> Set[str]:
+        """持有目标连接的远端worker"""
+        return self.remote.get((scope, key), set())
+
+    def is_present(self, scope: str, key: str) -> bool:
+        """目标在集群中其他worker上是否在线"""
+        return bool(self.remote.get((scope, key)))
+
+    # ---- 路由 ----
+
+    def route_text(self, scope: str, key: str, text: str):
+        """将文本消息路由到持有目标连接的远端worker"""
+        workers = self.remote.get((scope, key))
+        if not workers:
+            return
+        data = KIND_TEXT + json.dumps({"scope": scope, "key": key, "text": text}).encode()
+        for worker_id in workers:
+            self._enqueue(("publish", ROUTE_CHANNEL.format(worker_id=worker_id), data), force=True)
+
+    def broadcast_text(self, text: str):
+        """广播文本消息到所有其他worker"""
+        data = KIND_TEXT + json.dumps({"scope": "all", "key": self.worker_id, "text": text}).encode()
+        self._enqueue(("publish", BROADCAST_CHANNEL, data), force=True)
+
+    def route_frame(self, device_id: str, data: bytes, is_keyframe: bool):
+        """将二进制帧路由到有该设备查看端的远端worker（出站队列满时丢弃）"""
+        workers = self.remote.get(("viewer", device_id))
+        if not workers:
+            return
+        device = device_id.encode()
+        payload = KIND_FRAME + FRAME_ROUTE_HEADER.pack(is_keyframe, len(device)) + device + data
+        for worker_id in workers:
+            self._enqueue(("publish", ROUTE_CHANNEL.format(worker_id=worker_id), payload))
+
+    def _enqueue(self, op: tuple, force: bool = False):
+        if force:
+            self._control.append(op)
+        elif len(self._frames) >= settings.WS_CLUSTER_OUTBOX_SIZE:
+            self.dropped_frames += 1
+            return
+        else:
+            self._frames.append(op)
+        self._wakeup.set()
+
+    # ---- 后台任务 ----
+
+    async def _drain_outbox(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # 控制操作优先于视频帧
+            while self._control or self._frames:
+                op = self._control.popleft() if self._control else self._frames.popleft()
+                try:
+                    if op[0] == "presence":
+                        _, scope, key, present = op
+                        await self.broker.set_presence(scope, key, self.worker_id, present)
+                        await self._publish_presence(scope, key, present)
+                    else:
+                        _, channel, data = op
+                        await self.broker.publish(channel, data)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("集群消息发布失败: %s", e)
+
+    async def _publish_presence(self, scope: str, key: str, present: bool):
+        await self.broker.publish(PRESENCE_CHANNEL, json.dumps({
+            "worker": self.worker_id,
+            "scope": scope,
+            "key": key,
+            "present": present
+        }).encode())
+
+    async def _listen(self, listener: AsyncIterator[Tuple[str, bytes]]):
+        async for channel, data in listener:
+            try:
+                if channel == PRESENCE_CHANNEL:
+                    self._apply_presence(json.loads(data))
+                elif data[:1] == KIND_FRAME:
+                    is_keyframe, length = FRAME_ROUTE_HEADER.unpack_from(data, 1)
+                    offset = 1 + FRAME_ROUTE_HEADER.size
+                    device_id = data[offset:offset + length].decode()
+                    self.on_frame(device_id, data[offset + length:], is_keyframe)
+                else:
+                    envelope = json.loads(data[1:])
+                    if envelope["scope"] == "all" and envelope["key"] == self.worker_id:
+                        continue
+                    await self.on_text(envelope["scope"], envelope["key"], envelope["text"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("处理集群消息失败: %s", e)
+
+    def _apply_presence(self, event: dict):
+        worker_id = event["worker"]
+        if worker_id == self.worker_id:
+            return
+        target = (event["scope"], event["key"])
+        if event["present"]:
+            self.remote.setdefault(target, set()).add(worker_id)
+        elif target in self.remote:
+            self.remote[target].discard(worker_id)
+            if not self.remote[target]:
+                del self.remote[target]
+
+    async def _keepalive(self):
+        """定期续约本worker并清理已失效worker的在线状态"""
+        while True:
+            await asyncio.sleep(settings.WS_HEARTBEAT_INTERVAL)
+            try:
+                await self.broker.heartbeat(self.worker_id, self._worker_ttl())
+                known = {worker_id for workers in self.remote.values() for worker_id in workers}
+                for worker_id in known:
+                    if not await self.broker.is_worker_alive(worker_id):
+                        await self._purge_worker(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("集群心跳失败: %s", e)
+
+    async def _purge_worker(self, worker_id: str):
+        for target in list(self.remote):
+            workers = self.remote[target]
+            if worker_id in workers:
+                workers.discard(worker_id)
+                await self.broker.set_presence(target[0], target[1], worker_id, False)
+                if not workers:
+                    del self.remote[target]
+
+    def stats(self) -> dict:
+        """获取集群统计"""
+        return {
+            "worker_id": self.worker_id,
+            "remote_targets": len(self.remote),
+            "outbox_depth": len(self._control) + len(self._frames),
+            "dropped_frames": self.dropped_frames
+        }
@@ -0,0 +1,65 @@
+"""
+WebSocket编解码协商
+
+客户端通过查询参数 ?codec=msgpack 或子协议（Sec-WebSocket-Protocol: msgpack）
+选择编解码器，未指定或不支持时使用JSON。使用子协议协商时服务器在握手响应中回传所选子协议。
+"""
+from fastapi import WebSocket
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.codec import CODECS, Codec, Payload, json_codec
+
+
+def negotiate_codec(websocket: WebSocket) -> Tuple[Codec, Optional[str]]:
+    """根据握手请求选择编解码器，返回 (编解码器, 需要回传的子协议)"""
+    name = websocket.query_params.get("codec")
+    if name in CODECS:
+        return CODECS[name], None
+
+    for subprotocol in websocket.scope.get("subprotocols") or ():
+        if subprotocol in CODECS:
+            return CODECS[subprotocol], subprotocol
+    return json_codec, None
+
+
+class EncodedMessage:
+    """待发送的消息，每种编解码器只编码一次"""
+
+    __slots__ = ("message", "_payloads")
+
+    def __init__(self, message: Any = None, payloads: Dict[str, Payload] = None):
+        self.message = message
+        self._payloads: Dict[str, Payload] = payloads or {}
+
+    @classmethod
+    def from_json(cls, text: str) -> "EncodedMessage":
+        """由已编码的JSON文本构造（如集群中其他worker转发的消息）"""
+        return cls(payloads={json_codec.name: text})
+
+    def encode(self, codec: Codec) -> Payload:
+        """获取指定编解码器的编码结果"""
+        payload = self._payloads.get(codec.name)
+        if payload is None:
+            if self.message is None:
+                self.message = json_codec.decode(self._payloads[json_codec.name])
+            payload = self._payloads[codec.name] = codec.encode(self.message)
+        return payload
+
+    @property
+    def message_type(self) -> Optional[str]:
+        """消息类型（只有已编码文本、尚未解码时为None）"""
+        if isinstance(self.message, dict):
+            return self.message.get("type")
+        return None
+
+    def json(self) -> str:
+        """JSON编码结果（集群内转发使用）"""
+        return self.encode(json_codec)
+
+
+async def send_payload(websocket: WebSocket, payload: Payload):
+    """按负载类型发送文本或二进制消息"""
+    if isinstance(payload, bytes):
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_text(payload)
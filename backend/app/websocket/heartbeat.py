@@ -0,0 +1,114 @@
+"""
+WebSocket心跳与空闲连接清理
+
+所有连接共用一个后台任务和一个时间轮（每格 WS_HEARTBEAT_TICK 秒），不为每个连接创建定时任务：
+
+- 连接收到任何消息（包括音视频帧和对 ping 的 pong 回复）或查看端发送队列成功发送时只更新活跃时间，
+  不移动时间轮中的条目
+- 条目到期时才检查：空闲超过 WS_IDLE_TIMEOUT 的连接被断开；空闲超过 WS_HEARTBEAT_INTERVAL 的连接
+  收到一条 ping 消息，并在超时时间点再检查一次；其余按最后活跃时间重新排期
+- 应用层ping只是给客户端回复的机会，不要求回复：正在接收画面的查看端不会因为不回复而被断开
+- 每格只处理到期的条目，已断开的连接在到期时跳过，因此每次推进的开销与到期条目数成正比
+"""
+from typing import Callable, List, Optional
+import asyncio
+import logging
+import math
+import time
+
+from app.core.config import settings
+from app.websocket.registry import ConnectionRecord, ConnectionRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatScheduler:
+    """基于时间轮的心跳调度"""
+
+    def __init__(self, registry: ConnectionRegistry,
+                 ping: Callable[[List[ConnectionRecord]], None],
+                 evict: Callable[[ConnectionRecord], None]):
+        self.registry = registry
+        self._ping = ping
+        self._evict = evict
+        self.tick = settings.WS_HEARTBEAT_TICK
+        self.interval = settings.WS_HEARTBEAT_INTERVAL
+        self.timeout = max(settings.WS_IDLE_TIMEOUT, self.interval)
+        # 最长排期不超过一圈，条目不需要记录圈数
+        self._wheel: List[List[str]] = [[] for _ in range(math.ceil(self.timeout / self.tick) + 2)]
+        self._origin = time.monotonic()
+        self._current = 0
+        self._task: Optional[asyncio.Task] = None
+
+        # 统计信息
+        self.pings = 0
+        self.evicted = 0
+        self.checked = 0
+
+    def _tick_of(self, moment: float) -> int:
+        return math.ceil((moment - self._origin) / self.tick)
+
+    def _schedule(self, connection_id: str, due: float):
+        tick = min(max(self._tick_of(due), self._current + 1), self._current + len(self._wheel) - 1)
+        self._wheel[tick % len(self._wheel)].append(connection_id)
+
+    def add(self, record: ConnectionRecord):
+        """新连接加入时间轮（断开的连接不需要移除，到期时跳过）"""
+        self._schedule(record.connection_id, record.last_active() + self.interval)
+
+    async def start(self):
+        """启动心跳任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """停止心跳任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(max(0.0, self._origin + (self._current + 1) * self.tick - time.monotonic()))
+            # 事件循环繁忙导致延迟时，补处理错过的格子
+            target = int((time.monotonic() - self._origin) / self.tick)
+            while self._current < target:
+                self._current += 1
+                try:
+                    self._advance(self._current % len(self._wheel))
+                except Exception as e:
+                    logger.error("心跳检查失败: %s", e)
+
+    def _advance(self, slot: int):
+        """处理一格中到期的连接"""
+        due, self._wheel[slot] = self._wheel[slot], []
+        now = time.monotonic()
+        pings = []
+        for connection_id in due:
+            record = self.registry.connections.get(connection_id)
+            if record is None:
+                continue
+            self.checked += 1
+            last_active = record.last_active()
+            idle = now - last_active
+            if idle >= self.timeout:
+                self.evicted += 1
+                self._evict(record)
+            elif idle >= self.interval:
+                pings.append(record)
+                self._schedule(connection_id, last_active + self.timeout)
+            else:
+                self._schedule(connection_id, last_active + self.interval)
+        if pings:
+            self.pings += len(pings)
+            self._ping(pings)
+
+    def stats(self) -> dict:
+        """获取心跳统计"""
+        return {
+            "scheduled": sum(len(slot) for slot in self._wheel),
+            "checked": self.checked,
+            "pings": self.pings,
+            "evicted": self.evicted
+        }
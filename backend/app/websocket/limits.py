@@ -0,0 +1,137 @@
+"""
+WebSocket准入控制与消息限流
+
+- 准入：连接总数不超过 WS_MAX_CONNECTIONS，每个用户不超过 WS_MAX_CONNECTIONS_PER_USER；
+  连接数达到 WS_MAX_CONNECTIONS * WS_VIEWER_ADMIT_RATIO 后不再接受新的查看端，为摄像头保留余量。
+  连接数已满时新的摄像头会挤掉最近连接的查看端，已有的摄像头连接不会被断开。
+- 限流：每个连接按消息类型各有一个令牌桶，超出速率的消息直接丢弃并计数，
+  持续超限（连续 WS_THROTTLE_DISCONNECT 条）的连接会被断开。
+
+被拒绝或被挤掉的连接在握手完成后以关闭码关闭：1013（稍后重试）或 1008（违反策略）。
+"""
+from typing import Dict, Optional, Tuple
+import time
+
+from app.core.config import settings
+
+# 关闭码
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# 二进制音视频帧的限流类型
+MEDIA_MESSAGE = "media"
+
+# 未单独限流的控制消息共用一个令牌桶
+OTHER_MESSAGE = "other"
+
+# 按消息类型的限流: 类型 -> (每秒条数, 突发上限)，其余控制消息使用 WS_MESSAGE_RATE / WS_MESSAGE_BURST
+MESSAGE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "status_update": (1.0, 5),
+    "request_video": (1.0, 5),
+    "control_command": (5.0, 10),
+    "heartbeat": (1.0, 5),
+}
+
+
+def limit_key(message_type: Optional[str]) -> str:
+    """消息类型对应的令牌桶（客户端任意的类型名不会创建新的令牌桶）"""
+    if isinstance(message_type, str) and (message_type == MEDIA_MESSAGE or message_type in MESSAGE_LIMITS):
+        return message_type
+    return OTHER_MESSAGE
+
+
+def message_limit(message_type: str) -> Tuple[float, int]:
+    """消息类型对应的 (速率, 突发上限)"""
+    if message_type == MEDIA_MESSAGE:
+        return settings.WS_FRAME_RATE, settings.WS_FRAME_BURST
+    return MESSAGE_LIMITS.get(message_type, (settings.WS_MESSAGE_RATE, settings.WS_MESSAGE_BURST))
+
+
+class TokenBucket:
+    """令牌桶"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def allow(self) -> bool:
+        """取一个令牌，令牌不足时返回False"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter:
+    """单个连接的限流器（令牌桶在第一次收到该类型消息时创建）"""
+
+    __slots__ = ("buckets", "throttled", "consecutive")
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.throttled = 0
+        # 连续被限流的消息数
+        self.consecutive = 0
+
+    def allow(self, message_type: str) -> bool:
+        """消息是否在速率限制内"""
+        bucket = self.buckets.get(message_type)
+        if bucket is None:
+            bucket = self.buckets[message_type] = TokenBucket(*message_limit(message_type))
+        if bucket.allow():
+            self.consecutive = 0
+            return True
+        self.throttled += 1
+        self.consecutive += 1
+        return False
+
+    @property
+    def exhausted(self) -> bool:
+        """是否持续超限，应断开连接"""
+        return 0 < settings.WS_THROTTLE_DISCONNECT <= self.consecutive
+
+
+class AdmissionController:
+    """连接准入判断与计数"""
+
+    def __init__(self):
+        # 拒绝原因 -> 次数
+        self.rejected: Dict[str, int] = {"global_limit": 0, "user_limit": 0, "viewer_limit": 0}
+        # 为摄像头挤掉的查看端数
+        self.shed = 0
+        # 消息类型 -> 被限流次数
+        self.throttled: Dict[str, int] = {}
+        # 因持续超限被断开的连接数
+        self.throttle_disconnects = 0
+
+    def check(self, total: int, user_connections: int, is_camera: bool) -> Optional[Tuple[str, int]]:
+        """判断是否接受新连接，拒绝时返回 (原因, 关闭码)"""
+        if user_connections >= settings.WS_MAX_CONNECTIONS_PER_USER:
+            return "user_limit", CLOSE_POLICY_VIOLATION
+        if total >= settings.WS_MAX_CONNECTIONS:
+            return "global_limit", CLOSE_TRY_AGAIN_LATER
+        if not is_camera and total >= settings.WS_MAX_CONNECTIONS * settings.WS_VIEWER_ADMIT_RATIO:
+            return "viewer_limit", CLOSE_TRY_AGAIN_LATER
+        return None
+
+    def reject(self, reason: str):
+        self.rejected[reason] += 1
+
+    def throttle(self, message_type: str):
+        self.throttled[message_type] = self.throttled.get(message_type, 0) + 1
+
+    def stats(self) -> dict:
+        """获取准入与限流统计"""
+        return {
+            "rejected": dict(self.rejected),
+            "shed_viewers": self.shed,
+            "throttled": dict(self.throttled),
+            "throttle_disconnects": self.throttle_disconnects
+        }
@@ -1,108 +1,346 @@
-from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
-import json
+from fastapi import WebSocket
+from typing import Dict, Iterable, List, Optional
 import asyncio
+import logging
 from datetime import datetime
+from app.core.codec import json_codec
+from app.core.config import settings
+from app.core.metrics import metrics, ws_bytes_in, ws_bytes_out, ws_messages_in, ws_messages_out
+from app.websocket.sender import ViewerSendQueue
+from app.websocket.cluster import ClusterBackplane, ClusterBroker
+from app.websocket.codec import EncodedMessage, negotiate_codec, send_payload
+from app.websocket.heartbeat import HeartbeatScheduler
+from app.websocket.limits import AdmissionController, CLOSE_POLICY_VIOLATION, CLOSE_TRY_AGAIN_LATER, limit_key
+from app.websocket.protocol import FRAME_TYPE_VIDEO
+from app.websocket.registry import ConnectionRecord, ConnectionRegistry, ROLE_CAMERA, ROLE_VIEWER
+from app.services.rendition import normalize_quality, rendition_service
+
+logger = logging.getLogger(__name__)
 
 class WebSocketManager:
     def __init__(self):
-        # 存储活跃连接
-        self.active_connections: Dict[str, WebSocket] = {}
-        # 存储设备连接
-        self.device_connections: Dict[str, List[WebSocket]] = {}
-        # 存储用户连接
-        self.user_connections: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, device_id: str, user_id: str = None):
-        """建立WebSocket连接"""
-        await websocket.accept()
+        # 连接注册表（按摄像头/查看端/用户分别索引）
+        self.registry = ConnectionRegistry()
+        # 集群背板（未启用集群模式时为None）
+        self.cluster: Optional[ClusterBackplane] = None
+        # 准入控制与限流计数
+        self.admission = AdmissionController()
+        # 心跳与空闲连接清理（所有连接共用一个时间轮）
+        self.heartbeat = HeartbeatScheduler(self.registry, self._send_pings, self._evict_idle)
+    
+    async def enable_cluster(self, broker: ClusterBroker, worker_id: str = None):
+        """启用集群模式"""
+        self.cluster = ClusterBackplane(broker, self._on_cluster_text, self._on_cluster_frame, worker_id)
+        await self.cluster.start()
         
-        # 存储连接
-        self.active_connections[device_id] = websocket
+        # 同步已有的本地连接
+        for device_id in set(self.registry.cameras) | set(self.registry.viewers):
+            self.cluster.set_local_presence("device", device_id, True)
+        for device_id in self.registry.cameras:
+            self.cluster.set_local_presence(ROLE_CAMERA, device_id, True)
+        for device_id in self.registry.viewers:
+            self.cluster.set_local_presence(ROLE_VIEWER, device_id, True)
+        for user_id in self.registry.users:
+            self.cluster.set_local_presence("user", user_id, True)
+    
+    async def disable_cluster(self):
+        """关闭集群模式"""
+        if self.cluster is not None:
+            cluster, self.cluster = self.cluster, None
+            await cluster.stop()
+    
+    def _set_presence(self, scope: str, key: str, present: bool):
+        """本地在线状态变化时通知集群"""
+        if self.cluster is not None:
+            self.cluster.set_local_presence(scope, key, present)
+    
+    async def connect(self, websocket: WebSocket, device_id: str, user_id: str = None,
+                      role: str = ROLE_VIEWER) -> Optional[ConnectionRecord]:
+        """建立WebSocket连接（按握手请求协商控制消息的编解码器）
+
+        超出连接数限制时以关闭码关闭连接并返回None。
+        """
+        codec, subprotocol = negotiate_codec(websocket)
+        await websocket.accept(subprotocol=subprotocol)
         
-        # 添加到设备连接列表
-        if device_id not in self.device_connections:
-            self.device_connections[device_id] = []
-        self.device_connections[device_id].append(websocket)
+        # 准入控制：先拒绝新的查看端，摄像头在连接数已满时挤掉最近连接的查看端
+        rejection = self.admission.check(
+            len(self.registry.connections),
+            self.get_user_connection_count(user_id) if user_id else 0,
+            role == ROLE_CAMERA
+        )
+        if rejection is not None and role == ROLE_CAMERA and self._shed_viewer():
+            rejection = None
+        if rejection is not None:
+            reason, code = rejection
+            self.admission.reject(reason)
+            await self._close_quietly(websocket, code, reason)
+            return None
         
-        # 如果提供了用户ID，添加到用户连接列表
-        if user_id:
-            if user_id not in self.user_connections:
-                self.user_connections[user_id] = []
-            self.user_connections[user_id].append(websocket)
+        # 存储连接
+        record = ConnectionRecord(websocket, device_id, role, user_id, codec)
+        if role == ROLE_VIEWER:
+            # 查看端使用独立的发送队列
+            record.queue = ViewerSendQueue(websocket, device_id, viewer_id=record.connection_id,
+                                           on_error=self._on_viewer_error)
+            record.queue.start()
+        for scope, key in self.registry.add(record):
+            self._set_presence(scope, key, True)
+        self.heartbeat.add(record)
         
         # 发送连接成功消息
         await self.send_personal_message({
             "type": "connection_established",
             "device_id": device_id,
+            "connection_id": record.connection_id,
+            "role": role,
+            "codec": codec.name,
             "timestamp": datetime.utcnow().isoformat()
         }, websocket)
+        return record
     
-    def disconnect(self, websocket: WebSocket, device_id: str, user_id: str = None):
+    def disconnect(self, websocket: WebSocket, device_id: str = None, user_id: str = None):
         """断开WebSocket连接"""
-        # 从活跃连接中移除
-        if device_id in self.active_connections:
-            del self.active_connections[device_id]
-        
-        # 从设备连接列表中移除
-        if device_id in self.device_connections:
-            if websocket in self.device_connections[device_id]:
-                self.device_connections[device_id].remove(websocket)
-            if not self.device_connections[device_id]:
-                del self.device_connections[device_id]
+        record = self.registry.get(websocket)
+        if record is None:
+            return
         
-        # 从用户连接列表中移除
-        if user_id and user_id in self.user_connections:
-            if websocket in self.user_connections[user_id]:
-                self.user_connections[user_id].remove(websocket)
-            if not self.user_connections[user_id]:
-                del self.user_connections[user_id]
+        if record.queue is not None:
+            record.queue.close()
+        for scope, key in self.registry.remove(record):
+            self._set_presence(scope, key, False)
+    
+    def _send_pings(self, records: List[ConnectionRecord]):
+        """向空闲连接发送ping，客户端回复任意消息（如 pong）即视为活跃"""
+        asyncio.ensure_future(self._fan_out(records, EncodedMessage({
+            "type": "ping",
+            "timestamp": datetime.utcnow().isoformat()
+        })))
+    
+    def _evict_idle(self, record: ConnectionRecord):
+        """断开空闲超时的连接"""
+        self._evict(record.websocket, 1001, "idle timeout")
+    
+    def _shed_viewer(self) -> bool:
+        """断开最近连接的查看端，为摄像头腾出位置"""
+        for record in reversed(list(self.registry.connections.values())):
+            if record.role == ROLE_VIEWER:
+                self.admission.shed += 1
+                self._evict(record.websocket, CLOSE_TRY_AGAIN_LATER, "shed")
+                return True
+        return False
+    
+    def allow_message(self, record: ConnectionRecord, message_type: Optional[str], size: int = 0) -> bool:
+        """入站消息计数和限流，超限的消息应丢弃；持续超限的连接会被断开"""
+        if record.connection_id not in self.registry.connections:
+            # 已被移除的连接在收到关闭确认前不再处理消息
+            return False
+        key = limit_key(message_type)
+        ws_messages_in.inc(key)
+        ws_bytes_in.inc(key, amount=size)
+        if record.limiter.allow(key):
+            return True
+        self.admission.throttle(key)
+        if record.limiter.exhausted:
+            self.admission.throttle_disconnects += 1
+            self._evict(record.websocket, CLOSE_POLICY_VIOLATION, "rate limit exceeded")
+        return False
+    
+    def get_connection(self, websocket: WebSocket) -> Optional[ConnectionRecord]:
+        """获取连接记录"""
+        return self.registry.get(websocket)
+    
+    def relay_frame(self, device_id: str, data: bytes, is_keyframe: bool):
+        """将二进制帧放入该设备所有查看端的发送队列（原始缓冲区直接转发，不阻塞）"""
+        self._relay_local_frame(device_id, data, is_keyframe)
+        if self.cluster is not None:
+            self.cluster.route_frame(device_id, data, is_keyframe)
+    
+    def _relay_local_frame(self, device_id: str, data: bytes, is_keyframe: bool):
+        """将二进制帧放入本地查看端的发送队列，订阅了较低清晰度的查看端按清晰度分组转码"""
+        groups = None
+        is_video = data[0] == FRAME_TYPE_VIDEO
+        for record in self.registry.viewers.get(device_id, {}).values():
+            if record.quality is None or not is_video:
+                record.queue.put_frame(data, is_keyframe)
+            else:
+                if groups is None:
+                    groups = {}
+                groups.setdefault(record.quality, []).append(record)
+        # 每种清晰度每帧只转码一次，没有订阅者的清晰度不会出现在分组中
+        if groups:
+            rendition_service.submit(device_id, data, is_keyframe, groups)
+    
+    def set_viewer_quality(self, websocket: WebSocket, quality: Optional[str]):
+        """设置查看端订阅的清晰度（未启用转码时始终转发原始画面）"""
+        record = self.registry.get(websocket)
+        if record is not None and record.role == ROLE_VIEWER:
+            record.quality = normalize_quality(quality) if rendition_service.enabled else None
+    
+    def get_viewer_stats(self, device_id: str) -> List[dict]:
+        """获取指定设备各查看端的发送统计"""
+        return [record.queue.stats() for record in self.registry.viewer_records(device_id)]
+    
+    def get_connection_stats(self, device_id: str) -> List[dict]:
+        """获取指定设备各连接的统计"""
+        return [record.stats() for record in self.registry.device_records(device_id)]
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """发送个人消息"""
         try:
-            await websocket.send_text(json.dumps(message))
+            record = self.registry.get(websocket)
+            if record is None:
+                await websocket.send_text(json_codec.encode(message))
+                return
+            payload = record.codec.encode(message)
+            await send_payload(websocket, payload)
+            record.on_send(len(payload))
+            _count_sent(message.get("type"), 1, len(payload))
         except Exception as e:
-            print(f"发送消息失败: {e}")
+            logger.warning("发送消息失败: %s", e)
     
     async def send_to_device(self, device_id: str, message: dict):
-        """发送消息到指定设备的所有连接"""
-        if device_id in self.device_connections:
-            for websocket in self.device_connections[device_id]:
-                try:
-                    await websocket.send_text(json.dumps(message))
-                except Exception as e:
-                    print(f"发送消息到设备 {device_id} 失败: {e}")
+        """发送消息到指定设备的所有连接（摄像头和查看端，集群模式下包括其他worker上的连接）"""
+        await self._send_scoped("device", device_id, message)
+    
+    async def send_to_camera(self, device_id: str, message: dict):
+        """只发送消息到设备的摄像头连接"""
+        await self._send_scoped(ROLE_CAMERA, device_id, message)
+    
+    async def send_to_viewers(self, device_id: str, message: dict):
+        """只发送消息到设备的查看端连接"""
+        await self._send_scoped(ROLE_VIEWER, device_id, message)
     
     async def send_to_user(self, user_id: str, message: dict):
-        """发送消息到指定用户的所有连接"""
-        if user_id in self.user_connections:
-            for websocket in self.user_connections[user_id]:
-                try:
-                    await websocket.send_text(json.dumps(message))
-                except Exception as e:
-                    print(f"发送消息到用户 {user_id} 失败: {e}")
+        """发送消息到指定用户的所有连接（集群模式下包括其他worker上的连接）"""
+        await self._send_scoped("user", user_id, message)
     
     async def broadcast_to_all(self, message: dict):
         """广播消息到所有连接"""
-        for websocket in self.active_connections.values():
-            try:
-                await websocket.send_text(json.dumps(message))
-            except Exception as e:
-                print(f"广播消息失败: {e}")
+        encoded = EncodedMessage(message)
+        if self.cluster is not None:
+            self.cluster.broadcast_text(encoded.json())
+        await self._fan_out(self.registry.all_records(), encoded)
+    
+    async def _send_scoped(self, scope: str, key: str, message: dict):
+        """每种编解码器序列化一次后发送到本地连接，并路由到持有目标连接的其他worker"""
+        encoded = EncodedMessage(message)
+        if self.cluster is not None and self.cluster.remote_workers(scope, key):
+            self.cluster.route_text(scope, key, encoded.json())
+        await self._fan_out(self._local_records(scope, key), encoded)
+    
+    def _local_records(self, scope: str, key: str) -> List[ConnectionRecord]:
+        """按范围查找本地连接"""
+        if scope == "device":
+            return self.registry.device_records(key)
+        if scope == ROLE_CAMERA:
+            return self.registry.camera_records(key)
+        if scope == ROLE_VIEWER:
+            return self.registry.viewer_records(key)
+        if scope == "user":
+            return self.registry.user_records(key)
+        if scope == "all":
+            return self.registry.all_records()
+        return []
+    
+    async def _on_cluster_text(self, scope: str, key: str, text: str):
+        """投递其他worker路由过来的JSON消息（只投递本地连接）"""
+        await self._fan_out(self._local_records(scope, key), EncodedMessage.from_json(text))
+    
+    def _on_cluster_frame(self, device_id: str, data: bytes, is_keyframe: bool):
+        """投递其他worker路由过来的二进制帧（只投递本地查看端）"""
+        self._relay_local_frame(device_id, data, is_keyframe)
+    
+    async def _fan_out(self, records: Iterable[ConnectionRecord], encoded: EncodedMessage):
+        """并发发送消息，发送失败或超时的连接自动移除"""
+        direct = []
+        count = size = 0
+        for record in records:
+            payload = encoded.encode(record.codec)
+            count += 1
+            size += len(payload)
+            # 查看端经由发送队列，保证与视频帧的发送顺序
+            if record.queue is not None:
+                record.queue.put_message(payload)
+            else:
+                direct.append((record, payload))
+        
+        if count:
+            _count_sent(encoded.message_type, count, size)
+        if not direct:
+            return
+        
+        results = await asyncio.gather(
+            *(asyncio.wait_for(send_payload(record.websocket, payload), settings.WS_SEND_TIMEOUT)
+              for record, payload in direct),
+            return_exceptions=True
+        )
+        for (record, payload), result in zip(direct, results):
+            if isinstance(result, Exception):
+                logger.warning("发送消息失败，移除连接: %r", result)
+                self._evict(record.websocket)
+            else:
+                record.on_send(len(payload))
+    
+    def _on_viewer_error(self, queue: ViewerSendQueue):
+        """查看端发送失败回调"""
+        self._evict(queue.websocket)
+    
+    def _evict(self, websocket: WebSocket, code: int = 1011, reason: str = None):
+        """从所有注册表中移除失效连接并在后台关闭"""
+        if self.registry.get(websocket) is None:
+            return
+        self.disconnect(websocket)
+        asyncio.ensure_future(self._close_quietly(websocket, code, reason))
+    
+    async def _close_quietly(self, websocket: WebSocket, code: int = 1011, reason: str = None):
+        """关闭连接，忽略错误"""
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), settings.WS_SEND_TIMEOUT)
+        except Exception:
+            pass
     
     def get_connection_count(self) -> int:
         """获取当前连接数"""
-        return len(self.active_connections)
+        return len(self.registry.connections)
+    
+    def get_role_counts(self) -> Dict[str, int]:
+        """按角色获取当前连接数"""
+        return self.registry.count_by_role()
     
     def get_device_connection_count(self, device_id: str) -> int:
         """获取指定设备的连接数"""
-        return len(self.device_connections.get(device_id, []))
+        return len(self.registry.cameras.get(device_id, {})) + len(self.registry.viewers.get(device_id, {}))
     
     def get_user_connection_count(self, user_id: str) -> int:
         """获取指定用户的连接数"""
-        return len(self.user_connections.get(user_id, []))
+        return len(self.registry.users.get(user_id, {}))
     
     def is_device_online(self, device_id: str) -> bool:
-        """检查设备是否在线"""
-        return device_id in self.device_connections and len(self.device_connections[device_id]) > 0
+        """检查设备（摄像头）是否在线（集群模式下包括其他worker上的连接）"""
+        if device_id in self.registry.cameras:
+            return True
+        return self.cluster is not None and self.cluster.is_present(ROLE_CAMERA, device_id)
+
+
+def _count_sent(message_type: Optional[str], count: int, size: int):
+    """出站控制消息计数（其他worker路由过来的消息未解码，记为 relayed）"""
+    key = message_type if isinstance(message_type, str) else "relayed"
+    ws_messages_out.inc(key, amount=count)
+    ws_bytes_out.inc(key, amount=size)
+
+
+def _queue_depths() -> dict:
+    """查看端发送队列深度"""
+    depths = [record.queue.depth for record in websocket_manager.registry.connections.values()
+              if record.queue is not None]
+    return {("total",): sum(depths), ("max",): max(depths, default=0)}
+
+
+# 全局WebSocket管理器实例（每个worker一个）
+websocket_manager = WebSocketManager()
+
+metrics.gauge("ws_connections", "WebSocket连接数", lambda: {
+    (role,): count for role, count in websocket_manager.get_role_counts().items()
+}, ("role",))
+metrics.gauge("ws_send_queue_frames", "查看端发送队列中的视频帧数", _queue_depths, ("stat",))
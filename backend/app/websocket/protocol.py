@@ -0,0 +1,82 @@
+"""
+WebSocket二进制帧协议
+
+摄像头通过二进制消息推送音视频帧，控制消息默认使用文本JSON
+（也可协商为MessagePack，见 app.websocket.codec）。
+每个二进制消息由固定长度的头部和原始负载组成（网络字节序）：
+
+    | type (1B) | flags (1B) | seq (4B) | timestamp_ms (8B) | payload ... |
+
+flags 的第0位表示关键帧。服务器只解析头部，负载不做任何解码，
+转发给查看端时直接发送收到的原始缓冲区。
+"""
+import struct
+from typing import NamedTuple, Union
+
+# 帧头部格式: 类型、标志位、序列号、毫秒时间戳
+FRAME_HEADER = struct.Struct("!BBIQ")
+FRAME_HEADER_SIZE = FRAME_HEADER.size
+
+# 帧类型
+FRAME_TYPE_VIDEO = 1
+FRAME_TYPE_AUDIO = 2
+
+# 标志位
+FLAG_KEYFRAME = 0x01
+
+FRAME_TYPES = (FRAME_TYPE_VIDEO, FRAME_TYPE_AUDIO)
+
+
+class FrameProtocolError(ValueError):
+    """二进制帧格式错误"""
+
+
+class BinaryFrame(NamedTuple):
+    """已解析的二进制帧（负载为原始缓冲区的视图，不复制）"""
+    frame_type: int
+    seq: int
+    timestamp: int
+    is_keyframe: bool
+    payload: memoryview
+    raw: bytes
+
+    @property
+    def size(self) -> int:
+        """帧总字节数"""
+        return len(self.raw)
+
+
+def pack_frame_header(frame_type: int, seq: int, timestamp: int, is_keyframe: bool = False) -> bytes:
+    """打包帧头部"""
+    flags = FLAG_KEYFRAME if is_keyframe else 0
+    return FRAME_HEADER.pack(frame_type, flags, seq & 0xFFFFFFFF, timestamp)
+
+
+def pack_frame(frame_type: int, seq: int, timestamp: int, payload: Union[bytes, memoryview],
+               is_keyframe: bool = False) -> bytes:
+    """打包完整的二进制帧"""
+    return pack_frame_header(frame_type, seq, timestamp, is_keyframe) + bytes(payload)
+
+
+def is_media_frame(data: bytes) -> bool:
+    """二进制消息是否为音视频帧（MessagePack编码的控制消息首字节不会是帧类型）"""
+    return len(data) > 0 and data[0] in FRAME_TYPES
+
+
+def parse_frame(data: bytes) -> BinaryFrame:
+    """解析二进制帧，负载以memoryview返回以避免复制"""
+    if len(data) < FRAME_HEADER_SIZE:
+        raise FrameProtocolError(f"帧长度不足: {len(data)} 字节")
+
+    frame_type, flags, seq, timestamp = FRAME_HEADER.unpack_from(data)
+    if frame_type not in FRAME_TYPES:
+        raise FrameProtocolError(f"未知的帧类型: {frame_type}")
+
+    return BinaryFrame(
+        frame_type=frame_type,
+        seq=seq,
+        timestamp=timestamp,
+        is_keyframe=bool(flags & FLAG_KEYFRAME),
+        payload=memoryview(data)[FRAME_HEADER_SIZE:],
+        raw=data
+    )
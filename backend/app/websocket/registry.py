@@ -0,0 +1,189 @@
+from fastapi import WebSocket
+from typing import Dict, List, Optional, Tuple
+import time
+import uuid
+
+from app.core.codec import Codec, json_codec
+from app.websocket.limits import RateLimiter
+from app.websocket.sender import ViewerSendQueue
+
+# 连接角色
+ROLE_CAMERA = "camera"
+ROLE_VIEWER = "viewer"
+
+
+class ConnectionRecord:
+    """单个WebSocket连接的元数据（使用__slots__，大量连接时保持内存占用稳定）"""
+
+    __slots__ = (
+        "connection_id", "websocket", "device_id", "role", "user_id", "connected_at",
+        "last_activity", "bytes_in", "bytes_out", "messages_in", "messages_out", "queue", "codec", "quality",
+        "limiter"
+    )
+
+    def __init__(self, websocket: WebSocket, device_id: str, role: str, user_id: Optional[str] = None,
+                 codec: Codec = None):
+        self.connection_id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.device_id = device_id
+        self.role = role
+        self.user_id = user_id
+        self.connected_at = time.time()
+        # 最后收到消息的时间
+        self.last_activity = time.monotonic()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages_in = 0
+        self.messages_out = 0
+        # 查看端发送队列（摄像头连接为None）
+        self.queue: Optional[ViewerSendQueue] = None
+        # 握手时协商的控制消息编解码器
+        self.codec = codec or json_codec
+        # 查看端订阅的转码清晰度（None表示摄像头原始画面）
+        self.quality: Optional[str] = None
+        # 入站消息限流
+        self.limiter = RateLimiter()
+
+    def on_receive(self, size: int):
+        """记录入站消息"""
+        self.messages_in += 1
+        self.bytes_in += size
+        self.last_activity = time.monotonic()
+
+    def last_active(self) -> float:
+        """最后活跃时间（心跳据此判断空闲）
+
+        查看端通常只接收画面、不回复应用层ping，发送队列在 WS_SEND_TIMEOUT 内成功发送同样视为活跃；
+        对端失联但发送仍进入内核缓冲区的情况由服务器的协议层ping/pong检测（见 start.py）。
+        """
+        if self.queue is not None and self.queue.last_sent > self.last_activity:
+            return self.queue.last_sent
+        return self.last_activity
+
+    def on_send(self, size: int):
+        """记录直接发送的出站消息"""
+        self.messages_out += 1
+        self.bytes_out += size
+
+    def stats(self) -> dict:
+        """获取连接统计"""
+        bytes_out = self.bytes_out
+        messages_out = self.messages_out
+        if self.queue is not None:
+            bytes_out += self.queue.sent_bytes
+            messages_out += self.queue.sent_frames
+        return {
+            "connection_id": self.connection_id,
+            "device_id": self.device_id,
+            "role": self.role,
+            "user_id": self.user_id,
+            "codec": self.codec.name,
+            "quality": self.quality,
+            "connected_at": self.connected_at,
+            "idle_seconds": round(time.monotonic() - self.last_active(), 3),
+            "bytes_in": self.bytes_in,
+            "bytes_out": bytes_out,
+            "messages_in": self.messages_in,
+            "messages_out": messages_out,
+            "throttled": self.limiter.throttled
+        }
+
+
+class ConnectionRegistry:
+    """按角色区分的连接注册表，所有增删查均为O(1)
+
+    add/remove 返回从无到有（或从有到无）的 (范围, 键) 列表，供集群同步在线状态，
+    范围为 camera、viewer、device（设备的任意连接）和 user。
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, ConnectionRecord] = {}
+        self.by_socket: Dict[WebSocket, ConnectionRecord] = {}
+        self.cameras: Dict[str, Dict[str, ConnectionRecord]] = {}
+        self.viewers: Dict[str, Dict[str, ConnectionRecord]] = {}
+        self.users: Dict[str, Dict[str, ConnectionRecord]] = {}
+        self.role_counts: Dict[str, int] = {ROLE_CAMERA: 0, ROLE_VIEWER: 0}
+
+    def _role_index(self, role: str) -> Dict[str, Dict[str, ConnectionRecord]]:
+        return self.cameras if role == ROLE_CAMERA else self.viewers
+
+    def has_device(self, device_id: str) -> bool:
+        """设备是否有任意本地连接"""
+        return device_id in self.cameras or device_id in self.viewers
+
+    def add(self, record: ConnectionRecord) -> List[Tuple[str, str]]:
+        """注册连接"""
+        changed = []
+        if not self.has_device(record.device_id):
+            changed.append(("device", record.device_id))
+
+        index = self._role_index(record.role)
+        if record.device_id not in index:
+            index[record.device_id] = {}
+            changed.append((record.role, record.device_id))
+        index[record.device_id][record.connection_id] = record
+
+        if record.user_id:
+            if record.user_id not in self.users:
+                self.users[record.user_id] = {}
+                changed.append(("user", record.user_id))
+            self.users[record.user_id][record.connection_id] = record
+
+        self.connections[record.connection_id] = record
+        self.by_socket[record.websocket] = record
+        self.role_counts[record.role] += 1
+        return changed
+
+    def remove(self, record: ConnectionRecord) -> List[Tuple[str, str]]:
+        """注销连接（重复调用无副作用）"""
+        if self.connections.pop(record.connection_id, None) is None:
+            return []
+        self.by_socket.pop(record.websocket, None)
+        self.role_counts[record.role] -= 1
+
+        changed = []
+        index = self._role_index(record.role)
+        group = index.get(record.device_id)
+        if group is not None:
+            group.pop(record.connection_id, None)
+            if not group:
+                del index[record.device_id]
+                changed.append((record.role, record.device_id))
+        if not self.has_device(record.device_id):
+            changed.append(("device", record.device_id))
+
+        if record.user_id and record.user_id in self.users:
+            group = self.users[record.user_id]
+            group.pop(record.connection_id, None)
+            if not group:
+                del self.users[record.user_id]
+                changed.append(("user", record.user_id))
+        return changed
+
+    def get(self, websocket: WebSocket) -> Optional[ConnectionRecord]:
+        """按连接对象查找记录"""
+        return self.by_socket.get(websocket)
+
+    def camera_records(self, device_id: str) -> List[ConnectionRecord]:
+        """设备的摄像头连接"""
+        return list(self.cameras.get(device_id, {}).values())
+
+    def viewer_records(self, device_id: str) -> List[ConnectionRecord]:
+        """设备的查看端连接"""
+        return list(self.viewers.get(device_id, {}).values())
+
+    def device_records(self, device_id: str) -> List[ConnectionRecord]:
+        """设备的所有连接"""
+        return self.camera_records(device_id) + self.viewer_records(device_id)
+
+    def user_records(self, user_id: str) -> List[ConnectionRecord]:
+        """用户的所有连接"""
+        return list(self.users.get(user_id, {}).values())
+
+    def all_records(self) -> List[ConnectionRecord]:
+        """所有连接"""
+        return list(self.connections.values())
+
+    def count_by_role(self) -> Dict[str, int]:
+        """按角色统计连接数"""
+        return dict(self.role_counts)
@@ -0,0 +1,156 @@
+from fastapi import WebSocket
+from typing import Callable, Deque, Optional, Tuple
+from collections import deque
+import asyncio
+import logging
+import time
+import uuid
+
+from app.core.codec import Payload
+from app.core.config import settings
+from app.core.metrics import ws_bytes_out, ws_messages_out
+from app.websocket.codec import send_payload
+
+logger = logging.getLogger(__name__)
+
+
+class ViewerSendQueue:
+    """查看端的有界发送队列
+
+    每个查看端拥有独立的发送任务，摄像头的接收循环只负责入队，不会被慢速查看端阻塞。
+    队列满时按关键帧策略丢帧：保留最新的关键帧及其后续帧，丢弃更早的过期帧；
+    若仍无空间，则丢弃新到的差分帧并一直丢到下一个关键帧，避免查看端解码花屏。
+    控制消息（已按连接的编解码器编码）单独排队，优先发送且永不丢弃。
+    """
+
+    def __init__(self, websocket: WebSocket, device_id: str, max_frames: int = None,
+                 viewer_id: str = None, on_error: Callable[["ViewerSendQueue"], None] = None):
+        self.websocket = websocket
+        self.device_id = device_id
+        self.on_error = on_error
+        self.viewer_id = viewer_id or uuid.uuid4().hex
+        self.max_frames = max_frames or settings.WS_VIEWER_QUEUE_SIZE
+
+        # 帧队列: (数据, 是否关键帧, 入队时间)
+        self._frames: Deque[Tuple[bytes, bool, float]] = deque()
+        self._control: Deque[Payload] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._waiting_keyframe = False
+        self.closed = False
+
+        # 统计信息
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.dropped_frames = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        # 最后一次成功发送的时间（monotonic，尚未发送时为0）
+        self.last_sent = 0.0
+
+    def start(self):
+        """启动发送任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        """停止发送任务并清空队列"""
+        self.closed = True
+        self.dropped_frames += len(self._frames)
+        self._frames.clear()
+        self._control.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def put_message(self, payload: Payload):
+        """控制消息入队"""
+        if self.closed:
+            return
+        self._control.append(payload)
+        self._wakeup.set()
+
+    def put_frame(self, data: bytes, is_keyframe: bool):
+        """视频帧入队（不阻塞）"""
+        if self.closed:
+            return
+
+        # 之前丢过帧，差分帧已无法解码，等待下一个关键帧
+        if self._waiting_keyframe and not is_keyframe:
+            self.dropped_frames += 1
+            return
+
+        if is_keyframe:
+            # 新关键帧到达，之前排队的帧都已过期
+            self._waiting_keyframe = False
+            self.dropped_frames += len(self._frames)
+            self._frames.clear()
+        elif len(self._frames) >= self.max_frames and not self._shed():
+            self._waiting_keyframe = True
+            self.dropped_frames += 1
+            return
+
+        self._frames.append((data, is_keyframe, time.monotonic()))
+        self._wakeup.set()
+
+    def _shed(self) -> bool:
+        """丢弃最新关键帧之前的过期帧，返回是否腾出了空间"""
+        latest_keyframe = -1
+        for index, (_, is_keyframe, _) in enumerate(self._frames):
+            if is_keyframe:
+                latest_keyframe = index
+
+        for _ in range(max(latest_keyframe, 0)):
+            self._frames.popleft()
+            self.dropped_frames += 1
+
+        return len(self._frames) < self.max_frames
+
+    async def _run(self):
+        """发送循环"""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                while self._control or self._frames:
+                    if self._control:
+                        await asyncio.wait_for(send_payload(self.websocket, self._control.popleft()),
+                                               settings.WS_SEND_TIMEOUT)
+                        self.last_sent = time.monotonic()
+                        continue
+
+                    data, _, queued_at = self._frames.popleft()
+                    self.last_lag_ms = (time.monotonic() - queued_at) * 1000
+                    self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+                    await asyncio.wait_for(self.websocket.send_bytes(data), settings.WS_SEND_TIMEOUT)
+                    self.last_sent = time.monotonic()
+                    self.sent_frames += 1
+                    self.sent_bytes += len(data)
+                    ws_messages_out.inc("media")
+                    ws_bytes_out.inc("media", amount=len(data))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("发送数据到查看端 %s 失败: %s", self.viewer_id, e)
+            self.close()
+            if self.on_error is not None:
+                self.on_error(self)
+
+    @property
+    def depth(self) -> int:
+        """排队中的视频帧数"""
+        return len(self._frames)
+
+    def stats(self) -> dict:
+        """获取发送统计"""
+        return {
+            "viewer_id": self.viewer_id,
+            "queue_depth": len(self._frames),
+            "sent_frames": self.sent_frames,
+            "sent_bytes": self.sent_bytes,
+            "dropped_frames": self.dropped_frames,
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "waiting_keyframe": self._waiting_keyframe
+        }
@@ -0,0 +1,11 @@
+"""
+性能基准测试
+
+在临时SQLite数据库上启动服务器（独立的uvicorn进程），测试：
+- REST：登录、刷新令牌、获取设备列表的吞吐量和延迟
+- WebSocket：N个摄像头向每个摄像头M个查看端推送视频帧的扇出吞吐量、端到端延迟和每连接内存
+
+结果保存为JSON，可跨提交对比：
+    python -m benchmarks run --cameras 10 --viewers 10
+    python -m benchmarks compare results/基线.json results/当前.json
+"""
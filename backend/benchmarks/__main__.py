@@ -0,0 +1,133 @@
+"""
+命令行入口: python -m benchmarks run|compare|importtime
+"""
+from datetime import datetime
+import argparse
+import asyncio
+import sys
+
+from benchmarks import results
+from benchmarks.server import BenchServer
+
+SCENARIOS = ("startup", "rest", "websocket")
+
+
+def run(args) -> int:
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"未知的场景: {', '.join(sorted(unknown))}")
+        return 2
+
+    params = {key: value for key, value in vars(args).items() if key not in ("command", "handler", "output")}
+    result = {
+        "schema": results.SCHEMA_VERSION,
+        "meta": {
+            "git": results.git_revision(),
+            "environment": results.environment(),
+            "params": params,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+    }
+
+    devices_per_user = max(args.devices_per_user, -(-args.cameras // args.users))
+    server = BenchServer(args.users, devices_per_user)
+    try:
+        print(f"预置 {args.users} 个用户, 每个用户 {devices_per_user} 台设备")
+        server.seed()
+        server.start()
+        if "startup" in scenarios:
+            print("启动:")
+            from benchmarks.importtime import measure_median
+            report = measure_median(env=server.env)
+            result["startup"] = {
+                "import_ms": round(report.total_us / 1000, 1),
+                "heavy_modules": report.heavy,
+                "ready_ms": server.ready_ms
+            }
+            print(f"  import app.main {result['startup']['import_ms']} ms, 就绪 {server.ready_ms} ms")
+        if "rest" in scenarios:
+            print("REST:")
+            from benchmarks.rest import run_rest
+            result["rest"] = asyncio.run(run_rest(server, args.requests, args.concurrency, args.login_requests))
+        if "websocket" in scenarios:
+            print("WebSocket:")
+            from benchmarks.streaming import run_streaming
+            result["websocket"] = asyncio.run(run_streaming(
+                server, args.cameras, args.viewers, args.fps, args.duration, args.frame_size, args.keyframe_interval
+            ))
+    finally:
+        server.stop()
+
+    path = results.save(result, args.output)
+    for path_name, _ in results.KEY_METRICS:
+        value = results.lookup(result, path_name)
+        if value is not None:
+            print(f"  {path_name:<44}{value:>14.3f}")
+    print(f"结果已保存: {path}")
+    return 0
+
+
+def compare(args) -> int:
+    rows, regressed = results.compare(results.load(args.baseline), results.load(args.current), args.threshold)
+    print(results.format_comparison(rows))
+    if regressed:
+        print(f"存在超过 {args.threshold:.0%} 的退化")
+        return 1
+    return 0
+
+
+def importtime(args) -> int:
+    from benchmarks.importtime import format_report, measure_median
+    report = measure_median(args.module, args.repeat)
+    print(format_report(report, args.top))
+    if report.heavy:
+        print("启动路径上导入了重型依赖，应改为在预热阶段或首次使用时导入")
+        return 1
+    if args.budget_ms and report.total_us / 1000 > args.budget_ms:
+        print(f"导入耗时超过预算 {args.budget_ms} ms")
+        return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="性能基准测试")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="运行基准测试并保存结果")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔: startup,rest,websocket")
+    run_parser.add_argument("--users", type=int, default=50, help="预置用户数")
+    run_parser.add_argument("--devices-per-user", type=int, default=5, help="每个用户的预置设备数")
+    run_parser.add_argument("--requests", type=int, default=2000, help="刷新令牌和设备列表的请求数")
+    run_parser.add_argument("--login-requests", type=int, default=200, help="登录请求数（受bcrypt限制）")
+    run_parser.add_argument("--concurrency", type=int, default=32, help="REST并发数")
+    run_parser.add_argument("--cameras", type=int, default=10, help="摄像头数")
+    run_parser.add_argument("--viewers", type=int, default=10, help="每个摄像头的查看端数")
+    run_parser.add_argument("--fps", type=int, default=15, help="每个摄像头的帧率")
+    run_parser.add_argument("--frame-size", type=int, default=32 * 1024, help="帧负载字节数")
+    run_parser.add_argument("--keyframe-interval", type=int, default=30, help="关键帧间隔（帧）")
+    run_parser.add_argument("--duration", type=float, default=10.0, help="推流时长（秒）")
+    run_parser.add_argument("--output", help="结果文件路径（默认 benchmarks/results/{提交}-{时间}.json）")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="对比两次结果，有退化时退出码为1")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="允许的退化比例")
+    compare_parser.set_defaults(handler=compare)
+
+    importtime_parser = commands.add_parser(
+        "importtime", help="报告导入耗时（使用当前环境变量），导入了重型依赖或超出预算时退出码为1"
+    )
+    importtime_parser.add_argument("--module", default="app.main")
+    importtime_parser.add_argument("--repeat", type=int, default=3, help="测量次数，取中位数")
+    importtime_parser.add_argument("--top", type=int, default=25, help="列出累计耗时最多的模块数")
+    importtime_parser.add_argument("--budget-ms", type=float, default=0, help="导入耗时预算，0表示不检查")
+    importtime_parser.set_defaults(handler=importtime)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
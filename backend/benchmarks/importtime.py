@@ -0,0 +1,69 @@
+"""
+导入耗时：用 python -X importtime 导入 app.main，统计总耗时和耗时最多的模块，
+并检查启动路径上是否导入了重型依赖（这些依赖应在预热阶段或首次使用时加载）
+"""
+from typing import Dict, List, NamedTuple, Optional
+import os
+import subprocess
+import sys
+
+from benchmarks.server import BACKEND_DIR
+
+# 不应在worker启动时导入的模块（顶层包名）
+HEAVY_MODULES = ("tensorflow", "cv2", "numpy", "PIL", "ffmpeg", "alembic")
+
+
+class ImportEntry(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+class ImportReport(NamedTuple):
+    module: str
+    total_us: int
+    entries: List[ImportEntry]
+    heavy: List[str]
+
+
+def _parse(stderr: str) -> List[ImportEntry]:
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        entries.append(ImportEntry(fields[2].strip(), int(fields[0]), int(fields[1])))
+    return entries
+
+
+def measure(module: str = "app.main", env: Optional[Dict[str, str]] = None) -> ImportReport:
+    """在新的解释器中导入模块一次"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env if env is not None else dict(os.environ),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{process.stderr[-2000:]}")
+    entries = _parse(process.stderr)
+    total = next((entry.cumulative_us for entry in entries if entry.module == module), 0)
+    loaded = {entry.module.split(".")[0] for entry in entries}
+    return ImportReport(module, total, entries, [name for name in HEAVY_MODULES if name in loaded])
+
+
+def measure_median(module: str = "app.main", repeat: int = 3, env: Optional[Dict[str, str]] = None) -> ImportReport:
+    """多次测量，返回总耗时居中的一次"""
+    reports = sorted((measure(module, env) for _ in range(max(1, repeat))), key=lambda report: report.total_us)
+    return reports[len(reports) // 2]
+
+
+def format_report(report: ImportReport, top: int) -> str:
+    lines = [f"import {report.module}: {report.total_us / 1000:.1f} ms", "",
+             f"{'cumulative ms':>14}{'self ms':>10}  module"]
+    for entry in sorted(report.entries, key=lambda entry: entry.cumulative_us, reverse=True)[:top]:
+        lines.append(f"{entry.cumulative_us / 1000:>14.1f}{entry.self_us / 1000:>10.1f}  {entry.module}")
+    lines.append("")
+    lines.append(f"重型依赖: {', '.join(report.heavy) if report.heavy else '无'}")
+    return "\n".join(lines)
@@ -0,0 +1,84 @@
+"""
+REST吞吐量：登录、刷新令牌、获取设备列表
+"""
+from typing import Awaitable, Callable, List
+import asyncio
+import itertools
+import time
+
+import httpx
+
+from benchmarks.results import summarize
+from benchmarks.server import PASSWORD, BenchServer
+
+
+async def _drive(name: str, requests: int, concurrency: int,
+                 call: Callable[[int], Awaitable[httpx.Response]]) -> dict:
+    """并发发起请求，统计延迟和吞吐量"""
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            started = time.perf_counter()
+            try:
+                response = await call(index)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    print(f"  {name}: {requests} 次请求, {duration:.2f}s")
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "duration_s": round(duration, 3),
+        "rps": round(requests / duration, 2) if duration else 0.0,
+        "latency_ms": summarize(latencies)
+    }
+
+
+async def run_rest(server: BenchServer, requests: int, concurrency: int, login_requests: int) -> dict:
+    """依次测试登录、刷新令牌和设备列表"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=server.base_url, limits=limits, timeout=60.0) as client:
+        usernames = server.usernames
+
+        async def login(index: int) -> httpx.Response:
+            return await client.post("/api/v1/auth/login", data={
+                "username": usernames[index % len(usernames)], "password": PASSWORD
+            })
+
+        # 登录受bcrypt限制，请求数单独设置
+        results = {"login": await _drive("login", login_requests, concurrency, login)}
+
+        # 每个用户登录一次，后续测试使用其令牌
+        tokens = []
+        for username in usernames:
+            response = await client.post("/api/v1/auth/login", data={"username": username, "password": PASSWORD})
+            response.raise_for_status()
+            tokens.append(response.json())
+
+        async def refresh(index: int) -> httpx.Response:
+            token = tokens[index % len(tokens)]["refresh_token"]
+            return await client.post("/api/v1/auth/refresh", params={"refresh_token": token})
+
+        results["refresh"] = await _drive("refresh", requests, concurrency, refresh)
+
+        async def list_devices(index: int) -> httpx.Response:
+            token = tokens[index % len(tokens)]["access_token"]
+            return await client.get("/api/v1/devices/", headers={"Authorization": f"Bearer {token}"})
+
+        results["list_devices"] = await _drive("list_devices", requests, concurrency, list_devices)
+    return results
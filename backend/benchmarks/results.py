@@ -0,0 +1,144 @@
+"""
+结果汇总、保存与对比
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
+import os
+import platform
+import subprocess
+import sys
+
+# 结果文件格式版本，字段含义变化时递增
+SCHEMA_VERSION = 1
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# 对比时关注的指标: (路径, 越大越好)
+KEY_METRICS: List[Tuple[str, bool]] = [
+    ("startup.import_ms", False),
+    ("startup.ready_ms", False),
+    ("rest.login.rps", True),
+    ("rest.login.latency_ms.p95", False),
+    ("rest.refresh.rps", True),
+    ("rest.refresh.latency_ms.p95", False),
+    ("rest.list_devices.rps", True),
+    ("rest.list_devices.latency_ms.p50", False),
+    ("rest.list_devices.latency_ms.p95", False),
+    ("rest.list_devices.latency_ms.p99", False),
+    ("websocket.fanout_fps", True),
+    ("websocket.delivery_ratio", True),
+    ("websocket.latency_ms.p50", False),
+    ("websocket.latency_ms.p95", False),
+    ("websocket.latency_ms.p99", False),
+    ("websocket.memory.bytes_per_connection", False),
+]
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """最近秩法百分位（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms: List[float]) -> dict:
+    """延迟分布"""
+    values = sorted(latencies_ms)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 0.50), 3),
+        "p95": round(percentile(values, 0.95), 3),
+        "p99": round(percentile(values, 0.99), 3),
+        "max": round(values[-1], 3)
+    }
+
+
+def git_revision() -> Dict[str, Optional[str]]:
+    """当前提交（无法获取时为None）"""
+    def run(*args) -> Optional[str]:
+        try:
+            return subprocess.check_output(("git",) + args, stderr=subprocess.DEVNULL, text=True).strip()
+        except Exception:
+            return None
+    status = run("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": run("rev-parse", "HEAD"),
+        "branch": run("rev-parse", "--abbrev-ref", "HEAD"),
+        "dirty": bool(status) if status is not None else None
+    }
+
+
+def environment() -> dict:
+    """运行环境（不同机器上的结果不可直接比较）"""
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def save(result: dict, path: Optional[str] = None) -> str:
+    """保存结果为JSON，默认保存到 results/{提交}-{时间}.json"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        commit = (result["meta"]["git"].get("commit") or "unknown")[:12]
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(RESULTS_DIR, f"{commit}-{stamp}.json")
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(result, handle, indent=2, ensure_ascii=False, sort_keys=True)
+        handle.write("\n")
+    return path
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def lookup(result: dict, path: str) -> Optional[float]:
+    """按点分路径取数值指标，不存在时为None"""
+    value = result
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value if isinstance(value, (int, float)) else None
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> Tuple[List[dict], bool]:
+    """对比两次结果，返回 (各指标变化, 是否有超过阈值的退化)"""
+    rows = []
+    regressed = False
+    for path, higher_is_better in KEY_METRICS:
+        before, after = lookup(baseline, path), lookup(current, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        is_regression = worse > threshold
+        regressed = regressed or is_regression
+        rows.append({
+            "metric": path,
+            "baseline": before,
+            "current": after,
+            "change": round(change * 100, 1),
+            "regression": is_regression
+        })
+    return rows, regressed
+
+
+def format_comparison(rows: List[dict]) -> str:
+    """对比结果的文本表格"""
+    lines = [f"{'metric':<44}{'baseline':>14}{'current':>14}{'change':>10}"]
+    for row in rows:
+        flag = "  <-- regression" if row["regression"] else ""
+        lines.append(
+            f"{row['metric']:<44}{row['baseline']:>14.3f}{row['current']:>14.3f}{row['change']:>9.1f}%{flag}"
+        )
+    return "\n".join(lines)
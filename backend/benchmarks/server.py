@@ -0,0 +1,151 @@
+"""
+基准测试用的服务器：预置数据的SQLite数据库 + 独立进程中的uvicorn
+"""
+from typing import Dict, List, Optional
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 预置用户的密码（所有用户相同，只计算一次bcrypt）
+PASSWORD = "benchmark-password"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """进程的常驻内存（只支持Linux）"""
+    try:
+        with open(f"/proc/{pid}/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+class BenchServer:
+    """启动和停止被测服务器"""
+
+    def __init__(self, users: int, devices_per_user: int, env: Dict[str, str] = None):
+        self.users = users
+        self.devices_per_user = devices_per_user
+        self.workdir = tempfile.mkdtemp(prefix="bm-bench-")
+        self.database_url = f"sqlite:///{os.path.join(self.workdir, 'bench.db')}"
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.ws_url = f"ws://127.0.0.1:{self.port}"
+        self.env = dict(os.environ)
+        self.env.update({
+            "DATABASE_URL": self.database_url,
+            "ASYNC_DATABASE_URL": "",
+            "UPLOAD_DIR": os.path.join(self.workdir, "uploads"),
+            "LOG_FILE": os.path.join(self.workdir, "app.log"),
+            # 基准测试不应被准入控制和限流影响
+            "WS_MAX_CONNECTIONS": "1000000",
+            "WS_MAX_CONNECTIONS_PER_USER": "1000000",
+            "WS_FRAME_RATE": "100000",
+            "WS_FRAME_BURST": "100000",
+            "PASSWORD_HASH_MAX_PENDING": "100000",
+        })
+        self.env.update(env or {})
+        self.process: Optional[subprocess.Popen] = None
+        # 从启动进程到首次响应的时间
+        self.ready_ms: Optional[float] = None
+        # 预置的用户名和设备ID
+        self.usernames: List[str] = []
+        self.device_ids: List[str] = []
+
+    def seed(self):
+        """建表并写入预置的用户和设备（在子进程中执行，不影响当前进程的配置）"""
+        code = (
+            "import sys, json\n"
+            "from benchmarks.server import _seed\n"
+            "print(json.dumps(_seed(int(sys.argv[1]), int(sys.argv[2]))))\n"
+        )
+        output = subprocess.check_output(
+            [sys.executable, "-c", code, str(self.users), str(self.devices_per_user)],
+            cwd=BACKEND_DIR, env=self.env, text=True
+        )
+        seeded = json.loads(output.strip().splitlines()[-1])
+        self.usernames = seeded["usernames"]
+        self.device_ids = seeded["device_ids"]
+
+    def start(self, timeout: float = 30.0):
+        """启动uvicorn并等待就绪"""
+        started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=self.env
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"服务器启动失败，退出码 {self.process.returncode}")
+            try:
+                if httpx.get(self.base_url + "/", timeout=1.0).status_code == 200:
+                    self.ready_ms = round((time.perf_counter() - started) * 1000, 1)
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        raise RuntimeError("等待服务器启动超时")
+
+    def rss(self) -> Optional[int]:
+        return rss_bytes(self.process.pid) if self.process is not None else None
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _seed(users: int, devices_per_user: int) -> dict:
+    """写入预置数据（由 BenchServer.seed 在设置好环境变量的子进程中调用）"""
+    from app.core.database import Base, SessionLocal, engine
+    from app.core.security import get_password_hash
+    from app.models.device import Device, DeviceType
+    from app.models.user import User
+    from app.models.user_device import UserDevice
+
+    Base.metadata.create_all(bind=engine)
+    password_hash = get_password_hash(PASSWORD)
+    usernames, device_ids = [], []
+    db = SessionLocal()
+    try:
+        for index in range(users):
+            user_id = str(uuid.uuid4())
+            username = f"bench{index}"
+            db.add(User(user_id=user_id, username=username, email=f"{username}@example.com",
+                        password_hash=password_hash))
+            usernames.append(username)
+            for number in range(devices_per_user):
+                device_id = f"cam-{index}-{number}"
+                db.add(Device(device_id=device_id, device_name=device_id, device_type=DeviceType.CAMERA))
+                db.add(UserDevice(user_id=user_id, device_id=device_id, device_name=device_id,
+                                  device_type=DeviceType.CAMERA.value, is_owner=True, permissions="ADMIN"))
+                device_ids.append(device_id)
+        db.commit()
+    finally:
+        db.close()
+    return {"usernames": usernames, "device_ids": device_ids}
@@ -0,0 +1,141 @@
+"""
+WebSocket扇出：N个摄像头推送二进制帧，每个摄像头M个查看端接收
+
+帧负载的前8字节为发送时的 time.perf_counter()，查看端据此计算端到端延迟
+（摄像头和查看端在同一进程中，时钟一致）。
+"""
+from typing import List, Optional
+import asyncio
+import json
+import struct
+import time
+
+import websockets
+
+from app.websocket.protocol import FRAME_HEADER_SIZE, FRAME_TYPE_VIDEO, pack_frame
+from benchmarks.results import summarize
+from benchmarks.server import BenchServer
+
+SEND_TIME = struct.Struct("!d")
+
+
+class ViewerStats:
+    __slots__ = ("frames", "bytes", "latencies")
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.latencies: List[float] = []
+
+
+async def _open(url: str) -> websockets.WebSocketClientProtocol:
+    connection = await websockets.connect(url, max_size=None, compression=None, ping_interval=None)
+    # connection_established
+    await connection.recv()
+    return connection
+
+
+async def _camera(connection, fps: int, duration: float, frame_size: int, keyframe_interval: int) -> int:
+    """按固定帧率发送，返回发送的帧数"""
+    padding = b"\0" * max(0, frame_size - SEND_TIME.size)
+    interval = 1.0 / fps
+    started = time.perf_counter()
+    seq = 0
+    while True:
+        now = time.perf_counter()
+        if now - started >= duration:
+            return seq
+        payload = SEND_TIME.pack(now) + padding
+        await connection.send(pack_frame(FRAME_TYPE_VIDEO, seq, int(time.time() * 1000), payload,
+                                         is_keyframe=seq % keyframe_interval == 0))
+        seq += 1
+        await asyncio.sleep(max(0.0, started + seq * interval - time.perf_counter()))
+
+
+async def _viewer(connection, stats: ViewerStats):
+    """接收直到连接关闭，回复服务器的ping"""
+    try:
+        async for message in connection:
+            if isinstance(message, bytes):
+                received = time.perf_counter()
+                (sent,) = SEND_TIME.unpack_from(message, FRAME_HEADER_SIZE)
+                stats.frames += 1
+                stats.bytes += len(message)
+                stats.latencies.append((received - sent) * 1000)
+            elif json.loads(message).get("type") == "ping":
+                await connection.send(json.dumps({"type": "pong"}))
+    except websockets.ConnectionClosed:
+        pass
+
+
+async def run_streaming(server: BenchServer, cameras: int, viewers: int, fps: int, duration: float,
+                        frame_size: int, keyframe_interval: int) -> dict:
+    """运行扇出测试"""
+    device_ids = server.device_ids[:cameras]
+    if len(device_ids) < cameras:
+        raise ValueError(f"预置设备数 {len(server.device_ids)} 少于摄像头数 {cameras}")
+
+    rss_before: Optional[int] = server.rss()
+    connect_ms: List[float] = []
+
+    async def timed_open(url: str):
+        started = time.perf_counter()
+        connection = await _open(url)
+        connect_ms.append((time.perf_counter() - started) * 1000)
+        return connection
+
+    camera_connections = await asyncio.gather(*(
+        timed_open(f"{server.ws_url}/api/v1/ws/camera/{device_id}") for device_id in device_ids
+    ))
+    viewer_connections = await asyncio.gather(*(
+        timed_open(f"{server.ws_url}/api/v1/ws/viewer/{device_id}")
+        for device_id in device_ids for _ in range(viewers)
+    ))
+    # 等待服务器完成连接相关的分配后再测量内存
+    await asyncio.sleep(0.5)
+    rss_after: Optional[int] = server.rss()
+    total_connections = len(camera_connections) + len(viewer_connections)
+    print(f"  已建立 {len(camera_connections)} 个摄像头和 {len(viewer_connections)} 个查看端连接")
+
+    stats = [ViewerStats() for _ in viewer_connections]
+    receivers = [asyncio.ensure_future(_viewer(connection, stat))
+                 for connection, stat in zip(viewer_connections, stats)]
+
+    started = time.perf_counter()
+    sent = await asyncio.gather(*(
+        _camera(connection, fps, duration, frame_size, keyframe_interval) for connection in camera_connections
+    ))
+    elapsed = time.perf_counter() - started
+    # 等待队列中的帧发送完
+    await asyncio.sleep(1.0)
+
+    await asyncio.gather(*(connection.close() for connection in camera_connections + viewer_connections),
+                         return_exceptions=True)
+    await asyncio.gather(*receivers, return_exceptions=True)
+
+    frames_sent = sum(sent)
+    expected = frames_sent * viewers
+    received = sum(stat.frames for stat in stats)
+    received_bytes = sum(stat.bytes for stat in stats)
+    latencies = [value for stat in stats for value in stat.latencies]
+
+    memory = {"rss_before": rss_before, "rss_after": rss_after, "bytes_per_connection": None}
+    if rss_before is not None and rss_after is not None and total_connections:
+        memory["bytes_per_connection"] = round((rss_after - rss_before) / total_connections)
+
+    return {
+        "cameras": cameras,
+        "viewers_per_camera": viewers,
+        "fps": fps,
+        "frame_size": frame_size,
+        "duration_s": round(elapsed, 3),
+        "frames_sent": frames_sent,
+        "frames_expected": expected,
+        "frames_received": received,
+        "delivery_ratio": round(received / expected, 4) if expected else 0.0,
+        "fanout_fps": round(received / elapsed, 2) if elapsed else 0.0,
+        "fanout_mbps": round(received_bytes * 8 / elapsed / 1e6, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "connect_ms": summarize(connect_ms),
+        "memory": memory
+    }
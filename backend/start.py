@@ -18,6 +18,15 @@ if __name__ == "__main__":
     os.makedirs("logs", exist_ok=True)
     os.makedirs("uploads", exist_ok=True)
     os.makedirs("models", exist_ok=True)
+
+    # 数据库迁移在启动worker之前执行一次（而不是每个worker启动时）
+    if settings.MIGRATE_ON_START:
+        from alembic import command
+        from alembic.config import Config
+
+        alembic_config = Config(str(project_root / "alembic.ini"))
+        alembic_config.set_main_option("script_location", str(project_root / "alembic"))
+        command.upgrade(alembic_config, "head")
     
     # 启动服务器
     uvicorn.run(
@@ -26,5 +35,8 @@ if __name__ == "__main__":
         port=settings.PORT,
         reload=settings.DEBUG,
         log_level=settings.LOG_LEVEL.lower(),
-        access_log=True
+        access_log=True,
+        # 协议层ping/pong（浏览器和WebSocket客户端库自动回复），检测只接收数据的失联查看端
+        ws_ping_interval=settings.WS_HEARTBEAT_INTERVAL,
+        ws_ping_timeout=settings.WS_HEARTBEAT_INTERVAL
     )
@@ -0,0 +1,44 @@
+"""
+测试配置：使用临时SQLite数据库，日志输出到标准错误
+
+环境变量必须在导入 app 之前设置（配置在导入时读取）。
+"""
+import os
+import tempfile
+import uuid
+
+_workdir = tempfile.mkdtemp(prefix="bm-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_workdir, 'test.db')}"
+os.environ["ASYNC_DATABASE_URL"] = ""
+os.environ["UPLOAD_DIR"] = os.path.join(_workdir, "uploads")
+os.environ["LOG_FILE"] = ""
+os.environ["WARMUP_DELAY"] = "3600"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.database import Base, engine
+from app.models import device, user, user_device  # noqa: F401
+
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth(client):
+    """注册并登录一个新用户，返回 (令牌响应, 认证头)"""
+    username = f"u{uuid.uuid4().hex[:12]}"
+    response = client.post("/api/v1/auth/register", json={
+        "username": username, "email": f"{username}@example.com", "password": "secret-password"
+    })
+    assert response.status_code == 200, response.text
+    response = client.post("/api/v1/auth/login", data={"username": username, "password": "secret-password"})
+    assert response.status_code == 200, response.text
+    tokens = response.json()
+    return tokens, {"Authorization": f"Bearer {tokens['access_token']}"}
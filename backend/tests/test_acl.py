@@ -0,0 +1,159 @@
+"""
+设备权限缓存
+"""
+from types import SimpleNamespace
+import asyncio
+
+import pytest
+
+from app.services.acl import ACL_KEY, ACL_VERSION_KEY, DevicePermission, DevicePermissionCache
+
+
+class FakeResult:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+
+class FakeSession:
+    """返回固定权限行的数据库会话替身，execute 在 release 之前一直挂起"""
+
+    def __init__(self, permissions: str):
+        self.row = SimpleNamespace(is_owner=True, permissions=permissions)
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.queries = 0
+
+    async def execute(self, statement):
+        self.queries += 1
+        self.started.set()
+        await self.release.wait()
+        return FakeResult(self.row)
+
+
+def test_lookup_result_is_cached():
+    async def scenario():
+        cache = DevicePermissionCache(max_size=10, ttl=60)
+        db = FakeSession("rw")
+        db.release.set()
+        first = await cache.get(db, "user-1", "dev-1")
+        second = await cache.get(db, "user-1", "dev-1")
+        return first, second, db.queries
+
+    first, second, queries = asyncio.run(scenario())
+    assert first == second == DevicePermission(True, "rw")
+    assert queries == 1
+
+
+def test_invalidate_during_lookup_skips_store():
+    async def scenario():
+        cache = DevicePermissionCache(max_size=10, ttl=60)
+        stale = FakeSession("rw")
+        lookup = asyncio.create_task(cache.get(stale, "user-1", "dev-1"))
+        await stale.started.wait()
+
+        # 查询进行中权限被修改
+        await cache.invalidate("user-1", "dev-1")
+        stale.release.set()
+        result = await lookup
+
+        fresh = FakeSession("r")
+        fresh.release.set()
+        return result, await cache.get(fresh, "user-1", "dev-1"), fresh.queries
+
+    result, refreshed, queries = asyncio.run(scenario())
+    assert result == DevicePermission(True, "rw")
+    assert refreshed == DevicePermission(True, "r")
+    assert queries == 1
+
+
+def test_generation_table_is_bounded():
+    async def scenario():
+        cache = DevicePermissionCache(max_size=2, ttl=60)
+        stale = FakeSession("rw")
+        lookup = asyncio.create_task(cache.get(stale, "user-1", "dev-1"))
+        await stale.started.wait()
+
+        # 失效其他设备使代数表被清空，进行中的查询仍视为已失效
+        for device_id in ("dev-2", "dev-3", "dev-4"):
+            await cache.invalidate_device(device_id)
+        stale.release.set()
+        await lookup
+        return cache, len(cache._invalidated)
+
+    cache, tracked = asyncio.run(scenario())
+    assert tracked <= 2
+    assert cache.stats()["size"] == 0
+
+
+def _redis_workers(count: int):
+    """共用同一个（模拟的）Redis的多个worker缓存"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    caches = []
+    for _ in range(count):
+        cache = DevicePermissionCache(max_size=10, ttl=60)
+        cache.redis = fakeredis.FakeAsyncRedis(server=server)
+        caches.append(cache)
+    return caches
+
+
+def test_redis_tier_is_shared_between_workers():
+    async def scenario():
+        first, second = _redis_workers(2)
+        db = FakeSession("rw")
+        db.release.set()
+        await first.get(db, "user-1", "dev-1")
+        permission = await second.get(db, "user-1", "dev-1")
+        ttl = await first.redis.ttl(ACL_KEY.format(device_id="dev-1", user_id="user-1"))
+        return permission, db.queries, second.redis_hits, ttl
+
+    permission, queries, redis_hits, ttl = asyncio.run(scenario())
+    assert permission == DevicePermission(True, "rw")
+    assert queries == 1
+    assert redis_hits == 1
+    assert 0 < ttl <= 60
+
+
+def test_invalidate_on_other_worker_during_lookup_skips_redis_store():
+    async def scenario():
+        first, second, third = _redis_workers(3)
+        stale = FakeSession("rw")
+        lookup = asyncio.create_task(first.get(stale, "user-1", "dev-1"))
+        await stale.started.wait()
+
+        # 其他worker在查询进行中修改了权限（本worker尚未收到失效通知）
+        await second.invalidate("user-1", "dev-1")
+        stale.release.set()
+        await lookup
+
+        fresh = FakeSession("r")
+        fresh.release.set()
+        stored = await third.redis.get(ACL_KEY.format(device_id="dev-1", user_id="user-1"))
+        return stored, await third.get(fresh, "user-1", "dev-1"), fresh.queries
+
+    stored, refreshed, queries = asyncio.run(scenario())
+    assert stored is None
+    assert refreshed == DevicePermission(True, "r")
+    assert queries == 1
+
+
+def test_invalidate_device_expires_redis_entries_of_all_users():
+    async def scenario():
+        first, second = _redis_workers(2)
+        db = FakeSession("rw")
+        db.release.set()
+        await first.get(db, "user-1", "dev-1")
+        await first.get(db, "user-2", "dev-1")
+        await first.invalidate_device("dev-1")
+        await second.get(db, "user-1", "dev-1")
+        await second.get(db, "user-2", "dev-1")
+        version_ttl = await first.redis.ttl(ACL_VERSION_KEY.format(device_id="dev-1"))
+        return db.queries, second.redis_hits, version_ttl
+
+    queries, redis_hits, version_ttl = asyncio.run(scenario())
+    assert queries == 4
+    assert redis_hits == 0
+    assert 60 < version_ttl <= 120
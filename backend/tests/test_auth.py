@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import security
+from app.core.security import TokenCache, create_access_token, revoke_token, token_cache, verify_token
+
+
+def test_token_rejected_after_logout(client, auth):
+    _, headers = auth
+    assert client.get("/api/v1/devices/", headers=headers).status_code == 200
+
+    assert client.post("/api/v1/auth/logout", headers=headers).status_code == 200
+
+    # 缓存被清除后重新解码签名有效的令牌也必须失败
+    assert client.get("/api/v1/devices/", headers=headers).status_code == 401
+    assert client.get("/api/v1/auth/profile", headers=headers).status_code == 401
+
+
+def test_other_tokens_unaffected_by_logout(client, auth):
+    _, headers = auth
+    other = create_access_token(data={"sub": "someone-else"})
+    asyncio.run(revoke_token(token=headers["Authorization"].split()[1]))
+    assert verify_token(other)["sub"] == "someone-else"
+
+
+def test_revoked_entries_expire():
+    cache = TokenCache(max_size=10, max_ttl=300)
+    cache.deny("expired", 0)
+    cache.deny("active", 2 ** 40)
+    assert not cache.is_revoked("expired")
+    assert cache.is_revoked("active")
+    assert cache.stats()["revoked"] == 1
+
+
+def test_revoked_token_fails_verification():
+    token = create_access_token(data={"sub": "user-1"})
+    assert verify_token(token)["sub"] == "user-1"
+    asyncio.run(revoke_token(token=token, user_id="user-1"))
+    with pytest.raises(HTTPException) as error:
+        verify_token(token)
+    assert error.value.status_code == 401
+    assert token_cache.get(token) is None
+
+
+def test_revocation_is_shared_between_workers(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    token = create_access_token(data={"sub": "user-1"})
+
+    async def scenario():
+        first, second = TokenCache(max_size=10, max_ttl=300), TokenCache(max_size=10, max_ttl=300)
+        await first.start(fakeredis.FakeAsyncRedis(server=server))
+        await second.start(fakeredis.FakeAsyncRedis(server=server))
+
+        # 在第一个worker登出，第二个worker上缓存过的令牌也必须失效
+        monkeypatch.setattr(security, "token_cache", second)
+        verify_token(token)
+        monkeypatch.setattr(security, "token_cache", first)
+        await revoke_token(token=token, user_id="user-1")
+        for _ in range(50):
+            if second.is_revoked(token):
+                break
+            await asyncio.sleep(0.01)
+
+        # 撤销之后启动的worker从Redis加载撤销列表
+        late = TokenCache(max_size=10, max_ttl=300)
+        await late.start(fakeredis.FakeAsyncRedis(server=server))
+        for cache in (first, second, late):
+            await cache.stop()
+        return second, late
+
+    second, late = asyncio.run(scenario())
+    for cache in (second, late):
+        monkeypatch.setattr(security, "token_cache", cache)
+        with pytest.raises(HTTPException) as error:
+            verify_token(token)
+        assert error.value.detail == "Token has been revoked"
+    assert late.stats()["revoked"] == 1
@@ -0,0 +1,205 @@
+"""
+集群模式：两个管理器共享同一个 LocalBroker 模拟两个worker
+"""
+from typing import List
+import asyncio
+import json
+
+import pytest
+from starlette.datastructures import QueryParams
+
+from app.core.config import settings
+from app.websocket.cluster import PRESENCE_CHANNEL, ClusterBackplane, ClusterBroker, LocalBroker
+from app.websocket.manager import WebSocketManager
+from app.websocket.protocol import FRAME_TYPE_AUDIO
+from app.websocket.registry import ROLE_CAMERA, ROLE_VIEWER
+
+
+class FakeWebSocket:
+    """记录发送内容的WebSocket替身"""
+
+    def __init__(self):
+        self.query_params = QueryParams("")
+        self.scope = {}
+        self.texts: List[dict] = []
+        self.frames: List[bytes] = []
+        self.closed = False
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text: str):
+        self.texts.append(json.loads(text))
+
+    async def send_bytes(self, data: bytes):
+        self.frames.append(data)
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.closed = True
+
+    def received(self, message_type: str) -> List[dict]:
+        return [message for message in self.texts if message.get("type") == message_type]
+
+
+class SlowBroker(LocalBroker):
+    """发布较慢的消息代理，出站队列会积压；before_publish 模拟发布期间运行的其他协程"""
+
+    def __init__(self):
+        super().__init__()
+        self.before_publish = None
+
+    async def publish(self, channel: str, data: bytes):
+        if self.before_publish is not None:
+            self.before_publish(channel)
+        await asyncio.sleep(0.001)
+        await super().publish(channel, data)
+
+
+async def _settle():
+    """等待背板的发送队列和订阅循环处理完毕"""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("等待超时")
+
+
+async def _two_workers():
+    broker = LocalBroker()
+    first, second = WebSocketManager(), WebSocketManager()
+    await first.enable_cluster(broker, worker_id="w1")
+    await second.enable_cluster(broker, worker_id="w2")
+    return first, second
+
+
+async def _shutdown(*managers: WebSocketManager):
+    for manager in managers:
+        await manager.disable_cluster()
+
+
+def test_cluster_broker_is_abstract():
+    with pytest.raises(TypeError):
+        ClusterBroker()
+
+    class PartialBroker(ClusterBroker):
+        async def publish(self, channel, data):
+            pass
+
+    with pytest.raises(TypeError):
+        PartialBroker()
+
+
+def test_send_to_camera_routes_to_other_worker():
+    async def scenario():
+        first, second = await _two_workers()
+        camera = FakeWebSocket()
+        await first.connect(camera, "dev-1", role=ROLE_CAMERA)
+        await _settle()
+
+        await second.send_to_camera("dev-1", {"type": "ptz", "pan": 10})
+        await second.send_to_camera("dev-2", {"type": "ptz", "pan": 20})
+        await _settle()
+        await _shutdown(first, second)
+        return camera
+
+    camera = asyncio.run(scenario())
+    assert camera.received("ptz") == [{"type": "ptz", "pan": 10}]
+
+
+def test_frames_fan_out_to_viewers_on_both_workers():
+    async def scenario():
+        first, second = await _two_workers()
+        local_viewer, remote_viewer, other_viewer = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        await first.connect(local_viewer, "dev-1", role=ROLE_VIEWER)
+        await second.connect(remote_viewer, "dev-1", role=ROLE_VIEWER)
+        await second.connect(other_viewer, "dev-2", role=ROLE_VIEWER)
+        await _settle()
+
+        frame = bytes([FRAME_TYPE_AUDIO]) + b"payload"
+        first.relay_frame("dev-1", frame, True)
+        await _settle()
+        await _shutdown(first, second)
+        return local_viewer, remote_viewer, other_viewer, frame
+
+    local_viewer, remote_viewer, other_viewer, frame = asyncio.run(scenario())
+    assert local_viewer.frames == [frame]
+    assert remote_viewer.frames == [frame]
+    assert other_viewer.frames == []
+
+
+def test_presence_follows_connect_and_disconnect():
+    async def scenario():
+        first, second = await _two_workers()
+        camera = FakeWebSocket()
+        await first.connect(camera, "dev-1", role=ROLE_CAMERA)
+        await _settle()
+        online = second.is_device_online("dev-1")
+
+        first.disconnect(camera)
+        await _settle()
+        offline = second.is_device_online("dev-1")
+        await _shutdown(first, second)
+        return online, offline
+
+    online, offline = asyncio.run(scenario())
+    assert online is True
+    assert offline is False
+
+
+def test_presence_order_is_kept_when_outbox_is_full(monkeypatch):
+    monkeypatch.setattr(settings, "WS_CLUSTER_OUTBOX_SIZE", 4)
+
+    async def ignore_text(scope, key, text):
+        pass
+
+    async def scenario():
+        broker = SlowBroker()
+        first = ClusterBackplane(broker, ignore_text, lambda *args: None, "w1")
+        second = ClusterBackplane(broker, ignore_text, lambda *args: None, "w2")
+        await first.start()
+        await second.start()
+        events = await broker.subscribe([PRESENCE_CHANNEL])
+        second.set_local_presence(ROLE_VIEWER, "dev-1", True)
+        await _wait_for(lambda: first.is_present(ROLE_VIEWER, "dev-1"))
+
+        presence = []
+
+        def toggle(channel):
+            # 出站队列被视频帧占满时摄像头反复上下线
+            if channel.startswith("ws:route:") and len(presence) < 20:
+                online = len(presence) % 2 == 0
+                first.set_local_presence(ROLE_CAMERA, "dev-2", online)
+                presence.append(online)
+                first.route_frame("dev-1", b"frame", False)
+
+        broker.before_publish = toggle
+        for _ in range(settings.WS_CLUSTER_OUTBOX_SIZE):
+            first.route_frame("dev-1", b"frame", False)
+        await _wait_for(lambda: len(presence) == 20 and not first.stats()["outbox_depth"])
+        await _settle()
+
+        published = []
+        while True:
+            try:
+                _, data = await asyncio.wait_for(events.__anext__(), 0.05)
+            except asyncio.TimeoutError:
+                break
+            event = json.loads(data)
+            if event["worker"] == "w1":
+                published.append(event["present"])
+        remote = second.is_present(ROLE_CAMERA, "dev-2")
+        stored = await broker.load_presence()
+        await first.stop()
+        await second.stop()
+        return presence, published, remote, stored
+
+    presence, published, remote, stored = asyncio.run(scenario())
+    assert len(presence) == 20
+    assert published == presence
+    assert remote is False
+    assert (ROLE_CAMERA, "dev-2", "w1") not in stored
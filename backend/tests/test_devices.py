@@ -0,0 +1,74 @@
+import uuid
+
+from app.services.presence import presence_tracker
+
+
+def _create_devices(client, headers, count, device_type="CAMERA"):
+    prefix = uuid.uuid4().hex[:8]
+    device_ids = [f"{prefix}-{index:02d}" for index in range(count)]
+    for device_id in device_ids:
+        response = client.post("/api/v1/devices/", headers=headers, json={
+            "device_id": device_id, "device_name": device_id, "device_type": device_type
+        })
+        assert response.status_code == 200, response.text
+    return device_ids
+
+
+def _list_all(client, headers, **params):
+    """沿 X-Next-Cursor 翻页取完所有设备"""
+    device_ids, after = [], None
+    while True:
+        query = dict(params, **({"after": after} if after else {}))
+        response = client.get("/api/v1/devices/", headers=headers, params=query)
+        assert response.status_code == 200, response.text
+        page = [device["device_id"] for device in response.json()]
+        assert len(page) <= params.get("limit", 50)
+        device_ids.extend(page)
+        after = response.headers.get("X-Next-Cursor")
+        if not after:
+            return device_ids
+
+
+def test_cursor_pagination_returns_every_device_once(client, auth):
+    _, headers = auth
+    device_ids = _create_devices(client, headers, 5)
+
+    assert _list_all(client, headers, limit=2) == sorted(device_ids)
+
+    response = client.get("/api/v1/devices/", headers=headers, params={"limit": 5})
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_invalid_cursor_rejected(client, auth):
+    _, headers = auth
+    response = client.get("/api/v1/devices/", headers=headers, params={"after": "%%%"})
+    assert response.status_code == 400
+
+
+def test_device_type_filter(client, auth):
+    _, headers = auth
+    cameras = _create_devices(client, headers, 2, "CAMERA")
+    viewers = _create_devices(client, headers, 2, "VIEWER")
+
+    assert _list_all(client, headers, device_type="CAMERA") == sorted(cameras)
+    assert _list_all(client, headers, device_type="VIEWER", limit=1) == sorted(viewers)
+
+
+def test_is_online_filter_uses_live_presence(client, auth):
+    _, headers = auth
+    device_ids = _create_devices(client, headers, 6)
+    # 只更新内存状态，数据库中的 is_online 尚未写回
+    online = device_ids[1::2]
+    for device_id in online:
+        presence_tracker.mark_online(device_id)
+
+    response = client.get("/api/v1/devices/", headers=headers, params={"is_online": "true"})
+    assert [device["device_id"] for device in response.json()] == online
+    assert all(device["is_online"] for device in response.json())
+
+    # 过滤后分页仍能凑满每页并取完所有结果
+    assert _list_all(client, headers, is_online="true", limit=2) == online
+    assert _list_all(client, headers, is_online="false", limit=2) == device_ids[0::2]
+
+    presence_tracker.mark_offline(online[0])
+    assert _list_all(client, headers, is_online="true", limit=1) == online[1:]
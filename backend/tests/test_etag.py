@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.services.etag import DeviceState, compute_etag, etag_matches
+from app.services.presence import presence_tracker
+
+
+def _state(device_id, last_seen):
+    return DeviceState(device_id, ("content",), False, last_seen)
+
+
+def test_last_seen_within_flush_interval_keeps_etag():
+    interval = settings.PRESENCE_FLUSH_INTERVAL
+    start = datetime(1970, 1, 1) + timedelta(seconds=1_000_000 * interval)
+    assert compute_etag([_state("etag-a", start)]) == compute_etag([_state("etag-a", start + timedelta(seconds=interval / 2))])
+    assert compute_etag([_state("etag-a", start)]) != compute_etag([_state("etag-a", start + timedelta(seconds=interval))])
+
+
+def test_online_change_changes_etag():
+    state = _state("etag-b", None)
+    offline = compute_etag([state])
+    presence_tracker.mark_online("etag-b")
+    assert compute_etag([state]) != offline
+    presence_tracker.mark_offline("etag-b")
+
+
+def test_etag_matching_is_weak():
+    etag = compute_etag([_state("etag-c", None)])
+    assert etag.startswith('W/"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(etag[2:], etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert not etag_matches('"other"', etag)
+    assert etag_matches("*", etag)
+
+
+def test_heartbeat_returns_not_modified(client, auth):
+    _, headers = auth
+    device_id = "etag-hb-" + headers["Authorization"][-8:]
+    client.post("/api/v1/devices/", headers=headers, json={
+        "device_id": device_id, "device_name": device_id, "device_type": "CAMERA"
+    })
+    interval = settings.PRESENCE_FLUSH_INTERVAL
+    start = datetime(2026, 1, 1) + timedelta(seconds=interval * 1000)
+
+    presence_tracker._state[device_id] = (True, start)
+    etag = client.get("/api/v1/devices/", headers=headers).headers["ETag"]
+
+    # 同一写回间隔内的心跳只改变 last_seen，列表仍返回304
+    presence_tracker._state[device_id] = (True, start + timedelta(seconds=interval / 2))
+    response = client.get("/api/v1/devices/", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 304
+
+    presence_tracker._state[device_id] = (True, start + timedelta(seconds=interval))
+    response = client.get("/api/v1/devices/", headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 200
@@ -0,0 +1,33 @@
+"""
+HTTP Range 解析
+"""
+import pytest
+
+from app.core.file_response import RangeNotSatisfiable, parse_range
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    # 结束位置超出文件大小时截断
+    ("bytes=900-2000", (900, 999)),
+    # 开放结尾
+    ("bytes=100-", (100, 999)),
+    # 最后N个字节，N超出文件大小时返回完整文件
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    # 不支持的格式和多个范围按完整文件响应
+    ("items=0-99", None),
+    ("bytes=a-b", None),
+    ("bytes=0-9,20-29", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1500-2000", "bytes=50-10", "bytes=-0"])
+def test_unsatisfiable_range(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, SIZE)
@@ -0,0 +1,15 @@
+"""
+健康检查
+"""
+from app.services.health import health_checker
+
+
+def test_redis_is_not_probed_when_not_configured(client):
+    health_checker._result = None
+    response = client.get("/health")
+    body = response.json()
+    assert response.status_code == 200
+    assert body["redis"] == {"status": "disabled"}
+    assert body["database"]["status"] == "connected"
+    assert body["status"] == "healthy"
+    assert health_checker._redis is None
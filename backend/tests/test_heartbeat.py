@@ -0,0 +1,86 @@
+"""
+心跳与空闲连接清理（缩短时间参数后使用真实的时间轮）
+"""
+from typing import List, Optional, Tuple
+import asyncio
+
+import pytest
+from starlette.datastructures import QueryParams
+
+from app.core.config import settings
+from app.websocket.manager import WebSocketManager
+from app.websocket.protocol import FRAME_TYPE_AUDIO
+from app.websocket.registry import ROLE_CAMERA, ROLE_VIEWER
+
+
+class FakeWebSocket:
+    """记录关闭原因的WebSocket替身，hang 为 True 时发送一直挂起（对端失联）"""
+
+    def __init__(self):
+        self.query_params = QueryParams("")
+        self.scope = {}
+        self.hang = False
+        self.frames = 0
+        self.closed: Optional[Tuple[int, str]] = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def _send(self):
+        if self.hang:
+            await asyncio.Event().wait()
+
+    async def send_text(self, text: str):
+        await self._send()
+
+    async def send_bytes(self, data: bytes):
+        await self._send()
+        self.frames += 1
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.closed = (code, reason)
+
+
+@pytest.fixture
+def fast_heartbeat(monkeypatch):
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_TICK", 0.01)
+    monkeypatch.setattr(settings, "WS_HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT", 0.15)
+    monkeypatch.setattr(settings, "WS_SEND_TIMEOUT", 60)
+
+
+def test_idle_eviction(fast_heartbeat):
+    async def scenario():
+        manager = WebSocketManager()
+        await manager.heartbeat.start()
+        # 摄像头推流时视为活跃；查看端只接收画面、从不回复ping
+        streaming_camera, streamed_viewer = FakeWebSocket(), FakeWebSocket()
+        silent_camera, stalled_viewer = FakeWebSocket(), FakeWebSocket()
+        camera = await manager.connect(streaming_camera, "dev-1", role=ROLE_CAMERA)
+        await manager.connect(streamed_viewer, "dev-1", role=ROLE_VIEWER)
+        await manager.connect(silent_camera, "dev-2", role=ROLE_CAMERA)
+        await manager.connect(stalled_viewer, "dev-1", role=ROLE_VIEWER)
+        stalled_viewer.hang = True
+
+        frame = bytes([FRAME_TYPE_AUDIO]) + b"payload"
+        for _ in range(40):
+            camera.on_receive(len(frame))
+            manager.relay_frame("dev-1", frame, False)
+            await asyncio.sleep(0.01)
+
+        stats = manager.heartbeat.stats()
+        connected = manager.get_connection_count()
+        await manager.heartbeat.stop()
+        for record in list(manager.registry.connections.values()):
+            manager.disconnect(record.websocket)
+        return streaming_camera, streamed_viewer, silent_camera, stalled_viewer, stats, connected
+
+    streaming_camera, streamed_viewer, silent_camera, stalled_viewer, stats, connected = asyncio.run(scenario())
+    assert streaming_camera.closed is None
+    assert streamed_viewer.closed is None
+    assert streamed_viewer.frames > 0
+    assert silent_camera.closed == (1001, "idle timeout")
+    assert stalled_viewer.closed == (1001, "idle timeout")
+    assert stats["evicted"] == 2
+    assert stats["pings"] >= 1
+    assert connected == 2
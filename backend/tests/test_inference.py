@@ -0,0 +1,89 @@
+"""
+AI推理调度：使用 dummy 模型在推理进程中执行（视频得分为平均亮度，音频得分为均方根音量）
+"""
+from typing import List, Tuple
+import asyncio
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.inference import KIND_AUDIO, KIND_VIDEO, InferenceService
+from app.websocket.protocol import FRAME_TYPE_AUDIO, FRAME_TYPE_VIDEO, pack_frame, parse_frame
+
+AUDIO_WINDOW_SECONDS = 0.01
+
+
+@pytest.fixture
+def ai_settings(monkeypatch):
+    monkeypatch.setattr(settings, "AI_VIDEO_MODEL", "dummy")
+    monkeypatch.setattr(settings, "AI_AUDIO_MODEL", "dummy")
+    monkeypatch.setattr(settings, "AI_INFERENCE_WORKERS", 1)
+    monkeypatch.setattr(settings, "AI_MAX_BATCH_SIZE", 16)
+    monkeypatch.setattr(settings, "AI_MAX_BATCH_WAIT", 0.1)
+    monkeypatch.setattr(settings, "AI_VIDEO_SAMPLE_INTERVAL", 0.0)
+    monkeypatch.setattr(settings, "AI_AUDIO_WINDOW_SECONDS", AUDIO_WINDOW_SECONDS)
+    monkeypatch.setattr(settings, "AI_EVENT_COOLDOWN", 60.0)
+    monkeypatch.setattr(settings, "MOTION_ENABLED", False)
+
+
+def _video_frame(brightness: int):
+    ok, encoded = cv2.imencode(".jpg", np.full((32, 32, 3), brightness, np.uint8))
+    assert ok
+    return parse_frame(pack_frame(FRAME_TYPE_VIDEO, 1, 1000, encoded.tobytes(), is_keyframe=True))
+
+
+def _audio_frame(amplitude: int):
+    samples = int(settings.AI_AUDIO_SAMPLE_RATE * AUDIO_WINDOW_SECONDS)
+    pcm = np.full(samples, amplitude, dtype="<i2").tobytes()
+    return parse_frame(pack_frame(FRAME_TYPE_AUDIO, 1, 1000, pcm))
+
+
+async def _wait_inferred(service: InferenceService, count: int, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while service.inferred + service.failed < count:
+        assert time.monotonic() < deadline, service.stats()
+        await asyncio.sleep(0.05)
+
+
+def test_batches_per_kind_and_cooldown(ai_settings):
+    events: List[Tuple[str, str]] = []
+
+    async def scenario():
+        service = InferenceService()
+
+        async def notify(request, score):
+            events.append((request.device_id, request.kind))
+
+        service._notify = notify
+        await service.start()
+        try:
+            # 三个摄像头的视频帧（其中一个画面为黑色）和两个摄像头的音频窗口（其中一个静音）
+            service.submit_frame("cam-1", _video_frame(255))
+            service.submit_frame("cam-2", _video_frame(255))
+            service.submit_frame("cam-3", _video_frame(0))
+            service.submit_frame("cam-1", _audio_frame(30000))
+            service.submit_frame("cam-2", _audio_frame(0))
+            await _wait_inferred(service, 5)
+            first = service.stats()
+
+            # 冷却时间内重复检测到的事件不再推送
+            service.submit_frame("cam-1", _video_frame(255))
+            service.submit_frame("cam-1", _audio_frame(30000))
+            await _wait_inferred(service, 7)
+            second = service.stats()
+        finally:
+            await service.stop()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["batches"] == 2
+    assert first["avg_batch_size"] == 2.5
+    assert first["failed"] == 0
+    assert sorted(events) == [("cam-1", KIND_AUDIO), ("cam-1", KIND_VIDEO), ("cam-2", KIND_VIDEO)]
+
+    assert second["inferred"] == 7
+    assert second["batches"] == 4
+    assert len(events) == 3
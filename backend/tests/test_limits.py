@@ -0,0 +1,97 @@
+"""
+WebSocket准入控制与消息限流的计数
+"""
+from typing import Optional, Tuple
+import asyncio
+
+import pytest
+from starlette.datastructures import QueryParams
+
+from app.core.config import settings
+from app.websocket.limits import CLOSE_POLICY_VIOLATION, CLOSE_TRY_AGAIN_LATER
+from app.websocket.manager import WebSocketManager
+from app.websocket.registry import ROLE_CAMERA, ROLE_VIEWER
+
+
+class FakeWebSocket:
+    """记录关闭码的WebSocket替身"""
+
+    def __init__(self):
+        self.query_params = QueryParams("")
+        self.scope = {}
+        self.closed: Optional[Tuple[int, str]] = None
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, text: str):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = None):
+        self.closed = (code, reason)
+
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    monkeypatch.setattr(settings, "WS_MAX_CONNECTIONS", 4)
+    monkeypatch.setattr(settings, "WS_VIEWER_ADMIT_RATIO", 0.5)
+    monkeypatch.setattr(settings, "WS_MAX_CONNECTIONS_PER_USER", 2)
+    monkeypatch.setattr(settings, "WS_THROTTLE_DISCONNECT", 3)
+
+
+def test_admission_counters(small_limits):
+    async def scenario():
+        manager = WebSocketManager()
+        viewers = [FakeWebSocket() for _ in range(3)]
+        cameras = [FakeWebSocket() for _ in range(3)]
+        same_user = FakeWebSocket()
+        await manager.connect(viewers[0], "dev-1", user_id="user-1", role=ROLE_VIEWER)
+        await manager.connect(viewers[1], "dev-1", user_id="user-1", role=ROLE_VIEWER)
+        # 同一用户超出连接数
+        await manager.connect(same_user, "dev-2", user_id="user-1", role=ROLE_VIEWER)
+        # 达到查看端准入比例，新的查看端被拒绝，摄像头仍可连接
+        await manager.connect(viewers[2], "dev-1", user_id="user-2", role=ROLE_VIEWER)
+        await manager.connect(cameras[0], "dev-1", role=ROLE_CAMERA)
+        await manager.connect(cameras[1], "dev-2", role=ROLE_CAMERA)
+        # 连接数已满：新的摄像头挤掉最近连接的查看端
+        await manager.connect(cameras[2], "dev-3", role=ROLE_CAMERA)
+        await asyncio.sleep(0)
+        stats = manager.admission.stats()
+        count = manager.get_connection_count()
+        for record in list(manager.registry.connections.values()):
+            manager.disconnect(record.websocket)
+        return viewers, cameras, same_user, stats, count
+
+    viewers, cameras, same_user, stats, count = asyncio.run(scenario())
+    assert same_user.closed == (CLOSE_POLICY_VIOLATION, "user_limit")
+    assert viewers[2].closed == (CLOSE_TRY_AGAIN_LATER, "viewer_limit")
+    assert viewers[0].closed is None
+    assert viewers[1].closed == (CLOSE_TRY_AGAIN_LATER, "shed")
+    assert all(camera.closed is None for camera in cameras)
+    assert stats["rejected"] == {"global_limit": 0, "user_limit": 1, "viewer_limit": 1}
+    assert stats["shed_viewers"] == 1
+    assert count == 4
+
+
+def test_throttle_counters_and_disconnect(small_limits):
+    async def scenario():
+        manager = WebSocketManager()
+        websocket = FakeWebSocket()
+        record = await manager.connect(websocket, "dev-1", role=ROLE_CAMERA)
+        # 任意的消息类型共用 other 令牌桶
+        other = [manager.allow_message(record, f"custom-{index}") for index in range(settings.WS_MESSAGE_BURST + 1)]
+        # status_update 每秒1条、突发5条，连续超限3条后断开
+        allowed = [manager.allow_message(record, "status_update") for _ in range(8)]
+        await asyncio.sleep(0)
+        return websocket, allowed, other, manager.admission.stats(), manager.get_connection_count()
+
+    websocket, allowed, other, stats, count = asyncio.run(scenario())
+    assert other == [True] * settings.WS_MESSAGE_BURST + [False]
+    assert allowed == [True] * 5 + [False] * 3
+    assert stats["throttled"] == {"status_update": 3, "other": 1}
+    assert stats["throttle_disconnects"] == 1
+    assert websocket.closed == (CLOSE_POLICY_VIOLATION, "rate limit exceeded")
+    assert count == 0
@@ -0,0 +1,80 @@
+"""
+运动检测：背景模型保存在工作进程中，摄像头固定分配给一个工作进程
+"""
+from typing import List
+import asyncio
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.motion import MotionDetector
+from app.websocket.protocol import FRAME_TYPE_VIDEO, pack_frame, parse_frame
+
+
+@pytest.fixture
+def motion_settings(monkeypatch):
+    monkeypatch.setattr(settings, "MOTION_WORKERS", 2)
+    monkeypatch.setattr(settings, "MOTION_IDLE_INTERVAL", 0.0)
+    monkeypatch.setattr(settings, "MOTION_ACTIVE_INTERVAL", 0.0)
+    monkeypatch.setattr(settings, "MOTION_BATCH_WAIT", 0.01)
+
+
+def _frame(brightness: int):
+    ok, encoded = cv2.imencode(".jpg", np.full((240, 320, 3), brightness, np.uint8))
+    assert ok
+    return parse_frame(pack_frame(FRAME_TYPE_VIDEO, 1, 1000, encoded.tobytes(), is_keyframe=True))
+
+
+async def _analyze(detector: MotionDetector, device_ids: List[str], brightness: int, timeout: float = 60.0):
+    """提交一帧并等待分析完成"""
+    expected = detector.analyzed + len(device_ids)
+    for device_id in device_ids:
+        detector.submit(device_id, _frame(brightness))
+    deadline = time.monotonic() + timeout
+    while detector.analyzed < expected:
+        assert time.monotonic() < deadline, detector.stats()
+        await asyncio.sleep(0.01)
+
+
+def test_background_stays_in_assigned_worker(motion_settings):
+    events: List[str] = []
+
+    async def scenario():
+        detector = MotionDetector()
+
+        async def notify(device_id, score, timestamp):
+            events.append(device_id)
+
+        detector._notify = notify
+        await detector.start()
+        try:
+            cameras = ["cam-1", "cam-2", "cam-3"]
+            # 第一帧作为背景，相同画面不触发
+            await _analyze(detector, cameras, 0)
+            await _analyze(detector, cameras, 0)
+            workers = detector.stats()["workers"]
+            still = list(events)
+
+            # 画面变亮：背景在工作进程中，能检测到变化
+            await _analyze(detector, ["cam-1", "cam-3"], 255)
+            active = [detector.is_active(device_id) for device_id in cameras]
+
+            # 重新连接的摄像头从新的背景开始
+            detector.forget("cam-2")
+            await _analyze(detector, ["cam-2"], 255)
+            reconnected = detector.is_active("cam-2")
+            final_workers = detector.stats()["workers"]
+        finally:
+            await detector.stop()
+        return workers, still, active, reconnected, final_workers
+
+    workers, still, active, reconnected, final_workers = asyncio.run(scenario())
+    assert sorted(workers) == [1, 2]
+    assert still == []
+    assert active == [True, False, True]
+    assert sorted(events) == ["cam-1", "cam-3"]
+    assert reconnected is False
+    assert sorted(final_workers) == [1, 2]
@@ -0,0 +1,89 @@
+"""
+录像磁盘预算
+"""
+import os
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import recording
+from app.services.recording import INDEX_ENTRY_SIZE, INDEX_SUFFIX, SEGMENT_SUFFIX, RecordingManager
+from app.websocket.protocol import FRAME_TYPE_VIDEO, pack_frame, parse_frame
+
+SEGMENT_BYTES = 1000
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _segment(upload_dir, device_id: str, start_ms: int, age: float) -> str:
+    """写入一个分段（数据和索引各占 SEGMENT_BYTES 字节），最后写入时间为 age 秒前"""
+    directory = upload_dir / "recordings" / device_id
+    directory.mkdir(parents=True, exist_ok=True)
+    modified = time.time() - age
+    for suffix in (SEGMENT_SUFFIX, INDEX_SUFFIX):
+        path = directory / f"{start_ms}{suffix}"
+        path.write_bytes(b"\0" * SEGMENT_BYTES)
+        os.utime(path, (modified, modified))
+    return str(directory / f"{start_ms}{SEGMENT_SUFFIX}")
+
+
+def test_retention_deletes_oldest_complete_segments(upload_dir):
+    interval = settings.RECORDING_SEGMENT_SECONDS
+    oldest = _segment(upload_dir, "cam-a", 1000, interval * 5)
+    older = _segment(upload_dir, "cam-b", 2000, interval * 4)
+    old = _segment(upload_dir, "cam-a", 3000, interval * 3)
+    # 最近仍在写入的分段（可能属于其他worker）即使超出预算也不删除
+    recent = _segment(upload_dir, "cam-b", 4000, 1)
+
+    segment_size = SEGMENT_BYTES + SEGMENT_BYTES // INDEX_ENTRY_SIZE * INDEX_ENTRY_SIZE
+    manager = RecordingManager(max_bytes=segment_size * 2)
+    manager.enforce_retention()
+
+    assert not os.path.exists(oldest)
+    assert not os.path.exists(older)
+    assert os.path.exists(old)
+    assert os.path.exists(recent)
+    assert manager.deleted_segments == 2
+
+    manager = RecordingManager(max_bytes=1)
+    manager.enforce_retention()
+    assert not os.path.exists(old)
+    assert os.path.exists(recent)
+    assert os.path.exists(recent[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+
+
+def test_failed_writer_is_not_recreated_for_every_frame(tmp_path, monkeypatch):
+    # 上传目录是普通文件，写入线程创建录像目录时失败
+    blocker = tmp_path / "uploads"
+    blocker.write_bytes(b"")
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(blocker))
+    monkeypatch.setattr(settings, "RECORDING_RETRY_INTERVAL", 60)
+
+    created = []
+
+    class CountingWriter(recording.SegmentWriter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    monkeypatch.setattr(recording, "SegmentWriter", CountingWriter)
+    manager = RecordingManager()
+    frame = parse_frame(pack_frame(FRAME_TYPE_VIDEO, 1, 1000, b"frame", is_keyframe=True))
+    for _ in range(50):
+        manager.write("cam-a", frame)
+        created[-1].join(5)
+
+    assert len(created) == 1
+    assert created[0].failed_at is not None
+    assert created[0].dropped_frames == 49
+
+    # 等待时间过后重新创建写入器
+    monkeypatch.setattr(settings, "RECORDING_RETRY_INTERVAL", 0)
+    manager.write("cam-a", frame)
+    created[-1].join(5)
+    assert len(created) == 2
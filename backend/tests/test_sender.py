@@ -0,0 +1,77 @@
+"""
+查看端发送队列的关键帧丢帧策略
+"""
+from typing import List
+import asyncio
+
+from app.websocket.sender import ViewerSendQueue
+
+
+class FakeWebSocket:
+    """记录发送顺序的WebSocket替身"""
+
+    def __init__(self):
+        self.sent: List[object] = []
+
+    async def send_text(self, text: str):
+        self.sent.append(text)
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+
+def _drain(queue: ViewerSendQueue) -> List[object]:
+    """启动发送任务，发送完队列中的内容后返回发送顺序"""
+    async def scenario():
+        queue.start()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        queue.close()
+        return queue.websocket.sent
+
+    return asyncio.run(scenario())
+
+
+def test_keyframe_discards_stale_frames():
+    queue = ViewerSendQueue(FakeWebSocket(), "dev-1", max_frames=4)
+    queue.put_frame(b"k1", True)
+    queue.put_frame(b"d1", False)
+    queue.put_frame(b"d2", False)
+    # 新关键帧到达时排队中的帧已过期，保留新关键帧及其后续差分帧
+    queue.put_frame(b"k2", True)
+    queue.put_frame(b"d3", False)
+
+    assert queue.dropped_frames == 3
+    assert _drain(queue) == [b"k2", b"d3"]
+
+
+def test_full_queue_without_newer_keyframe_drops_until_next_keyframe():
+    queue = ViewerSendQueue(FakeWebSocket(), "dev-1", max_frames=3)
+    queue.put_frame(b"k1", True)
+    queue.put_frame(b"d1", False)
+    queue.put_frame(b"d2", False)
+    # 无法腾出空间：丢弃新到的差分帧，之后的差分帧也无法解码
+    queue.put_frame(b"d3", False)
+    queue.put_frame(b"d4", False)
+    assert queue.stats()["waiting_keyframe"] is True
+    assert queue.depth == 3
+
+    # 新关键帧到达：排队的过期帧全部丢弃，从关键帧恢复
+    queue.put_frame(b"k2", True)
+    queue.put_frame(b"d5", False)
+    stats = queue.stats()
+
+    assert stats["waiting_keyframe"] is False
+    assert stats["dropped_frames"] == 5
+    assert _drain(queue) == [b"k2", b"d5"]
+
+
+def test_control_messages_are_sent_first_and_never_dropped():
+    queue = ViewerSendQueue(FakeWebSocket(), "dev-1", max_frames=1)
+    queue.put_frame(b"k1", True)
+    for index in range(5):
+        queue.put_message(f"message-{index}")
+    queue.put_frame(b"d1", False)
+
+    assert _drain(queue) == [f"message-{index}" for index in range(5)] + [b"k1"]
+    assert queue.dropped_frames == 1